@@ -0,0 +1,217 @@
+# /search_instagram/benchmarks/bench_scan.py
+"""
+Benchmark offline da varredura (InstagramService.run_scan), sem rede nem
+credenciais, usado como métrica de regressão de desempenho.
+
+O Instagram é sintético e o Firestore, o GCS e o Secret Manager são
+substituídos no nível do cliente (ver benchmarks/fakes.py), de modo que a
+orquestração, o pacer, o writer em lote, a transferência de mídia e a
+exportação reais são exercitados. As contas de serviço recebem uma
+configuração de pacer sem pausas; a latência das requisições e a taxa de
+429 são controladas por --latency-ms e --throttle-rate.
+
+Mede:
+  * posts por segundo e tempo total da varredura;
+  * operações do Firestore (leituras, escritas e commits) por post;
+  * bytes de mídia transferidos, requisições ao Instagram e 429 recebidos;
+  * pico de memória (RSS) do processo.
+
+Uso (a partir do diretório do serviço):
+    python benchmarks/bench_scan.py
+    python benchmarks/bench_scan.py --profiles 50 --posts-per-profile 40 --shards 2 --latency-ms 20
+    python benchmarks/bench_scan.py --min-posts-per-sec 200 --max-firestore-ops-per-post 10
+    python benchmarks/bench_scan.py --trace --profile scan.collapsed
+
+Com os limites informados, o script termina com código 1 se algum deles for
+ultrapassado. Os limites de commits do Firestore por post e de operações
+reenviadas individualmente pelo writer em lote (lotes que falharam) têm
+valores padrão, pois indicam que as escritas em lote deixaram de funcionar. Com --trace, o relatório inclui o resumo dos spans
+(tracing.py, modo em memória); com --profile, as pilhas amostradas durante
+a varredura são gravadas no arquivo, no formato de pilhas colapsadas.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+import threading
+import tracing
+from profiler import SamplingProfiler
+from benchmarks.fakes import InMemoryFirestoreClient, LocalStorageClient, StaticSecretManagerClient, SyntheticInstagramBackend
+
+# Configuração de pacer das contas do benchmark: taxa fixa, sem esperas nem backoff.
+UNPACED = {"rate_per_minute": 1e9, "min_rate_per_minute": 1e9, "max_rate_per_minute": 1e9, "burst": 1e9, "backoff_base_seconds": 0}
+
+def seed_firestore(db: InMemoryFirestoreClient, backend: SyntheticInstagramBackend, accounts: int):
+    """
+    Cria as contas de serviço e os alvos monitorados da varredura.
+    """
+    epoch = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    for index in range(accounts):
+        db.collection('service_accounts').document(f"bench_{index}").set({
+            "username": f"bench_{index}",
+            "status": "active",
+            "secret_manager_path": f"projects/bench/secrets/bench_{index}/versions/latest",
+            "last_used_at": epoch,
+            "pacer": UNPACED
+        })
+    for username in backend.usernames:
+        db.collection('monitored_profiles').document(username).set({"is_active": True})
+    for hashtag in backend.hashtags:
+        db.collection('monitored_hashtags').document(hashtag).set({"is_active": True})
+
+def run_benchmark(args, storage_dir: str) -> dict:
+    # As configurações do serviço são lidas das variáveis de ambiente no __init__.
+    os.environ.update({
+        "SCAN_SHARDS": str(args.shards),
+        "MEDIA_TRANSFER_WORKERS": str(args.media_workers),
+        "EXPORT_ENABLED": "true" if args.export else "false",
+        "COMMENT_ENRICHMENT": args.comment_enrichment,
+        "PLANNER_ENABLED": "false",
+    })
+    from firestore_service import FirestoreService
+    from gcs_service import GCSService
+    from instagram_service import InstagramService
+    from secret_manager_service import SecretManagerService
+
+    backend = SyntheticInstagramBackend(
+        profiles=args.profiles,
+        posts_per_profile=args.posts_per_profile,
+        comments_per_post=args.comments_per_post,
+        stories_per_profile=args.stories_per_profile,
+        hashtags=args.hashtags,
+        hashtag_posts=args.hashtag_posts,
+        media_size_bytes=args.media_kb * 1024,
+        latency_ms=args.latency_ms,
+        throttle_rate=args.throttle_rate,
+        hashtag_overlap=args.hashtag_overlap,
+        seed=args.seed
+    )
+    db = InMemoryFirestoreClient(commit_latency_seconds=args.commit_latency_ms / 1000)
+    seed_firestore(db, backend, args.shards)
+    seed_stats = dict(db.stats)
+
+    service = InstagramService(
+        f"bench-{int(time.time())}",
+        firestore_service=FirestoreService(db=db),
+        storage_service=GCSService(storage_client=LocalStorageClient(storage_dir), bucket_name="bench"),
+        secret_manager_service=SecretManagerService(client=StaticSecretManagerClient(), project_id="bench"),
+        instagram_backend=backend
+    )
+    exporter = tracing.configure("memory") if args.trace else None
+    profiler_thread = None
+    if args.profile:
+        profiler = SamplingProfiler(interval_seconds=0.005)
+        profiler_thread = threading.Thread(target=lambda: profiler.run(args.profile_seconds), name="bench-profiler", daemon=True)
+        profiler_thread.start()
+    started_at = time.perf_counter()
+    service.run_scan()
+    wall_seconds = time.perf_counter() - started_at
+    if profiler_thread:
+        profiler_thread.join()
+        with open(args.profile, 'w') as profile_file:
+            profile_file.write(profiler.collapsed())
+
+    metrics = service.get_metrics()
+    posts = metrics.get('posts_processed', 0)
+    firestore_ops = {name: db.stats[name] - seed_stats[name] for name in db.stats}
+    return {
+        "python": sys.version.split()[0],
+        "interrupted": service.interrupted,
+        "posts": posts,
+        "comments": metrics.get('comments_collected', 0),
+        "stories": metrics.get('stories_collected', 0),
+        "posts_skipped_duplicate": metrics.get('posts_skipped_duplicate', 0),
+        "wall_seconds": round(wall_seconds, 3),
+        "posts_per_sec": round(posts / wall_seconds, 1) if wall_seconds else None,
+        "firestore": firestore_ops,
+        "firestore_ops_per_post": round(sum(firestore_ops.values()) / posts, 2) if posts else None,
+        "firestore_commits_per_post": round(firestore_ops['commits'] / posts, 3) if posts else None,
+        "firestore_write_fallbacks": metrics.get('firestore_write_fallbacks', 0),
+        "media_bytes": metrics.get('media_bytes_transferred', 0),
+        "instagram_requests": backend.requests,
+        "rate_limit_429": metrics.get('rate_limit_429', 0),
+        # No Linux, ru_maxrss é informado em KiB.
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "timings_seconds": {name: value for name, value in metrics.items() if name.endswith('_seconds')},
+        **({"spans": exporter.summary()} if exporter else {})
+    }
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark offline da varredura com Instagram e GCP simulados.")
+    parser.add_argument("--profiles", type=int, default=20)
+    parser.add_argument("--posts-per-profile", type=int, default=30)
+    parser.add_argument("--comments-per-post", type=int, default=5)
+    parser.add_argument("--stories-per-profile", type=int, default=2)
+    parser.add_argument("--hashtags", type=int, default=2)
+    parser.add_argument("--hashtag-posts", type=int, default=20)
+    parser.add_argument("--media-kb", type=int, default=64, help="Tamanho de cada mídia sintética.")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Latência simulada de cada requisição ao Instagram e à CDN.")
+    parser.add_argument("--commit-latency-ms", type=float, default=0.0, help="Latência simulada de cada commit no Firestore.")
+    parser.add_argument("--hashtag-overlap", type=float, default=0.0, help="Fração dos posts de hashtag que também são posts dos perfis.")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Probabilidade de uma requisição receber 429.")
+    parser.add_argument("--shards", type=int, default=1, help="Contas de serviço usadas em paralelo (SCAN_SHARDS).")
+    parser.add_argument("--media-workers", type=int, default=4, help="MEDIA_TRANSFER_WORKERS.")
+    parser.add_argument("--comment-enrichment", default="cached", choices=["none", "cached", "full"])
+    parser.add_argument("--no-export", dest="export", action="store_false", help="Desativa a exportação NDJSON.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--storage-dir", help="Diretório do GCS local (por padrão, um diretório temporário).")
+    parser.add_argument("--trace", action="store_true", help="Inclui no relatório o resumo dos spans da varredura.")
+    parser.add_argument("--profile", help="Grava as pilhas amostradas (formato colapsado) neste arquivo.")
+    parser.add_argument("--profile-seconds", type=float, default=10.0, help="Duração máxima da amostragem do --profile.")
+    parser.add_argument("--verbose", action="store_true", help="Mantém os logs do serviço (por padrão, apenas erros).")
+    parser.add_argument("--min-posts-per-sec", type=float, help="Limite mínimo de posts por segundo.")
+    parser.add_argument("--max-firestore-ops-per-post", type=float, help="Limite de operações do Firestore por post.")
+    parser.add_argument("--max-firestore-commits-per-post", type=float, default=0.1, help="Limite de commits do Firestore por post.")
+    parser.add_argument("--max-firestore-write-fallbacks", type=int, default=0, help="Limite de operações reenviadas individualmente após a falha de um lote.")
+    parser.add_argument("--max-peak-rss-mb", type=float, help="Limite do pico de memória do processo.")
+    return parser.parse_args(argv)
+
+def check_limits(args, report: dict) -> List[str]:
+    """
+    Limites de desempenho ultrapassados pelo relatório (lista vazia se nenhum).
+    """
+    failures = []
+    if args.min_posts_per_sec is not None and (report["posts_per_sec"] or 0) < args.min_posts_per_sec:
+        failures.append(f"{report['posts_per_sec']} posts/s (mínimo {args.min_posts_per_sec})")
+    if args.max_firestore_ops_per_post is not None and (report["firestore_ops_per_post"] or 0) > args.max_firestore_ops_per_post:
+        failures.append(f"{report['firestore_ops_per_post']} operações do Firestore por post (limite {args.max_firestore_ops_per_post})")
+    if (report["firestore_commits_per_post"] or 0) > args.max_firestore_commits_per_post:
+        failures.append(f"{report['firestore_commits_per_post']} commits do Firestore por post (limite {args.max_firestore_commits_per_post})")
+    if report["firestore_write_fallbacks"] > args.max_firestore_write_fallbacks:
+        failures.append(f"{report['firestore_write_fallbacks']} operações do Firestore reenviadas individualmente (limite {args.max_firestore_write_fallbacks})")
+    if args.max_peak_rss_mb is not None and report["peak_rss_mb"] > args.max_peak_rss_mb:
+        failures.append(f"pico de memória de {report['peak_rss_mb']} MB (limite {args.max_peak_rss_mb} MB)")
+    return failures
+
+def main():
+    args = parse_args()
+
+    import logging
+    if not args.verbose:
+        from logging_config import logging as service_logging
+        # Os logs vão para o stdout, junto com o relatório.
+        service_logging.getLogger().setLevel(logging.ERROR)
+
+    if args.storage_dir:
+        report = run_benchmark(args, args.storage_dir)
+    else:
+        with tempfile.TemporaryDirectory(prefix="bench-gcs-") as storage_dir:
+            report = run_benchmark(args, storage_dir)
+    print(json.dumps(report, indent=2))
+
+    failures = check_limits(args, report)
+    if failures:
+        print("Regressão de desempenho da varredura: " + "; ".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,753 @@
+# /search_instagram/benchmarks/fakes.py
+"""
+Backends falsos usados pelo benchmark offline da varredura (bench_scan.py).
+
+Cada classe imita apenas a parte da API usada pelo serviço:
+
+  * InMemoryFirestoreClient: cliente do Firestore em memória (documentos,
+    consultas simples, WriteBatch, get_all e transações compatíveis com
+    firestore.transactional), com contadores de leituras, escritas e commits;
+  * LocalStorageClient: buckets do GCS como diretórios locais;
+  * StaticSecretManagerClient: Secret Manager com uma sessão fixa;
+  * SyntheticInstagramBackend: Instagram sintético com a interface de
+    InstaloaderBackend, incluindo latência e 429 configuráveis.
+
+O Firestore, o GCS e o Secret Manager são falsos no nível do cliente, de
+modo que os serviços reais (FirestoreService, FirestoreBufferedWriter,
+GCSService, SecretManagerService) são exercitados pelo benchmark.
+"""
+from contextlib import contextmanager
+from datetime import datetime, timezone, timedelta
+from google.api_core.exceptions import NotFound, PreconditionFailed
+from google.cloud.firestore_v1.transforms import ArrayUnion, ArrayRemove, Increment, Sentinel
+from instaloader.exceptions import ConnectionException, TooManyRequestsException, ProfileNotExistsException
+from io import BytesIO
+from types import SimpleNamespace
+from typing import Optional, Dict, Any, List, Iterator
+import copy
+import json
+import os
+import pickle
+import random
+import threading
+import time
+import uuid
+import zlib
+import tracing
+
+# ---------------------------------------------------------------------------
+# Firestore
+# ---------------------------------------------------------------------------
+
+def _resolve_transforms(value, current=None):
+    """
+    Aplica os valores especiais do Firestore (ArrayUnion, ArrayRemove,
+    Increment) sobre o valor atual de um campo.
+    """
+    if isinstance(value, ArrayUnion):
+        result = list(current) if isinstance(current, list) else []
+        result.extend(item for item in value.values if item not in result)
+        return result
+    if isinstance(value, ArrayRemove):
+        return [item for item in (current if isinstance(current, list) else []) if item not in value.values]
+    if isinstance(value, Increment):
+        return (current if isinstance(current, (int, float)) else 0) + value.value
+    return copy.deepcopy(value)
+
+def _merge(target: Dict[str, Any], data: Dict[str, Any]):
+    """
+    Merge profundo de mapas, como em set(merge=True).
+    """
+    for key, value in data.items():
+        if isinstance(value, Sentinel):
+            # DELETE_FIELD (SERVER_TIMESTAMP não é usado pelo serviço).
+            target.pop(key, None)
+        elif isinstance(value, dict):
+            nested = target.get(key)
+            if not isinstance(nested, dict):
+                nested = target[key] = {}
+            _merge(nested, value)
+        else:
+            target[key] = _resolve_transforms(value, target.get(key))
+
+def _update(target: Dict[str, Any], data: Dict[str, Any]):
+    """
+    Aplica um update(): chaves com '.' são caminhos de campos aninhados e
+    mapas substituem o valor anterior.
+    """
+    for path, value in data.items():
+        *parents, key = path.split('.')
+        nested = target
+        for parent in parents:
+            if not isinstance(nested.get(parent), dict):
+                nested[parent] = {}
+            nested = nested[parent]
+        if isinstance(value, Sentinel):
+            nested.pop(key, None)
+        elif isinstance(value, dict):
+            nested[key] = {}
+            _merge(nested[key], value)
+        else:
+            nested[key] = _resolve_transforms(value, nested.get(key))
+
+class FakeSnapshot:
+    def __init__(self, reference: "FakeDocumentReference", data: Optional[Dict[str, Any]]):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return copy.deepcopy(self._data)
+
+class FakeDocumentReference:
+    def __init__(self, client: "InMemoryFirestoreClient", collection_path: str, doc_id: str):
+        self._client = client
+        self.collection_path = collection_path
+        self.id = doc_id
+        self.path = f"{collection_path}/{doc_id}"
+
+    def get(self, transaction=None) -> FakeSnapshot:
+        with self._client._lock:
+            self._client.stats['reads'] += 1
+            return FakeSnapshot(self, self._client._collection(self.collection_path).get(self.id))
+
+    def set(self, data: Dict[str, Any], merge: bool = False):
+        self._client._commit([('set', self, data, merge)])
+
+    def update(self, data: Dict[str, Any]):
+        self._client._commit([('update', self, data, False)])
+
+    def delete(self):
+        self._client._commit([('delete', self, None, False)])
+
+class FakeQuery:
+    OPERATORS = {
+        "==": lambda a, b: a == b,
+        "!=": lambda a, b: a != b,
+        "<": lambda a, b: a < b,
+        "<=": lambda a, b: a <= b,
+        ">": lambda a, b: a > b,
+        ">=": lambda a, b: a >= b,
+        "in": lambda a, b: a in b,
+        "array_contains": lambda a, b: isinstance(a, list) and b in a,
+    }
+
+    def __init__(self, client: "InMemoryFirestoreClient", collection_path: str, filters=(), orders=(), limit_count: Optional[int] = None, all_descendants: bool = False):
+        self._client = client
+        self.collection_path = collection_path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit_count
+        # Consulta de grupo de coleções: 'collection_path' é o id das sub-coleções.
+        self._all_descendants = all_descendants
+
+    def _copy(self, **changes) -> "FakeQuery":
+        params = dict(filters=self._filters, orders=self._orders, limit_count=self._limit, all_descendants=self._all_descendants)
+        params.update(changes)
+        return FakeQuery(self._client, self.collection_path, **params)
+
+    def where(self, filter=None) -> "FakeQuery":
+        return self._copy(filters=self._filters + (filter,))
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING") -> "FakeQuery":
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count: int) -> "FakeQuery":
+        return self._copy(limit_count=count)
+
+    def _collection_paths(self) -> List[str]:
+        if not self._all_descendants:
+            return [self.collection_path]
+        return [path for path in self._client._collections if path.rsplit('/', 1)[-1] == self.collection_path]
+
+    def select(self, field_paths) -> "FakeQuery":
+        # A projeção não altera o custo em memória; os documentos são retornados inteiros.
+        return self
+
+    def _matches(self, data: Dict[str, Any]) -> bool:
+        for field_filter in self._filters:
+            if field_filter.field_path not in data:
+                return False
+            try:
+                if not self.OPERATORS[field_filter.op_string](data[field_filter.field_path], field_filter.value):
+                    return False
+            except TypeError:
+                return False
+        return True
+
+    def stream(self, transaction=None) -> Iterator[FakeSnapshot]:
+        with self._client._lock:
+            results = [
+                (path, doc_id, data)
+                for path in self._collection_paths()
+                for doc_id, data in self._client._collection(path).items()
+                if self._matches(data)
+            ]
+            for field_path, direction in reversed(self._orders):
+                # Como no Firestore, documentos sem o campo ordenado são excluídos.
+                results = [result for result in results if result[2].get(field_path) is not None]
+                results.sort(key=lambda result: result[2][field_path], reverse=direction == "DESCENDING")
+            if self._limit is not None:
+                results = results[:self._limit]
+            self._client.stats['reads'] += max(1, len(results))
+            snapshots = [FakeSnapshot(FakeDocumentReference(self._client, path, doc_id), copy.deepcopy(data)) for path, doc_id, data in results]
+        return iter(snapshots)
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, client: "InMemoryFirestoreClient", collection_path: str):
+        super().__init__(client, collection_path)
+
+    def document(self, doc_id: Optional[str] = None) -> FakeDocumentReference:
+        return FakeDocumentReference(self._client, self.collection_path, doc_id or uuid.uuid4().hex)
+
+class FakeWriteBatch:
+    def __init__(self, client: "InMemoryFirestoreClient"):
+        self._client = client
+        self._operations: List[tuple] = []
+
+    def set(self, reference: FakeDocumentReference, data: Dict[str, Any], merge: bool = False):
+        self._operations.append(('set', reference, data, merge))
+
+    def update(self, reference: FakeDocumentReference, data: Dict[str, Any]):
+        self._operations.append(('update', reference, data, False))
+
+    def delete(self, reference: FakeDocumentReference):
+        self._operations.append(('delete', reference, None, False))
+
+    def commit(self):
+        operations, self._operations = self._operations, []
+        self._client._commit(operations)
+
+class FakeTransaction(FakeWriteBatch):
+    """
+    Transação compatível com firestore.transactional. Transações são
+    serializadas por um lock do cliente, mantido de _begin até o commit ou
+    rollback, e as escritas são aplicadas no commit.
+    """
+    def __init__(self, client: "InMemoryFirestoreClient"):
+        super().__init__(client)
+        self._read_only = False
+        self._max_attempts = 1
+        self._id = None
+
+    def _clean_up(self):
+        self._operations = []
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._client._transaction_lock.acquire()
+        self._id = uuid.uuid4().bytes
+
+    def _commit(self):
+        try:
+            self.commit()
+        finally:
+            self._release()
+
+    def _rollback(self):
+        self._operations = []
+        self._release()
+
+    def _release(self):
+        if self._id is not None:
+            self._id = None
+            self._client._transaction_lock.release()
+
+class InMemoryFirestoreClient:
+    """
+    Cliente do Firestore em memória, suficiente para o FirestoreService.
+
+    'stats' conta as operações como o Firestore as cobra: documentos lidos
+    (consultas vazias contam uma leitura), documentos escritos e commits
+    (cada escrita avulsa, lote ou transação é um commit, isto é, um round trip).
+    """
+    def __init__(self, commit_latency_seconds: float = 0.0):
+        self.commit_latency_seconds = commit_latency_seconds
+        self.stats = {"reads": 0, "writes": 0, "commits": 0}
+        self._collections: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._lock = threading.RLock()
+        self._transaction_lock = threading.RLock()
+
+    def _collection(self, collection_path: str) -> Dict[str, Dict[str, Any]]:
+        return self._collections.setdefault(collection_path, {})
+
+    def collection(self, collection_path: str) -> FakeCollectionReference:
+        return FakeCollectionReference(self, collection_path)
+
+    def collection_group(self, collection_id: str) -> FakeQuery:
+        return FakeQuery(self, collection_id, all_descendants=True)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    def transaction(self, **kwargs) -> FakeTransaction:
+        return FakeTransaction(self)
+
+    def get_all(self, references) -> Iterator[FakeSnapshot]:
+        return iter([reference.get() for reference in references])
+
+    def _commit(self, operations: List[tuple]):
+        if self.commit_latency_seconds:
+            time.sleep(self.commit_latency_seconds)
+        with self._lock:
+            # Como no Firestore, as escritas são aplicadas em ordem (um update
+            # pode seguir o set do mesmo documento) e o commit é atômico: se
+            # alguma falhar, os documentos alterados voltam ao estado anterior.
+            previous = {}
+            for _, reference, _, _ in operations:
+                key = (reference.collection_path, reference.id)
+                if key not in previous:
+                    previous[key] = copy.deepcopy(self._collection(reference.collection_path).get(reference.id))
+            try:
+                for op_type, reference, data, merge in operations:
+                    collection = self._collection(reference.collection_path)
+                    if op_type == 'delete':
+                        collection.pop(reference.id, None)
+                    elif op_type == 'update':
+                        if reference.id not in collection:
+                            raise NotFound(f"Documento inexistente: {reference.path}")
+                        _update(collection[reference.id], data)
+                    elif merge and reference.id in collection:
+                        _merge(collection[reference.id], data)
+                    else:
+                        collection[reference.id] = {}
+                        _merge(collection[reference.id], data)
+            except Exception:
+                for (collection_path, doc_id), data in previous.items():
+                    if data is None:
+                        self._collection(collection_path).pop(doc_id, None)
+                    else:
+                        self._collection(collection_path)[doc_id] = data
+                raise
+            self.stats['writes'] += len(operations)
+            self.stats['commits'] += 1
+
+    def document_count(self, collection_path: str) -> int:
+        with self._lock:
+            return len(self._collections.get(collection_path, {}))
+
+# ---------------------------------------------------------------------------
+# Cloud Storage
+# ---------------------------------------------------------------------------
+
+class LocalBlob:
+    """
+    Objeto de um LocalBucket. O conteúdo fica em '{raiz}/{bucket}/{nome}' e os
+    metadados (content_type, metadata, generation) em
+    '{raiz}/.meta/{bucket}/{nome}.json'. Como no GCS, cada gravação cria uma
+    nova geração, usada nas precondições 'if_generation_match'.
+    """
+    DEFAULT_CHUNK_SIZE = 1024 * 1024
+    # Torna atômicas a verificação da precondição e a gravação.
+    _generation_lock = threading.Lock()
+
+    def __init__(self, bucket: "LocalBucket", name: str, chunk_size: Optional[int] = None):
+        self.bucket = bucket
+        self.name = name
+        self.chunk_size = chunk_size
+        self.metadata: Optional[Dict[str, str]] = None
+        self.content_type: Optional[str] = None
+        self.size: Optional[int] = None
+        self.generation: Optional[int] = None
+
+    @property
+    def _data_path(self) -> str:
+        return os.path.join(self.bucket.data_dir, self.name)
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.bucket.meta_dir, self.name + '.json')
+
+    def exists(self) -> bool:
+        return os.path.exists(self._data_path)
+
+    def reload(self):
+        if not self.exists():
+            raise NotFound(f"Objeto inexistente: {self.name}")
+        self.size = os.path.getsize(self._data_path)
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path) as meta_file:
+                meta = json.load(meta_file)
+            self.content_type = meta.get('content_type')
+            self.metadata = meta.get('metadata')
+            self.generation = meta.get('generation')
+
+    def _current_generation(self) -> int:
+        if not self.exists():
+            return 0
+        if not os.path.exists(self._meta_path):
+            return 1
+        with open(self._meta_path) as meta_file:
+            return json.load(meta_file).get('generation') or 1
+
+    def _check_generation(self, if_generation_match: Optional[int]):
+        if if_generation_match is not None and self._current_generation() != if_generation_match:
+            raise PreconditionFailed(f"Geração de {self.name} diferente de {if_generation_match}.")
+
+    def upload_from_file(self, file_obj, size: Optional[int] = None, content_type: Optional[str] = None, rewind: bool = False,
+                         if_generation_match: Optional[int] = None):
+        if if_generation_match is not None:
+            with self._generation_lock:
+                self._check_generation(if_generation_match)
+                self._upload(file_obj, size, content_type, rewind)
+        else:
+            self._upload(file_obj, size, content_type, rewind)
+
+    def _upload(self, file_obj, size: Optional[int], content_type: Optional[str], rewind: bool):
+        if rewind:
+            file_obj.seek(0)
+        os.makedirs(os.path.dirname(self._data_path), exist_ok=True)
+        # Grava em um arquivo temporário e renomeia, como a finalização do upload resumível.
+        temp_path = f"{self._data_path}.{uuid.uuid4().hex}.part"
+        chunk_size = self.chunk_size or self.DEFAULT_CHUNK_SIZE
+        written = 0
+        try:
+            with open(temp_path, 'wb') as output:
+                while size is None or written < size:
+                    chunk = file_obj.read(chunk_size if size is None else min(chunk_size, size - written))
+                    if not chunk:
+                        break
+                    output.write(chunk)
+                    written += len(chunk)
+            os.replace(temp_path, self._data_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self.size = written
+        self.content_type = content_type
+        self.generation = time.time_ns()
+        self._write_meta()
+
+    def upload_from_string(self, data, content_type: Optional[str] = None, if_generation_match: Optional[int] = None):
+        self.upload_from_file(BytesIO(data.encode('utf-8') if isinstance(data, str) else data), content_type=content_type, if_generation_match=if_generation_match)
+
+    def _write_meta(self):
+        os.makedirs(os.path.dirname(self._meta_path), exist_ok=True)
+        with open(self._meta_path, 'w') as meta_file:
+            json.dump({"content_type": self.content_type, "metadata": self.metadata, "generation": self.generation}, meta_file)
+
+    def open(self, mode: str = 'rb', chunk_size: Optional[int] = None):
+        return open(self._data_path, mode)
+
+    def compose(self, sources: List["LocalBlob"]):
+        self.upload_from_file(BytesIO(b''.join(source.download_as_bytes() for source in sources)), content_type=self.content_type)
+
+    def delete(self):
+        for path in (self._data_path, self._meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def download_as_bytes(self, if_generation_match: Optional[int] = None) -> bytes:
+        if if_generation_match is not None:
+            with self._generation_lock:
+                self._check_generation(if_generation_match)
+                return self._read()
+        return self._read()
+
+    def _read(self) -> bytes:
+        with open(self._data_path, 'rb') as data_file:
+            return data_file.read()
+
+    def download_to_filename(self, filename: str):
+        if not self.exists():
+            raise NotFound(f"Objeto inexistente: {self.name}")
+        with open(self._data_path, 'rb') as source, open(filename, 'wb') as destination:
+            while True:
+                chunk = source.read(self.DEFAULT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                destination.write(chunk)
+
+class LocalBucket:
+    def __init__(self, root: str, name: str):
+        self.name = name
+        self.data_dir = os.path.join(root, name)
+        self.meta_dir = os.path.join(root, '.meta', name)
+
+    def blob(self, blob_name: str, chunk_size: Optional[int] = None) -> LocalBlob:
+        return LocalBlob(self, blob_name, chunk_size=chunk_size)
+
+    def get_blob(self, blob_name: str) -> Optional[LocalBlob]:
+        blob = LocalBlob(self, blob_name)
+        if not blob.exists():
+            return None
+        blob.reload()
+        return blob
+
+    def delete_blobs(self, blobs: List[LocalBlob], on_error=None):
+        for blob in blobs:
+            blob.delete()
+
+class LocalStorageClient:
+    """
+    Cliente do GCS que grava os buckets como diretórios em 'root'.
+    """
+    def __init__(self, root: str):
+        self.root = root
+
+    def bucket(self, bucket_name: str) -> LocalBucket:
+        return LocalBucket(self.root, bucket_name)
+
+    def list_blobs(self, bucket_name: str, prefix: str = '', delimiter: Optional[str] = None) -> List[LocalBlob]:
+        bucket = self.bucket(bucket_name)
+        directory = os.path.join(bucket.data_dir, prefix)
+        if not os.path.isdir(directory):
+            return []
+        return [bucket.blob(prefix + entry) for entry in sorted(os.listdir(directory)) if os.path.isfile(os.path.join(directory, entry))]
+
+# ---------------------------------------------------------------------------
+# Secret Manager
+# ---------------------------------------------------------------------------
+
+class StaticSecretManagerClient:
+    """
+    Secret Manager que retorna a mesma sessão (cookies serializados com
+    pickle, como no segredo real) para qualquer segredo. Aliases como
+    'versions/latest' são resolvidos para 'versions/1'.
+    """
+    def __init__(self, session_data: Optional[Dict[str, Any]] = None):
+        self.payload = pickle.dumps(session_data or {"sessionid": "synthetic", "csrftoken": "synthetic"})
+        self.accesses = 0
+
+    @staticmethod
+    def _version_name(secret_path: str) -> str:
+        return secret_path.rsplit('/versions/', 1)[0] + '/versions/1'
+
+    def access_secret_version(self, request: Dict[str, Any]):
+        self.accesses += 1
+        return SimpleNamespace(name=self._version_name(request['name']), payload=SimpleNamespace(data=self.payload))
+
+    def get_secret_version(self, request: Dict[str, Any]):
+        return SimpleNamespace(name=self._version_name(request['name']))
+
+# ---------------------------------------------------------------------------
+# Instagram
+# ---------------------------------------------------------------------------
+
+class SyntheticLoader:
+    """
+    Substituto do Instaloader de uma conta. Cada requisição simulada segue o
+    caminho do PacedRateController (token do pacer, latência, resposta) e os
+    429 são repetidos como no Instaloader antes de virarem ConnectionException.
+    """
+    MAX_ATTEMPTS = 3
+    STORIES_PER_REQUEST = 50
+
+    def __init__(self, backend: "SyntheticInstagramBackend", username: str, session_data: Dict[str, Any], pacer, metrics=None):
+        self.backend = backend
+        self.username = username
+        self.session_data = dict(session_data)
+        self.pacer = pacer
+        self.metrics = metrics
+        self.context = self
+        self._random = random.Random(f"{backend.seed}-{username}")
+
+    def request(self, query_type: str):
+        # Mesmo span do get_json instrumentado por InstaloaderBackend.create_loader.
+        with tracing.span("instagram.request", path=query_type, account=self.username):
+            self._request(query_type)
+
+    def _request(self, query_type: str):
+        for attempt in range(self.MAX_ATTEMPTS):
+            waited = self.pacer.acquire()
+            if self.metrics and waited:
+                self.metrics.add_time('pacer_wait', waited)
+            self.pacer.on_request()
+            self.backend._count_request()
+            if self.backend.latency_seconds:
+                time.sleep(self.backend.latency_seconds)
+            if self._random.random() >= self.backend.throttle_rate:
+                self.pacer.on_success()
+                return
+            if self.metrics:
+                self.metrics.increment('rate_limit_429')
+            if attempt < self.MAX_ATTEMPTS - 1:
+                self.pacer.on_throttle()
+        raise ConnectionException(f"{query_type}: 429 após {self.MAX_ATTEMPTS} tentativas.") from TooManyRequestsException("429 Too Many Requests")
+
+    def test_login(self) -> Optional[str]:
+        self.request('login')
+        return self.username
+
+    def save_session(self) -> Dict[str, Any]:
+        return dict(self.session_data)
+
+    def get_stories(self, userids: List[int]):
+        # Como no Instaloader, uma requisição para cada grupo de até 50 perfis.
+        for start in range(0, len(userids), self.STORIES_PER_REQUEST):
+            self.request('stories')
+            for userid in userids[start:start + self.STORIES_PER_REQUEST]:
+                yield SimpleNamespace(
+                    owner_id=userid,
+                    owner_username=self.backend.usernames[userid - 1],
+                    get_items=lambda userid=userid: iter(self.backend._stories(userid))
+                )
+
+class SyntheticOwner:
+    """
+    Autor de um comentário. Como no Instaloader, o acesso aos campos do
+    perfil completo dispara uma requisição na primeira vez.
+    """
+    def __init__(self, loader: SyntheticLoader, userid: int):
+        self._loader = loader
+        self.userid = userid
+        self.username = f"commenter_{userid}"
+        self._full = None
+
+    def _full_profile(self) -> Dict[str, Any]:
+        if self._full is None:
+            self._loader.request('profile')
+            self._full = {"followers": self.userid * 7 % 10000, "followees": self.userid * 3 % 1000, "biography": f"Bio {self.userid}", "is_private": self.userid % 5 == 0}
+        return self._full
+
+    followers = property(lambda self: self._full_profile()['followers'])
+    followees = property(lambda self: self._full_profile()['followees'])
+    biography = property(lambda self: self._full_profile()['biography'])
+    is_private = property(lambda self: self._full_profile()['is_private'])
+
+class SyntheticPost:
+    def __init__(self, loader: SyntheticLoader, owner_username: str, shortcode: str, index: int, date_utc: datetime):
+        backend = loader.backend
+        self._loader = loader
+        self.shortcode = shortcode
+        self.owner_username = owner_username
+        self.date_utc = date_utc
+        self.is_video = index % backend.video_every == 0 if backend.video_every else False
+        self.typename = 'GraphVideo' if self.is_video else 'GraphImage'
+        self.url = f"https://cdn.synthetic.invalid/{shortcode}.jpg"
+        self.video_url = f"https://cdn.synthetic.invalid/{shortcode}.mp4" if self.is_video else None
+        self.caption = f"Post {index} de {owner_username} #sintetico"
+        self.likes = (index * 37) % 5000
+        self.comments = backend.comments_per_post
+        self.is_pinned = False
+
+    def get_comments(self):
+        backend = self._loader.backend
+        for index in range(backend.comments_per_post):
+            if index % backend.COMMENTS_PAGE_SIZE == 0:
+                self._loader.request('comments')
+            userid = backend._commenter_id(self.shortcode, index)
+            yield SimpleNamespace(
+                id=f"{self.shortcode}{index:04d}",
+                text=f"Comentário {index}",
+                owner=SyntheticOwner(self._loader, userid),
+                likes_count=index % 10,
+                created_at_utc=self.date_utc + timedelta(minutes=index + 1)
+            )
+
+class SyntheticProfile:
+    def __init__(self, loader: SyntheticLoader, username: str, userid: int):
+        self._loader = loader
+        self.username = username
+        self.userid = userid
+
+    def get_posts(self):
+        return self._loader.backend._posts(self._loader, self.username, self.username, self._loader.backend.posts_per_profile)
+
+class SyntheticHashtag:
+    def __init__(self, loader: SyntheticLoader, name: str):
+        self._loader = loader
+        self.name = name
+
+    def get_posts(self):
+        return self._loader.backend._hashtag_posts(self._loader, self.name)
+
+class SyntheticInstagramBackend:
+    """
+    Instagram sintético e determinístico, com a interface de InstaloaderBackend.
+
+    Perfis 'perfil_0000'... e hashtags 'hashtag_000'... têm posts datados a
+    partir do momento da criação do backend, em páginas de 12 posts por
+    requisição, comentários em páginas de 50 e autores de comentários
+    sorteados entre 'commenters' usuários. 'latency_ms' é somada a cada
+    requisição e 'throttle_rate' é a probabilidade de uma resposta 429.
+    'hashtag_overlap' é a fração dos posts de hashtag que são posts dos
+    perfis, os mesmos em todas as hashtags (como posts em alta).
+    """
+    POSTS_PAGE_SIZE = 12
+    COMMENTS_PAGE_SIZE = 50
+
+    def __init__(self, profiles: int = 20, posts_per_profile: int = 30, comments_per_post: int = 5, stories_per_profile: int = 2,
+                 hashtags: int = 2, hashtag_posts: int = 20, commenters: int = 500, media_size_bytes: int = 64 * 1024,
+                 latency_ms: float = 0.0, throttle_rate: float = 0.0, video_every: int = 5, hashtag_overlap: float = 0.0, seed: int = 42):
+        self.usernames = [f"perfil_{index:04d}" for index in range(profiles)]
+        self.hashtags = [f"hashtag_{index:03d}" for index in range(hashtags)]
+        self.posts_per_profile = posts_per_profile
+        self.comments_per_post = comments_per_post
+        self.stories_per_profile = stories_per_profile
+        self.hashtag_posts = hashtag_posts
+        self.commenters = max(1, commenters)
+        self.latency_seconds = latency_ms / 1000
+        self.throttle_rate = throttle_rate
+        self.video_every = video_every
+        self.hashtag_overlap = hashtag_overlap
+        self.seed = seed
+        self.requests = 0
+        self.media_payload = random.Random(seed).randbytes(media_size_bytes)
+        # Datas UTC sem timezone, como as do Instaloader.
+        self._now = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+        self._lock = threading.Lock()
+
+    def _count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def _commenter_id(self, shortcode: str, index: int) -> int:
+        return 1000 + zlib.crc32(f"{self.seed}-{shortcode}-{index}".encode()) % self.commenters
+
+    def _posts(self, loader: SyntheticLoader, source: str, owner_username: str, count: int):
+        for index in range(count):
+            if index % self.POSTS_PAGE_SIZE == 0:
+                loader.request('posts')
+            yield SyntheticPost(loader, owner_username, f"{source}_{index:05d}", index, self._now - timedelta(hours=index * 6))
+
+    def _hashtag_posts(self, loader: SyntheticLoader, name: str):
+        overlap = self.hashtag_overlap
+        for index in range(self.hashtag_posts):
+            if index % self.POSTS_PAGE_SIZE == 0:
+                loader.request('posts')
+            source, owner_username = name, f"autor_{name}"
+            # Posts compartilhados têm o mesmo shortcode e data do post no perfil.
+            if self.usernames and index < self.posts_per_profile and int((index + 1) * overlap) > int(index * overlap):
+                source = owner_username = self.usernames[index % len(self.usernames)]
+            yield SyntheticPost(loader, owner_username, f"{source}_{index:05d}", index, self._now - timedelta(hours=index * 6))
+
+    def _stories(self, userid: int):
+        username = self.usernames[userid - 1]
+        for index in range(self.stories_per_profile):
+            yield SimpleNamespace(
+                mediaid=userid * 1000 + index,
+                date_utc=self._now - timedelta(hours=index),
+                is_video=False,
+                url=f"https://cdn.synthetic.invalid/stories/{username}_{index}.jpg",
+                video_url=None
+            )
+
+    def create_loader(self, username: str, session_data: Dict[str, Any], pacer, metrics=None) -> SyntheticLoader:
+        return SyntheticLoader(self, username, session_data, pacer, metrics)
+
+    def profile_from_username(self, loader: SyntheticLoader, username: str) -> SyntheticProfile:
+        if username.startswith("commenter_"):
+            # Autores de comentários: a requisição do perfil ocorre no primeiro acesso aos campos.
+            return SyntheticOwner(loader, int(username.rsplit('_', 1)[1]))
+        loader.request('profile')
+        if username not in self.usernames:
+            raise ProfileNotExistsException(f"Perfil {username} não existe.")
+        return SyntheticProfile(loader, username, self.usernames.index(username) + 1)
+
+    def hashtag_from_name(self, loader: SyntheticLoader, name: str) -> SyntheticHashtag:
+        loader.request('hashtag')
+        return SyntheticHashtag(loader, name)
+
+    def post_from_shortcode(self, loader: SyntheticLoader, shortcode: str) -> SyntheticPost:
+        loader.request('post')
+        source, index = shortcode.rsplit('_', 1)
+        owner_username = source if source in self.usernames else f"autor_{source}"
+        return SyntheticPost(loader, owner_username, shortcode, int(index), self._now - timedelta(hours=int(index) * 6))
+
+    @contextmanager
+    def open_media(self, media_url: str):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        yield BytesIO(self.media_payload), len(self.media_payload)
@@ -0,0 +1,130 @@
+# /search_instagram/benchmarks/import_time.py
+"""
+Benchmark de inicialização do serviço, usado como métrica de regressão do
+cold start no Cloud Run.
+
+Mede:
+  * o tempo de importação de 'main' (python -X importtime) e os módulos que
+    mais contribuem para ele;
+  * o tempo até a primeira resposta de '/' e '/health', do início do
+    processo do Uvicorn até a resposta HTTP.
+
+Uso (a partir do diretório do serviço):
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --runs 5 --max-import-ms 400 --max-first-response-ms 1500
+
+Com os limites informados, o script termina com código 1 se a mediana
+ultrapassar algum deles.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def measure_import(top: int):
+    """
+    Executa 'import main' em um processo novo com -X importtime e retorna o
+    tempo cumulativo de 'main' (ms) e os módulos de maior tempo cumulativo.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=SERVICE_DIR, capture_output=True, text=True, check=True
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        modules.append((name.strip(), int(cumulative) / 1000))
+    main_ms = next(ms for name, ms in modules if name == "main")
+    # Apenas módulos de primeiro nível, para não repetir os submódulos.
+    top_level = sorted(((name, ms) for name, ms in modules if "." not in name and name != "main"), key=lambda m: m[1], reverse=True)
+    return main_ms, top_level[:top]
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _wait_for(url: str, deadline: float) -> float:
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                response.read()
+                return time.monotonic()
+        except urllib.error.HTTPError:
+            # Qualquer resposta HTTP (ex: 503 sem credenciais) conta como resposta.
+            return time.monotonic()
+        except Exception:
+            time.sleep(0.005)
+    raise TimeoutError(f"Sem resposta de {url}.")
+
+def measure_first_response(timeout: float):
+    """
+    Inicia o Uvicorn em um processo novo e mede o tempo até as primeiras
+    respostas de '/' e '/health' (ms).
+    """
+    port = _free_port()
+    started_at = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=SERVICE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = started_at + timeout
+        root_at = _wait_for(f"http://127.0.0.1:{port}/", deadline)
+        health_at = _wait_for(f"http://127.0.0.1:{port}/health", deadline)
+        return (root_at - started_at) * 1000, (health_at - started_at) * 1000
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de importação e cold start do serviço.")
+    parser.add_argument("--runs", type=int, default=3, help="Repetições de cada medição (é reportada a mediana).")
+    parser.add_argument("--top", type=int, default=10, help="Quantidade de módulos mais lentos listados.")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Tempo máximo de espera pela primeira resposta, em segundos.")
+    parser.add_argument("--max-import-ms", type=float, help="Limite para a mediana do tempo de importação de 'main'.")
+    parser.add_argument("--max-first-response-ms", type=float, help="Limite para a mediana do tempo até a primeira resposta de '/health'.")
+    args = parser.parse_args()
+
+    import_times, root_times, health_times = [], [], []
+    slowest_modules = []
+    for _ in range(args.runs):
+        main_ms, slowest_modules = measure_import(args.top)
+        import_times.append(main_ms)
+        root_ms, health_ms = measure_first_response(args.timeout)
+        root_times.append(root_ms)
+        health_times.append(health_ms)
+
+    report = {
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "import_main_ms": round(statistics.median(import_times), 1),
+        "first_response_root_ms": round(statistics.median(root_times), 1),
+        "first_response_health_ms": round(statistics.median(health_times), 1),
+        "slowest_imports_ms": {name: round(ms, 1) for name, ms in slowest_modules}
+    }
+    print(json.dumps(report, indent=2))
+
+    failures = []
+    if args.max_import_ms is not None and report["import_main_ms"] > args.max_import_ms:
+        failures.append(f"importação de 'main' em {report['import_main_ms']} ms (limite {args.max_import_ms} ms)")
+    if args.max_first_response_ms is not None and report["first_response_health_ms"] > args.max_first_response_ms:
+        failures.append(f"primeira resposta de /health em {report['first_response_health_ms']} ms (limite {args.max_first_response_ms} ms)")
+    if failures:
+        print("Regressão de inicialização: " + "; ".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# /search_instagram/clients.py
+from logging_config import logging
+from typing import Any, Callable, Dict, TYPE_CHECKING
+import importlib
+import os
+import threading
+import time
+
+if TYPE_CHECKING:
+    import requests
+    from google.cloud import firestore, storage, secretmanager
+
+# Registro de clientes compartilhados pelo processo. Cada cliente é criado na
+# primeira utilização e reaproveitado pelos serviços, evitando repetir o
+# estabelecimento de canais gRPC/HTTP e a autenticação a cada instância de
+# FirestoreService, GCSService ou SecretManagerService.
+#
+# Os SDKs do Google e o requests são importados apenas ao criar o cliente,
+# para que o app responda a '/' e '/health' antes de carregá-los.
+_clients: Dict[str, Any] = {}
+_lock = threading.Lock()
+_warmup_state: Dict[str, Any] = {"status": "pending", "error": None, "seconds": None}
+_health_state: Dict[str, Any] = {"checked_at": None}
+_health_lock = threading.Lock()
+
+# Módulos da coleta carregados pelo aquecimento. instagram_service importa
+# este módulo, por isso é carregado por nome, e não no topo do arquivo.
+WARMUP_MODULES = ("instaloader", "instagram_service")
+
+def _get_or_create(name: str, factory: Callable[[], Any]) -> Any:
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = factory()
+                _clients[name] = client
+                logging.info(f"Cliente compartilhado '{name}' inicializado.")
+    return client
+
+def is_initialized(name: str) -> bool:
+    return name in _clients
+
+def _create_firestore_client() -> "firestore.Client":
+    from google.cloud import firestore
+    return firestore.Client()
+
+def _create_storage_client() -> "storage.Client":
+    from google.cloud import storage
+    return storage.Client()
+
+def _create_secret_manager_client() -> "secretmanager.SecretManagerServiceClient":
+    from google.cloud import secretmanager
+    return secretmanager.SecretManagerServiceClient()
+
+def _create_s3_client():
+    # boto3 é uma dependência opcional, necessária apenas com STORAGE_BACKEND=s3.
+    try:
+        import boto3
+    except ImportError as e:
+        raise ImportError("O pacote 'boto3' é necessário para STORAGE_BACKEND=s3.") from e
+    return boto3.client(
+        "s3",
+        endpoint_url=os.getenv("S3_ENDPOINT_URL") or None,
+        region_name=os.getenv("S3_REGION") or None
+    )
+
+def _create_cloud_tasks_client():
+    # google-cloud-tasks é uma dependência opcional, necessária apenas na
+    # varredura distribuída com TASK_QUEUE_BACKEND=cloud_tasks.
+    try:
+        from google.cloud import tasks_v2
+    except ImportError as e:
+        raise ImportError("O pacote 'google-cloud-tasks' é necessário para TASK_QUEUE_BACKEND=cloud_tasks.") from e
+    return tasks_v2.CloudTasksClient()
+
+def get_firestore_client() -> "firestore.Client":
+    return _get_or_create("firestore", _create_firestore_client)
+
+def get_storage_client() -> "storage.Client":
+    return _get_or_create("storage", _create_storage_client)
+
+def get_secret_manager_client() -> "secretmanager.SecretManagerServiceClient":
+    return _get_or_create("secret_manager", _create_secret_manager_client)
+
+def get_s3_client():
+    return _get_or_create("s3", _create_s3_client)
+
+def get_cloud_tasks_client():
+    return _get_or_create("cloud_tasks", _create_cloud_tasks_client)
+
+def _create_http_session() -> "requests.Session":
+    """
+    Sessão HTTP com pool de conexões keep-alive, usada nos downloads de mídia
+    da CDN do Instagram. O pool comporta as transferências concorrentes e
+    falhas transitórias de conexão ou 5xx são repetidas com backoff.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    pool_size = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))
+    retry = Retry(total=2, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504), allowed_methods=frozenset(["GET", "HEAD"]))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def get_http_session() -> "requests.Session":
+    return _get_or_create("http", _create_http_session)
+
+def warm_up():
+    """
+    Carrega os módulos da coleta e inicializa os clientes compartilhados.
+    Executada em segundo plano na inicialização do app, para que o primeiro
+    job não pague esse custo; falhas são registradas e os clientes voltam a
+    ser criados sob demanda.
+    """
+    started_at = time.perf_counter()
+    _warmup_state["status"] = "running"
+    try:
+        for module_name in WARMUP_MODULES:
+            importlib.import_module(module_name)
+        get_firestore_client()
+        storage_backend = os.getenv("STORAGE_BACKEND", "gcs").lower()
+        if storage_backend == "gcs":
+            get_storage_client()
+        elif storage_backend == "s3":
+            get_s3_client()
+        get_secret_manager_client()
+        if os.getenv("SCAN_DISPATCH_MODE", "local").lower() == "fanout" and os.getenv("TASK_QUEUE_BACKEND", "cloud_tasks").lower() == "cloud_tasks":
+            get_cloud_tasks_client()
+        get_http_session()
+        _warmup_state["status"] = "done"
+    except Exception as e:
+        logging.error(f"Falha no aquecimento dos clientes: {e}")
+        _warmup_state.update(status="failed", error=str(e))
+    finally:
+        _warmup_state["seconds"] = round(time.perf_counter() - started_at, 3)
+        logging.info(f"Aquecimento dos clientes finalizado em {_warmup_state['seconds']}s (status: {_warmup_state['status']}).")
+
+def check_firestore(timeout: float = 5.0, cache_seconds: float = 30.0):
+    """
+    Verificação leve da conexão com o Firestore, usada pelo /health: lê um
+    único documento ('job_locks/_health', que não precisa existir) com prazo
+    curto. Uma verificação bem-sucedida é reaproveitada por 'cache_seconds',
+    para que probes frequentes não gerem uma leitura cada.
+
+    Raises:
+        Exception: Se o cliente não puder ser criado ou a leitura falhar.
+    """
+    with _health_lock:
+        checked_at = _health_state["checked_at"]
+        if checked_at is not None and time.monotonic() - checked_at < cache_seconds:
+            return
+        get_firestore_client().collection("job_locks").document("_health").get(timeout=timeout)
+        _health_state["checked_at"] = time.monotonic()
+
+def start_warm_up() -> threading.Thread:
+    thread = threading.Thread(target=warm_up, name="client-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def warm_up_state() -> Dict[str, Any]:
+    return dict(_warmup_state)
@@ -0,0 +1,163 @@
+# /search_instagram/data_export.py
+from datetime import datetime, date, timezone
+from io import BytesIO
+from logging_config import logging
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List
+import gzip
+import json
+import threading
+import uuid
+
+class _ExportPart:
+    """
+    Arquivo NDJSON comprimido com gzip sendo montado em memória para uma
+    partição (tipo de registro, data e dono).
+    """
+    def __init__(self):
+        self.buffer = BytesIO()
+        self.gzip_file = gzip.GzipFile(fileobj=self.buffer, mode='wb')
+        self.rows = 0
+
+    def write(self, line: bytes):
+        self.gzip_file.write(line)
+        self.rows += 1
+
+    def finish(self) -> bytes:
+        self.gzip_file.close()
+        return self.buffer.getvalue()
+
+class RunExporter:
+    """
+    Exporta para o armazenamento (GCS, por padrão) os posts, comentários e stories gravados por uma
+    execução, em arquivos NDJSON + gzip particionados por data e dono:
+
+        exports/{tipo}/dt=AAAA-MM-DD/owner={username}/{run_id}-{sessão}-{parte}.ndjson.gz
+
+    As linhas são comprimidas em memória à medida que chegam e cada partição
+    é enviada ao atingir 'part_size_bytes' comprimidos ou ao fechar o
+    exportador. No máximo 'max_open_parts' partições ficam abertas ao mesmo
+    tempo: ao abrir uma nova além do limite, a usada há mais tempo é enviada
+    (LRU). Isso limita a memória de uma carga histórica, em que cada dia de
+    publicação de cada perfil é uma partição. O manifesto 'exports/manifests/{run_id}.json' lista os
+    arquivos da execução (inclusive os de execuções retomadas), de modo que os
+    consumidores leem sequencialmente apenas os arquivos novos, em vez de
+    fazer leituras pontuais no Firestore.
+
+    Na varredura distribuída, cada tarefa grava seu próprio manifesto em
+    'exports/manifests/{run_id}/{manifest_id}.json', pois várias instâncias
+    exportam a mesma execução ao mesmo tempo.
+    """
+    PREFIX = 'exports'
+
+    def __init__(self, storage_service, run_id: str, part_size_bytes: int = 32 * 1024 * 1024, manifest_id: Optional[str] = None, max_open_parts: int = 64):
+        self.storage_service = storage_service
+        self.run_id = run_id
+        self.manifest_id = manifest_id
+        self.part_size_bytes = part_size_bytes
+        self.max_open_parts = max(1, max_open_parts)
+        # Distingue os arquivos de cada retomada da mesma execução.
+        self.session_id = uuid.uuid4().hex[:8]
+        self.rows_exported = 0
+        self.bytes_exported = 0
+        self._parts: "OrderedDict[tuple, _ExportPart]" = OrderedDict()
+        self._part_counter = 0
+        self._files: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @staticmethod
+    def _json_default(value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        return str(value)
+
+    def add(self, record_type: str, doc_id: str, row: Dict[str, Any], partition_date: Optional[datetime], owner: Optional[str]):
+        """
+        Adiciona um registro à partição correspondente.
+
+        Args:
+            record_type: 'posts', 'comments' ou 'stories'.
+            partition_date: Data do registro (ex: data do post), usada na partição 'dt'.
+            owner: Username do perfil dono do conteúdo, usado na partição 'owner'.
+        """
+        dt = (partition_date or datetime.now(timezone.utc)).strftime('%Y-%m-%d')
+        key = (record_type, dt, owner or '_unknown')
+        line = json.dumps({"id": doc_id, **row}, default=self._json_default, ensure_ascii=False).encode('utf-8') + b'\n'
+        to_upload = []
+        with self._lock:
+            if self._closed:
+                return
+            part = self._parts.get(key)
+            if part is None:
+                while len(self._parts) >= self.max_open_parts:
+                    to_upload.append(self._parts.popitem(last=False))
+                part = self._parts[key] = _ExportPart()
+            else:
+                self._parts.move_to_end(key)
+            part.write(line)
+            if part.buffer.tell() >= self.part_size_bytes:
+                to_upload.append((key, self._parts.pop(key)))
+        for upload_key, upload_part in to_upload:
+            self._upload_part(upload_key, upload_part)
+
+    def _upload_part(self, key: tuple, part: _ExportPart):
+        record_type, dt, owner = key
+        data = part.finish()
+        with self._lock:
+            part_number = self._part_counter
+            self._part_counter += 1
+        blob_name = f"{self.PREFIX}/{record_type}/dt={dt}/owner={owner}/{self.run_id}-{self.session_id}-{part_number:05d}.ndjson.gz"
+        gcs_path = self.storage_service.upload_bytes(data, blob_name, content_type='application/gzip')
+        if not gcs_path:
+            logging.error(f"Falha ao exportar {part.rows} registros de '{record_type}' para {blob_name}.")
+            return
+        with self._lock:
+            self.rows_exported += part.rows
+            self.bytes_exported += len(data)
+            self._files.append({"path": gcs_path, "record_type": record_type, "dt": dt, "owner": owner, "rows": part.rows, "size_bytes": len(data)})
+
+    def close(self) -> Optional[str]:
+        """
+        Envia as partições pendentes e grava o manifesto da execução.
+
+        Returns:
+            O caminho do manifesto no GCS, ou None se nada foi exportado.
+        """
+        with self._lock:
+            if self._closed:
+                return None
+            self._closed = True
+            parts, self._parts = self._parts, OrderedDict()
+        for key, part in parts.items():
+            self._upload_part(key, part)
+        if not self._files:
+            return None
+        return self._write_manifest()
+
+    def _write_manifest(self) -> Optional[str]:
+        manifest_name = f"{self.PREFIX}/manifests/{self.run_id}.json"
+        if self.manifest_id:
+            manifest_name = f"{self.PREFIX}/manifests/{self.run_id}/{self.manifest_id}.json"
+        files = list(self._files)
+        # Execuções retomadas acrescentam seus arquivos ao manifesto existente.
+        existing = self.storage_service.download_bytes(manifest_name)
+        if existing:
+            try:
+                files = json.loads(existing).get('files', []) + files
+            except ValueError as e:
+                logging.warning(f"Manifesto existente de '{self.run_id}' ilegível, será sobrescrito: {e}")
+        totals: Dict[str, int] = {}
+        for file_info in files:
+            totals[file_info['record_type']] = totals.get(file_info['record_type'], 0) + file_info['rows']
+        manifest = {
+            "run_id": self.run_id,
+            "format": "ndjson.gz",
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+            "row_counts": totals,
+            "files": files
+        }
+        manifest_path = self.storage_service.upload_bytes(json.dumps(manifest, indent=2).encode('utf-8'), manifest_name, content_type='application/json')
+        if manifest_path:
+            logging.info(f"Exportação da execução '{self.run_id}': {self.rows_exported} registros em {len(self._files)} arquivos. Manifesto: {manifest_path}")
+        return manifest_path
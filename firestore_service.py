@@ -1,106 +1,653 @@
 # /search_instagram/firestore_service.py
+from google.api_core.exceptions import NotFound
 from google.cloud import firestore
 from google.cloud.firestore_v1.base_query import FieldFilter
 from logging_config import logging
-from datetime import datetime, timezone
-from typing import List, Dict, Any, Optional
-import uuid
+from clients import get_firestore_client
+from models.records import MonitoredTarget, RecordValidationError
+import tracing
+from datetime import datetime, timezone, timedelta
+from typing import List, Dict, Any, Optional, Iterable
+from contextlib import contextmanager
+import copy
+import os
+import re
+import threading
+import time
+
+class FirestoreBufferedWriter:
+    """
+    Acumula escritas do Firestore e as envia em lotes (WriteBatch), reduzindo
+    um round trip por documento para um round trip por lote.
+
+    O lote é enviado ao atingir 'max_batch_size' operações, periodicamente a
+    cada 'flush_interval_seconds' (por uma thread auxiliar) e ao fechar o
+    writer. As operações são enviadas na ordem em que foram enfileiradas. Um
+    update de um documento cujo set ainda está pendente é incorporado a esse
+    set, já que o documento pode ainda não existir no Firestore.
+
+    Depende apenas de db.batch(), db.collection().document() e dos métodos
+    set/update/commit, podendo ser usado com o emulador do Firestore ou com
+    um cliente falso em memória.
+    """
+    # Limite de operações por WriteBatch imposto pelo Firestore.
+    MAX_BATCH_SIZE = 500
+
+    def __init__(self, db, max_batch_size: int = MAX_BATCH_SIZE, flush_interval_seconds: float = 5.0, max_retries: int = 3):
+        self.db = db
+        self.max_batch_size = min(max_batch_size, self.MAX_BATCH_SIZE)
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_retries = max_retries
+        self.committed_ops = 0
+        self.failed_ops = 0
+        # Operações reenviadas individualmente após a falha do lote.
+        self.fallback_ops = 0
+        self.commit_seconds = 0.0
+        self._pending: List[tuple] = []
+        # (coleção, doc_id) -> índice em _pending do set que é a última operação pendente do documento.
+        self._pending_sets: Dict[tuple, int] = {}
+        self._pending_lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._flush_thread = None
+
+    def __enter__(self):
+        if self.flush_interval_seconds > 0:
+            self._flush_thread = threading.Thread(target=self._flush_periodically, name="firestore-flush", daemon=True)
+            self._flush_thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def set(self, collection_path: str, doc_id: str, data: Dict[str, Any], merge: bool = True):
+        """
+        Enfileira um set (por padrão com merge) de um documento.
+        """
+        self._enqueue(('set', collection_path, doc_id, data, merge))
+
+    def update(self, collection_path: str, doc_id: str, data: Dict[str, Any]):
+        """
+        Enfileira um update de um documento existente. Se o set do documento
+        ainda estiver pendente, os campos são incorporados a ele: no mesmo
+        lote, o update exigiria que o documento já existisse.
+        """
+        merge_data = self._as_merge_data(data)
+        with self._pending_lock:
+            index = self._pending_sets.get((collection_path, doc_id))
+            if index is not None and merge_data is not None:
+                op_type, _, _, pending_data, merge = self._pending[index]
+                folded = copy.deepcopy(pending_data)
+                self._fold(folded, merge_data)
+                self._pending[index] = (op_type, collection_path, doc_id, folded, merge)
+                return
+        self._enqueue(('update', collection_path, doc_id, data, False))
+
+    @staticmethod
+    def _as_merge_data(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Converte os campos de um update (chaves com '.' são caminhos de campos
+        aninhados) em mapas aninhados equivalentes em um set com merge. Retorna
+        None se houver mapas, que o update substitui e o merge mesclaria.
+        """
+        merge_data: Dict[str, Any] = {}
+        for path, value in data.items():
+            if isinstance(value, dict):
+                return None
+            *parents, key = path.split('.')
+            nested = merge_data
+            for parent in parents:
+                nested = nested.setdefault(parent, {})
+            nested[key] = value
+        return merge_data
+
+    @classmethod
+    def _fold(cls, target: Dict[str, Any], data: Dict[str, Any]):
+        for key, value in data.items():
+            if isinstance(value, dict) and isinstance(target.get(key), dict):
+                cls._fold(target[key], value)
+            else:
+                target[key] = value
+
+    def _enqueue(self, operation: tuple):
+        with self._pending_lock:
+            key = (operation[1], operation[2])
+            if operation[0] == 'set':
+                self._pending_sets[key] = len(self._pending)
+            else:
+                self._pending_sets.pop(key, None)
+            self._pending.append(operation)
+            should_flush = len(self._pending) >= self.max_batch_size
+        if should_flush:
+            self.flush()
+
+    def _flush_periodically(self):
+        while not self._stop_event.wait(self.flush_interval_seconds):
+            self.flush()
+
+    def flush(self):
+        """
+        Envia todas as operações pendentes em lotes de até 'max_batch_size'.
+        """
+        with self._commit_lock:
+            with self._pending_lock:
+                operations, self._pending = self._pending, []
+                self._pending_sets = {}
+            started_at = time.perf_counter()
+            for start in range(0, len(operations), self.max_batch_size):
+                self._commit_with_retry(operations[start:start + self.max_batch_size])
+            self.commit_seconds += time.perf_counter() - started_at
+
+    def close(self):
+        """
+        Interrompe o flush periódico e envia as operações restantes.
+        """
+        self._stop_event.set()
+        if self._flush_thread:
+            self._flush_thread.join()
+            self._flush_thread = None
+        self.flush()
+
+    def _apply(self, target, operation: tuple):
+        op_type, collection_path, doc_id, data, merge = operation
+        doc_ref = self.db.collection(collection_path).document(doc_id)
+        if op_type == 'update':
+            if target is None:
+                doc_ref.update(data)
+            else:
+                target.update(doc_ref, data)
+        else:
+            if target is None:
+                doc_ref.set(data, merge=merge)
+            else:
+                target.set(doc_ref, data, merge=merge)
+
+    def _commit_with_retry(self, operations: List[tuple]):
+        """
+        Envia um lote com backoff exponencial. Se o lote continuar falhando,
+        reenvia as operações individualmente para isolar as que falharam. Um
+        update de documento inexistente (NotFound) não é resolvido por novas
+        tentativas: o lote é reenviado individualmente de imediato.
+        """
+        if not operations:
+            return
+        for attempt in range(self.max_retries):
+            try:
+                batch = self.db.batch()
+                for operation in operations:
+                    self._apply(batch, operation)
+                with tracing.span("firestore.commit", operations=len(operations), attempt=attempt + 1):
+                    batch.commit()
+                self.committed_ops += len(operations)
+                logging.debug(f"Lote de {len(operations)} operações enviado ao Firestore.")
+                return
+            except NotFound as e:
+                logging.warning(f"Lote de {len(operations)} operações contém update de documento inexistente: {e}")
+                break
+            except Exception as e:
+                logging.warning(f"Falha ao enviar lote de {len(operations)} operações (tentativa {attempt + 1}/{self.max_retries}): {e}")
+                time.sleep(2 ** attempt)
+        else:
+            logging.error(f"Lote de {len(operations)} operações falhou após {self.max_retries} tentativas. Reenviando individualmente.")
+        self.fallback_ops += len(operations)
+        for operation in operations:
+            try:
+                self._apply(None, operation)
+                self.committed_ops += 1
+            except Exception as e:
+                self.failed_ops += 1
+                logging.error(f"Erro ao gravar '{operation[1]}/{operation[2]}' no Firestore: {e}")
 
 class FirestoreService:
     """
     Classe de serviço para interagir com o Google Firestore, expandida para
     suportar as operações do módulo Search_Instagram.
     """
-    def __init__(self):
+    def __init__(self, db=None):
         """
-        Inicializa o cliente do Firestore.
+        Obtém o cliente compartilhado do Firestore.
+
+        Args:
+            db: Cliente alternativo (ex: emulador ou cliente em memória dos
+                benchmarks). Por padrão, usa o cliente compartilhado.
         """
         try:
-            self.db = firestore.Client()
+            self.db = db if db is not None else get_firestore_client()
+            self.active_writer: Optional[FirestoreBufferedWriter] = None
             logging.info("Conexão com o Firestore estabelecida com sucesso.")
         except Exception as e:
             logging.error(f"Falha ao conectar com o Firestore: {e}")
             raise
 
-    def get_service_account_for_work(self) -> Optional[Dict[str, Any]]:
+    @contextmanager
+    def buffered_writes(self):
+        """
+        Context manager que direciona as escritas de dados coletados para um
+        FirestoreBufferedWriter enquanto estiver ativo. As operações pendentes
+        são enviadas ao sair do bloco, inclusive em caso de erro.
+        """
+        writer = FirestoreBufferedWriter(
+            self.db,
+            max_batch_size=int(os.getenv("FIRESTORE_BATCH_SIZE", str(FirestoreBufferedWriter.MAX_BATCH_SIZE))),
+            flush_interval_seconds=float(os.getenv("FIRESTORE_FLUSH_INTERVAL_SECONDS", "5"))
+        )
+        self.active_writer = writer
+        try:
+            with writer:
+                yield writer
+        finally:
+            self.active_writer = None
+            logging.info(f"Escritas em lote finalizadas: {writer.committed_ops} gravadas, {writer.failed_ops} com falha.")
+
+    def lease_service_accounts(self, run_id: str, count: int, lease_seconds: int) -> List[Dict[str, Any]]:
         """
-        Seleciona a conta de serviço 'active' com o uso mais antigo.
+        Reserva até 'count' contas de serviço 'active' para uma execução, das
+        usadas há mais tempo para as mais recentes.
+
+        A reserva é feita em uma transação que grava 'leased_by' e
+        'lease_expires_at' nas contas, de modo que execuções simultâneas nunca
+        recebem a mesma conta. Reservas expiradas (ex: execução interrompida)
+        podem ser retomadas por outra execução.
 
         Returns:
-            Um dicionário com os dados da conta ou None se nenhuma estiver disponível.
+            Lista com os dados das contas reservadas (pode ser vazia).
         """
-        try:
-            acc_ref = self.db.collection('service_accounts')
-            query = acc_ref.where(filter=FieldFilter("status", "==", "active")).order_by("last_used_at", direction=firestore.Query.ASCENDING).limit(1)
-            
-            accounts = []
-            for doc in query.stream():
+        acc_ref = self.db.collection('service_accounts')
+
+        @firestore.transactional
+        def lease_in_transaction(transaction):
+            now = datetime.now(timezone.utc)
+            query = acc_ref.where(filter=FieldFilter("status", "==", "active")).order_by("last_used_at", direction=firestore.Query.ASCENDING)
+            leased = []
+            for doc in query.stream(transaction=transaction):
                 account_data = doc.to_dict()
+                lease_expires_at = account_data.get('lease_expires_at')
+                if account_data.get('leased_by') not in (None, run_id) and lease_expires_at and lease_expires_at > now:
+                    continue
+                lease_data = {"leased_by": run_id, "lease_expires_at": now + timedelta(seconds=lease_seconds)}
+                transaction.update(doc.reference, lease_data)
+                account_data.update(lease_data)
                 account_data['doc_id'] = doc.id
-                accounts.append(account_data)
+                leased.append(account_data)
+                if len(leased) >= count:
+                    break
+            return leased
 
+        try:
+            accounts = lease_in_transaction(self.db.transaction())
             if not accounts:
-                logging.warning("Nenhuma conta de serviço ativa encontrada.")
-                return None
-            
-            account = accounts[0]
-            logging.info(f"Conta de serviço selecionada para trabalho: {account.get('username')}")
-            return account
+                logging.warning("Nenhuma conta de serviço ativa e livre encontrada.")
+            else:
+                logging.info(f"Contas de serviço reservadas para '{run_id}': {[a.get('username') for a in accounts]}")
+            return accounts
         except Exception as e:
-            logging.error(f"Erro ao buscar conta de serviço no Firestore: {e}")
-            return None
+            logging.error(f"Erro ao reservar contas de serviço no Firestore: {e}")
+            return []
 
-    def update_service_account_status(self, username: str, status: str, last_used_at: Optional[datetime] = None) -> bool:
+    def renew_service_account_lease(self, doc_id: str, run_id: str, lease_seconds: int) -> bool:
         """
-        Atualiza o status e a data de último uso de uma conta de serviço.
+        Estende a reserva de uma conta, se ela ainda pertencer à execução.
         """
-        try:
-            acc_ref = self.db.collection('service_accounts')
-            query = acc_ref.where(filter=FieldFilter("username", "==", username)).limit(1)
-            docs = list(query.stream())
+        doc_ref = self.db.collection('service_accounts').document(doc_id)
 
-            if not docs:
-                logging.error(f"Nenhuma conta de serviço encontrada com o username: {username}")
+        @firestore.transactional
+        def renew_in_transaction(transaction):
+            snapshot = doc_ref.get(transaction=transaction)
+            if not snapshot.exists or (snapshot.to_dict() or {}).get('leased_by') != run_id:
                 return False
+            transaction.update(doc_ref, {"lease_expires_at": datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)})
+            return True
 
-            doc_id = docs[0].id
-            update_data = {"status": status}
+        try:
+            renewed = renew_in_transaction(self.db.transaction())
+            if not renewed:
+                logging.warning(f"Reserva da conta '{doc_id}' não pertence mais à execução '{run_id}'.")
+            return renewed
+        except Exception as e:
+            logging.error(f"Erro ao renovar a reserva da conta '{doc_id}': {e}")
+            return False
+
+    def release_service_account(self, doc_id: str, run_id: str, status: str = 'active', last_used_at: Optional[datetime] = None) -> bool:
+        """
+        Libera a reserva de uma conta, atualizando seu status e data de último
+        uso. Não altera contas cuja reserva já pertence a outra execução.
+        """
+        doc_ref = self.db.collection('service_accounts').document(doc_id)
+
+        @firestore.transactional
+        def release_in_transaction(transaction):
+            snapshot = doc_ref.get(transaction=transaction)
+            if not snapshot.exists or (snapshot.to_dict() or {}).get('leased_by') != run_id:
+                return False
+            update_data = {"status": status, "leased_by": None, "lease_expires_at": None}
             if last_used_at:
                 update_data["last_used_at"] = last_used_at
-            
-            self.db.collection('service_accounts').document(doc_id).update(update_data)
-            logging.info(f"Status da conta {username} atualizado para '{status}'.")
+            transaction.update(doc_ref, update_data)
             return True
+
+        try:
+            released = release_in_transaction(self.db.transaction())
+            if released:
+                logging.info(f"Conta '{doc_id}' liberada com status '{status}'.")
+            return released
         except Exception as e:
-            logging.error(f"Erro ao atualizar status da conta {username}: {e}")
+            logging.error(f"Erro ao liberar a conta '{doc_id}': {e}")
             return False
 
-    def get_active_monitored_profiles(self) -> List[Dict[str, Any]]:
+    def acquire_job_lock(self, job_type: str, run_id: str, lease_seconds: int) -> Optional[tuple]:
+        """
+        Tenta obter o lock do tipo de job ('job_locks/{job_type}') para uma
+        execução. O lock é um lease: se a instância que o detém parar de
+        renová-lo, ele expira e pode ser obtido por outra execução. Um lock
+        não expirado nunca é obtido de novo, nem pela execução que o detém
+        (ex: retomada de uma execução ainda em andamento).
+
+        Returns:
+            Tupla (obtido, run_id que detém o lock após a tentativa), ou None
+            em caso de erro.
+        """
+        doc_ref = self.db.collection('job_locks').document(job_type)
+
+        @firestore.transactional
+        def acquire_in_transaction(transaction):
+            now = datetime.now(timezone.utc)
+            snapshot = doc_ref.get(transaction=transaction)
+            lock_data = (snapshot.to_dict() or {}) if snapshot.exists else {}
+            holder = lock_data.get('held_by')
+            lease_expires_at = lock_data.get('lease_expires_at')
+            if holder is not None and lease_expires_at and lease_expires_at > now:
+                return False, holder
+            transaction.set(doc_ref, {
+                "held_by": run_id,
+                "acquired_at": now,
+                "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                "cancel_requested": False
+            })
+            return True, run_id
+
+        try:
+            acquired, holder = acquire_in_transaction(self.db.transaction())
+            if acquired:
+                logging.info(f"Lock do job '{job_type}' obtido pela execução '{run_id}'.")
+            else:
+                logging.warning(f"Lock do job '{job_type}' já pertence à execução '{holder}'.")
+            return acquired, holder
+        except Exception as e:
+            logging.error(f"Erro ao obter o lock do job '{job_type}': {e}")
+            return None
+
+    def renew_job_lock(self, job_type: str, run_id: str, lease_seconds: int) -> Optional[Dict[str, Any]]:
+        """
+        Estende o lock de um tipo de job, se ele ainda pertencer à execução.
+
+        Returns:
+            Os dados do lock (incluindo 'cancel_requested'), ou None se o lock
+            foi perdido ou não pôde ser renovado.
+        """
+        doc_ref = self.db.collection('job_locks').document(job_type)
+
+        @firestore.transactional
+        def renew_in_transaction(transaction):
+            snapshot = doc_ref.get(transaction=transaction)
+            lock_data = (snapshot.to_dict() or {}) if snapshot.exists else {}
+            if lock_data.get('held_by') != run_id:
+                return None
+            lock_data["lease_expires_at"] = datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)
+            transaction.update(doc_ref, {"lease_expires_at": lock_data["lease_expires_at"]})
+            return lock_data
+
+        try:
+            lock_data = renew_in_transaction(self.db.transaction())
+            if lock_data is None:
+                logging.warning(f"Lock do job '{job_type}' não pertence mais à execução '{run_id}'.")
+            return lock_data
+        except Exception as e:
+            logging.error(f"Erro ao renovar o lock do job '{job_type}': {e}")
+            return None
+
+    def release_job_lock(self, job_type: str, run_id: str) -> bool:
+        """
+        Libera o lock de um tipo de job, se ele ainda pertencer à execução.
+        """
+        doc_ref = self.db.collection('job_locks').document(job_type)
+
+        @firestore.transactional
+        def release_in_transaction(transaction):
+            snapshot = doc_ref.get(transaction=transaction)
+            if not snapshot.exists or (snapshot.to_dict() or {}).get('held_by') != run_id:
+                return False
+            transaction.update(doc_ref, {"held_by": None, "lease_expires_at": None, "cancel_requested": False})
+            return True
+
+        try:
+            released = release_in_transaction(self.db.transaction())
+            if released:
+                logging.info(f"Lock do job '{job_type}' liberado pela execução '{run_id}'.")
+            return released
+        except Exception as e:
+            logging.error(f"Erro ao liberar o lock do job '{job_type}': {e}")
+            return False
+
+    def request_job_cancellation(self, run_id: str) -> bool:
+        """
+        Sinaliza o cancelamento de uma execução que detém um lock de job. A
+        instância que executa o job observa o sinal ao renovar o lock.
+
+        Returns:
+            True se a execução detinha um lock e o sinal foi gravado.
+        """
+        try:
+            query = self.db.collection('job_locks').where(filter=FieldFilter("held_by", "==", run_id)).limit(1)
+            for doc in query.stream():
+                doc.reference.update({"cancel_requested": True})
+                logging.info(f"Cancelamento solicitado para a execução '{run_id}' (job '{doc.id}').")
+                return True
+            return False
+        except Exception as e:
+            logging.error(f"Erro ao solicitar o cancelamento da execução '{run_id}': {e}")
+            return False
+
+    def get_system_log(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca o registro de uma execução em 'system_logs'.
+        """
+        try:
+            snapshot = self.db.collection('system_logs').document(run_id).get()
+            return snapshot.to_dict() if snapshot.exists else None
+        except Exception as e:
+            logging.error(f"Erro ao buscar o log da execução '{run_id}': {e}")
+            return None
+
+    def start_fanout_run(self, run_id: str, targets_total: int):
+        """
+        Registra em 'system_logs/{run_id}' (já criado com status 'started')
+        que a execução foi distribuída em 'targets_total' tarefas. Os
+        contadores 'fanout.*' e as métricas são agregados pelos workers em
+        record_scan_task_result.
+        """
+        try:
+            self.db.collection('system_logs').document(run_id).update({
+                "status": "running" if targets_total else "completed",
+                "message": f"{targets_total} alvos distribuídos em tarefas.",
+                "end_time": None if targets_total else datetime.now(timezone.utc),
+                "metrics": {},
+                "cancel_requested": False,
+                "fanout": {"targets_total": targets_total, "targets_completed": 0, "targets_failed": 0, "targets_cancelled": 0}
+            })
+        except Exception as e:
+            logging.error(f"Erro ao registrar a distribuição da execução '{run_id}': {e}")
+            raise
+
+    def record_scan_task_result(self, run_id: str, target_key: str, status: str, metrics: Optional[Dict[str, Any]] = None,
+                                post_shortcodes: Optional[List[str]] = None) -> Optional[str]:
+        """
+        Agrega o resultado de uma tarefa da varredura distribuída em
+        'system_logs/{run_id}': incrementa o contador 'fanout.targets_{status}'
+        e as métricas numéricas (Increment) e, ao concluir a última tarefa,
+        finaliza a execução. O resultado é marcado em
+        'system_logs/{run_id}/scan_tasks' na mesma transação, de modo que uma
+        tarefa entregue mais de uma vez é agregada uma única vez.
+
+        Args:
+            status: 'completed', 'failed' ou 'cancelled'.
+            post_shortcodes: Posts processados pela tarefa, gravados no índice
+                             de posts ao finalizar a execução.
+
+        Returns:
+            O status da execução após o registro ('running', ou o status final
+            se esta tarefa a finalizou); None se a tarefa já havia sido
+            registrada ou em caso de erro.
+        """
+        log_ref = self.db.collection('system_logs').document(run_id)
+        task_ref = self.db.collection(f'system_logs/{run_id}/scan_tasks').document(re.sub(r'[^A-Za-z0-9_-]', '_', target_key))
+        numeric_metrics = {
+            name: value for name, value in (metrics or {}).items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)
+        }
+
+        @firestore.transactional
+        def record_in_transaction(transaction):
+            if task_ref.get(transaction=transaction).exists:
+                return None
+            log_snapshot = log_ref.get(transaction=transaction)
+            fanout = ((log_snapshot.to_dict() or {}) if log_snapshot.exists else {}).get('fanout') or {}
+            counts = {name: fanout.get(f"targets_{name}", 0) for name in ('completed', 'failed', 'cancelled')}
+            counts[status] = counts.get(status, 0) + 1
+            now = datetime.now(timezone.utc)
+
+            updates: Dict[str, Any] = {f"fanout.targets_{status}": firestore.Increment(1)}
+            for name, value in numeric_metrics.items():
+                updates[f"metrics.{name}"] = firestore.Increment(value)
+            final_status = "running"
+            if sum(counts.values()) >= fanout.get('targets_total', 0):
+                if counts['cancelled']:
+                    final_status, message = "cancelled", "Varredura distribuída cancelada."
+                elif counts['failed']:
+                    final_status, message = "interrupted", f"Varredura distribuída concluída com {counts['failed']} alvos com falha."
+                else:
+                    final_status, message = "completed", "Varredura distribuída concluída com sucesso."
+                updates.update(status=final_status, message=message, end_time=now)
+            transaction.update(log_ref, updates)
+            transaction.set(task_ref, {
+                "target_key": target_key,
+                "status": status,
+                "metrics": numeric_metrics,
+                "post_shortcodes": post_shortcodes or [],
+                "finished_at": now
+            })
+            return final_status
+
+        try:
+            run_status = record_in_transaction(self.db.transaction())
+            if run_status is None:
+                logging.info(f"Resultado do alvo '{target_key}' já registrado na execução '{run_id}'.")
+            return run_status
+        except Exception as e:
+            logging.error(f"Erro ao registrar o resultado do alvo '{target_key}' na execução '{run_id}': {e}")
+            return None
+
+    def get_fanout_post_shortcodes(self, run_id: str) -> List[str]:
+        """
+        Posts processados por todas as tarefas de uma varredura distribuída,
+        registrados em 'system_logs/{run_id}/scan_tasks'.
+        """
+        shortcodes: List[str] = []
+        try:
+            for doc in self.db.collection(f'system_logs/{run_id}/scan_tasks').select(["post_shortcodes"]).stream():
+                shortcodes.extend((doc.to_dict() or {}).get('post_shortcodes') or [])
+        except Exception as e:
+            logging.error(f"Erro ao buscar os posts das tarefas da execução '{run_id}': {e}")
+        return shortcodes
+
+    def request_fanout_cancellation(self, run_id: str) -> bool:
+        """
+        Sinaliza o cancelamento de uma varredura distribuída em andamento. As
+        tarefas ainda não iniciadas são registradas como canceladas.
+
+        Returns:
+            True se a execução é distribuída, está em andamento e o sinal foi gravado.
+        """
+        log_entry = self.get_system_log(run_id)
+        if not log_entry or 'fanout' not in log_entry or log_entry.get('status') != 'running':
+            return False
+        try:
+            self.db.collection('system_logs').document(run_id).update({"cancel_requested": True})
+            logging.info(f"Cancelamento solicitado para a varredura distribuída '{run_id}'.")
+            return True
+        except Exception as e:
+            logging.error(f"Erro ao solicitar o cancelamento da execução '{run_id}': {e}")
+            return False
+
+    def get_unfinished_fanout_run(self, max_age_hours: float) -> Optional[str]:
+        """
+        Busca uma varredura distribuída ainda em andamento (status 'running'),
+        iniciada nas últimas 'max_age_hours' horas. Execuções mais antigas são
+        consideradas abandonadas (ex: tarefas descartadas pela fila) e não
+        impedem uma nova varredura.
+
+        Returns:
+            O run_id da execução em andamento, ou None.
+        """
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=max_age_hours)
+        query = (self.db.collection('system_logs')
+                 .where(filter=FieldFilter("job_type", "==", "daily_scan"))
+                 .where(filter=FieldFilter("status", "==", "running")))
+        # Falhas de leitura propagam: sem a consulta, não é seguro iniciar outra varredura.
+        for doc in query.stream():
+            log_entry = doc.to_dict() or {}
+            start_time = log_entry.get('start_time')
+            if 'fanout' in log_entry and start_time and start_time > cutoff:
+                return doc.id
+        return None
+
+    def get_active_monitored_profiles(self) -> List[MonitoredTarget]:
         """
         Busca todos os perfis monitorados que estão ativos.
         """
-        return self._get_active_items('monitored_profiles', 'instagram_username')
+        return self._get_active_items('profile')
 
-    def get_active_monitored_hashtags(self) -> List[Dict[str, Any]]:
+    def get_active_monitored_hashtags(self) -> List[MonitoredTarget]:
         """
         Busca todas as hashtags monitoradas que estão ativas.
         """
-        return self._get_active_items('monitored_hashtags', 'hashtag_sem_cerquilha')
+        return self._get_active_items('hashtag')
 
-    def _get_active_items(self, collection_name: str, id_field: str) -> List[Dict[str, Any]]:
+    def get_monitored_item(self, kind: str, doc_id: str) -> Optional[MonitoredTarget]:
         """
-        Função auxiliar para buscar itens ativos de uma coleção, garantindo que o
-        campo usado como ID do documento esteja presente nos dados retornados.
+        Busca um item monitorado ativo ('profile' ou 'hashtag') pelo ID do
+        documento.
+
+        Returns:
+            O alvo, ou None se ele não existir, estiver inativo ou for inválido.
         """
+        collection_name = MonitoredTarget.COLLECTIONS[kind][0]
+        try:
+            snapshot = self.db.collection(collection_name).document(doc_id).get()
+            item_data = snapshot.to_dict() if snapshot.exists else None
+            if not item_data or not item_data.get('is_active'):
+                return None
+            return MonitoredTarget.from_firestore(kind, snapshot.id, item_data)
+        except Exception as e:
+            logging.error(f"Erro ao buscar '{doc_id}' em '{collection_name}': {e}")
+            return None
+
+    def _get_active_items(self, kind: str) -> List[MonitoredTarget]:
+        """
+        Função auxiliar para buscar os itens ativos de um tipo de alvo. Os
+        documentos são validados aqui, uma única vez; itens com campos
+        inválidos são registrados e ignorados.
+        """
+        collection_name = MonitoredTarget.COLLECTIONS[kind][0]
         try:
             coll_ref = self.db.collection(collection_name)
             query = coll_ref.where(filter=FieldFilter("is_active", "==", True))
             items = []
             for doc in query.stream():
-                item_data = doc.to_dict()
-                # Garante que o campo que usamos como ID esteja no dicionário
-                item_data[id_field] = doc.id
-                items.append(item_data)
+                try:
+                    items.append(MonitoredTarget.from_firestore(kind, doc.id, doc.to_dict()))
+                except RecordValidationError as e:
+                    logging.error(f"Item '{doc.id}' de '{collection_name}' ignorado: {e}")
 
             logging.info(f"{len(items)} itens ativos encontrados em '{collection_name}'.")
             return items
@@ -108,13 +655,23 @@ class FirestoreService:
             logging.error(f"Erro ao buscar itens ativos de '{collection_name}': {e}")
             return []
 
-    def update_monitored_item_scan_time(self, collection_name: str, doc_id: str):
+    def update_monitored_item_scan_time(self, collection_name: str, doc_id: str, extra_fields: Optional[Dict[str, Any]] = None):
         """
         Atualiza o campo 'last_scanned_at' de um item monitorado.
+
+        Args:
+            extra_fields: Campos adicionais gravados na mesma operação, como a
+                          marca d'água do post mais recente coletado.
         """
         try:
-            doc_ref = self.db.collection(collection_name).document(doc_id)
-            doc_ref.update({"last_scanned_at": datetime.now(timezone.utc)})
+            update_data = {"last_scanned_at": datetime.now(timezone.utc)}
+            if extra_fields:
+                update_data.update(extra_fields)
+            if self.active_writer:
+                # Mantém a ordem em relação aos posts ainda pendentes no lote.
+                self.active_writer.update(collection_name, doc_id, update_data)
+            else:
+                self.db.collection(collection_name).document(doc_id).update(update_data)
             logging.info(f"Timestamp de varredura atualizado para '{doc_id}' em '{collection_name}'.")
         except Exception as e:
             logging.error(f"Erro ao atualizar timestamp de '{doc_id}' em '{collection_name}': {e}")
@@ -123,17 +680,240 @@ class FirestoreService:
     def save_instagram_data(self, collection_path: str, data: Dict[str, Any], doc_id: str):
         """
         Salva (cria ou sobrescreve) um documento em uma coleção/sub-coleção.
+        Payloads de models.records já trazem 'collected_at', calculado uma
+        vez por post ou lote de stories; os demais recebem o horário atual.
         """
+        # Com o writer em lote ativo, o span mede apenas o enfileiramento; o envio aparece em 'firestore.commit'.
+        with tracing.span("firestore.save", collection=collection_path.rsplit('/', 1)[-1], buffered=self.active_writer is not None):
+            try:
+                if 'collected_at' not in data:
+                    data['collected_at'] = datetime.now(timezone.utc)
+
+                if self.active_writer:
+                    self.active_writer.set(collection_path, doc_id, data)
+                    return
+                self.db.collection(collection_path).document(doc_id).set(data, merge=True)
+                logging.debug(f"Dados salvos com sucesso em '{collection_path}' com ID '{doc_id}'.")
+            except Exception as e:
+                logging.error(f"Erro ao salvar dados em '{collection_path}' com ID '{doc_id}': {e}")
+
+    def get_documents(self, collection_path: str, doc_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Busca vários documentos de uma coleção em uma única leitura em lote.
+
+        Returns:
+            Dicionário doc_id -> dados, apenas para os documentos existentes.
+        """
+        if not doc_ids:
+            return {}
         try:
-            if 'collected_at' not in data:
-                data['collected_at'] = datetime.now(timezone.utc)
-            
-            self.db.collection(collection_path).document(doc_id).set(data, merge=True)
-            logging.debug(f"Dados salvos com sucesso em '{collection_path}' com ID '{doc_id}'.")
+            coll_ref = self.db.collection(collection_path)
+            refs = [coll_ref.document(doc_id) for doc_id in doc_ids]
+            return {snapshot.id: snapshot.to_dict() for snapshot in self.db.get_all(refs) if snapshot.exists}
+        except Exception as e:
+            logging.error(f"Erro ao buscar documentos em lote de '{collection_path}': {e}")
+            return {}
+
+    def get_recent_post_shortcodes(self, days: int, limit: int) -> List[str]:
+        """
+        Busca os shortcodes dos posts publicados nos últimos 'days' dias, do
+        mais recente para o mais antigo. Apenas o campo 'post_date_utc' é lido.
+        """
+        try:
+            cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+            query = (self.db.collection('instagram_posts')
+                     .where(filter=FieldFilter("post_date_utc", ">=", cutoff))
+                     .order_by("post_date_utc", direction=firestore.Query.DESCENDING)
+                     .limit(limit)
+                     .select(["post_date_utc"]))
+            shortcodes = [doc.id for doc in query.stream()]
+            logging.info(f"{len(shortcodes)} posts publicados nos últimos {days} dias encontrados.")
+            return shortcodes
+        except Exception as e:
+            logging.error(f"Erro ao buscar posts recentes: {e}")
+            return []
+
+    def get_pending_enrichment_comments(self, limit: int) -> List[Dict[str, Any]]:
+        """
+        Busca os comentários com o enriquecimento do autor pendente
+        ('user_enrichment_status' == 'pending') em todas as sub-coleções
+        'instagram_comments'. Requer a indexação de campo único de
+        'user_enrichment_status' no escopo de grupo de coleções.
+
+        Returns:
+            Lista de dicts com 'collection_path', 'doc_id', 'user_id' e 'username'.
+        """
+        try:
+            query = (self.db.collection_group('instagram_comments')
+                     .where(filter=FieldFilter("user_enrichment_status", "==", "pending"))
+                     .limit(limit)
+                     .select(["user_id", "username"]))
+            comments = []
+            for doc in query.stream():
+                data = doc.to_dict()
+                comments.append({
+                    "collection_path": doc.reference.path.rsplit('/', 1)[0],
+                    "doc_id": doc.id,
+                    "user_id": data.get('user_id'),
+                    "username": data.get('username')
+                })
+            logging.info(f"{len(comments)} comentários com enriquecimento pendente encontrados.")
+            return comments
+        except Exception as e:
+            logging.error(f"Erro ao buscar comentários com enriquecimento pendente: {e}")
+            return []
+
+    def update_instagram_data(self, collection_path: str, data: Dict[str, Any], doc_id: str):
+        """
+        Atualiza parcialmente um documento existente, gravando apenas os campos
+        informados. Diferente de save_instagram_data, não altera o campo
+        'collected_at' e não cria o documento: se ele não existir (ex: removido
+        ou com a escrita inicial falha), a atualização falha, em vez de criar
+        um documento parcial.
+        """
+        try:
+            if self.active_writer:
+                self.active_writer.update(collection_path, doc_id, data)
+                return
+            self.db.collection(collection_path).document(doc_id).update(data)
+            logging.debug(f"Campos {list(data.keys())} atualizados em '{collection_path}' com ID '{doc_id}'.")
+        except NotFound:
+            logging.warning(f"Documento '{doc_id}' inexistente em '{collection_path}'; campos {list(data.keys())} não atualizados.")
+        except Exception as e:
+            logging.error(f"Erro ao atualizar dados em '{collection_path}' com ID '{doc_id}': {e}")
+
+    def append_post_hashtags(self, hashtags_by_shortcode: Dict[str, Iterable[str]]):
+        """
+        Acrescenta hashtags de origem ao campo 'collected_from_hashtags' dos
+        posts (ArrayUnion), sem reescrever os demais campos. Com o writer em
+        lote ativo, as operações seguem nos lotes da execução.
+        """
+        for shortcode, hashtags in hashtags_by_shortcode.items():
+            self.update_instagram_data('instagram_posts', {"collected_from_hashtags": firestore.ArrayUnion(sorted(hashtags))}, shortcode)
+
+    def get_scan_checkpoint(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca o checkpoint de uma execução de varredura.
+        """
+        try:
+            snapshot = self.db.collection('scan_checkpoints').document(run_id).get()
+            return snapshot.to_dict() if snapshot.exists else None
         except Exception as e:
-            logging.error(f"Erro ao salvar dados em '{collection_path}' com ID '{doc_id}': {e}")
+            logging.error(f"Erro ao buscar checkpoint da execução '{run_id}': {e}")
+            return None
 
-    def log_system_event(self, run_id: str, service: str, job_type: str, status: str, message: str, error_message: Optional[str] = None, metrics: Optional[Dict[str, int]] = None, end_time: Optional[datetime] = None):
+    def _write_scan_checkpoint(self, run_id: str, data: Dict[str, Any]):
+        data["updated_at"] = datetime.now(timezone.utc)
+        try:
+            if self.active_writer:
+                self.active_writer.set('scan_checkpoints', run_id, data)
+            else:
+                self.db.collection('scan_checkpoints').document(run_id).set(data, merge=True)
+        except Exception as e:
+            logging.error(f"Erro ao gravar checkpoint da execução '{run_id}': {e}")
+
+    def save_scan_checkpoint_progress(self, run_id: str, target_key: str, progress: Dict[str, Any]):
+        """
+        Grava a posição de iteração de um alvo em andamento.
+        """
+        self._write_scan_checkpoint(run_id, {"run_id": run_id, "status": "running", "in_progress": {target_key: progress}})
+
+    def complete_scan_checkpoint_target(self, run_id: str, target_key: str):
+        """
+        Marca um alvo como concluído e descarta sua posição de iteração.
+        """
+        self._write_scan_checkpoint(run_id, {
+            "run_id": run_id,
+            "completed_targets": firestore.ArrayUnion([target_key]),
+            "in_progress": {target_key: firestore.DELETE_FIELD}
+        })
+
+    def update_scan_checkpoint_status(self, run_id: str, status: str):
+        """
+        Atualiza o status do checkpoint ('running', 'interrupted', 'completed').
+        """
+        self._write_scan_checkpoint(run_id, {"run_id": run_id, "status": status})
+
+    def _scan_target_lease_ref(self, run_id: str, target_key: str):
+        return self.db.collection(f'scan_checkpoints/{run_id}/leases').document(re.sub(r'[^A-Za-z0-9_-]', '_', target_key))
+
+    def acquire_scan_target_lease(self, run_id: str, target_key: str, holder: str, lease_seconds: int) -> Optional[str]:
+        """
+        Tenta obter o lease exclusivo de um alvo da varredura distribuída
+        ('scan_checkpoints/{run_id}/leases/{alvo}'), de modo que duas entregas
+        da mesma tarefa não varram o alvo ao mesmo tempo. Como no lock de job,
+        um lease não renovado expira e pode ser obtido por outra entrega.
+
+        Returns:
+            O 'holder' que detém o lease após a tentativa (igual a 'holder' se
+            foi obtido), ou None em caso de erro.
+        """
+        doc_ref = self._scan_target_lease_ref(run_id, target_key)
+
+        @firestore.transactional
+        def acquire_in_transaction(transaction):
+            now = datetime.now(timezone.utc)
+            snapshot = doc_ref.get(transaction=transaction)
+            lease_data = (snapshot.to_dict() or {}) if snapshot.exists else {}
+            current = lease_data.get('held_by')
+            lease_expires_at = lease_data.get('lease_expires_at')
+            if current not in (None, holder) and lease_expires_at and lease_expires_at > now:
+                return current
+            transaction.set(doc_ref, {
+                "target_key": target_key,
+                "held_by": holder,
+                "acquired_at": now,
+                "lease_expires_at": now + timedelta(seconds=lease_seconds)
+            })
+            return holder
+
+        try:
+            return acquire_in_transaction(self.db.transaction())
+        except Exception as e:
+            logging.error(f"Erro ao obter o lease do alvo '{target_key}' na execução '{run_id}': {e}")
+            return None
+
+    def renew_scan_target_lease(self, run_id: str, target_key: str, holder: str, lease_seconds: int) -> bool:
+        """
+        Estende o lease de um alvo, se ele ainda pertencer a 'holder'.
+        """
+        doc_ref = self._scan_target_lease_ref(run_id, target_key)
+
+        @firestore.transactional
+        def renew_in_transaction(transaction):
+            snapshot = doc_ref.get(transaction=transaction)
+            if not snapshot.exists or (snapshot.to_dict() or {}).get('held_by') != holder:
+                return False
+            transaction.update(doc_ref, {"lease_expires_at": datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)})
+            return True
+
+        try:
+            return renew_in_transaction(self.db.transaction())
+        except Exception as e:
+            logging.error(f"Erro ao renovar o lease do alvo '{target_key}' na execução '{run_id}': {e}")
+            return False
+
+    def release_scan_target_lease(self, run_id: str, target_key: str, holder: str) -> bool:
+        """
+        Libera o lease de um alvo, se ele ainda pertencer a 'holder'.
+        """
+        doc_ref = self._scan_target_lease_ref(run_id, target_key)
+
+        @firestore.transactional
+        def release_in_transaction(transaction):
+            snapshot = doc_ref.get(transaction=transaction)
+            if not snapshot.exists or (snapshot.to_dict() or {}).get('held_by') != holder:
+                return False
+            transaction.update(doc_ref, {"held_by": None, "lease_expires_at": None})
+            return True
+
+        try:
+            return release_in_transaction(self.db.transaction())
+        except Exception as e:
+            logging.error(f"Erro ao liberar o lease do alvo '{target_key}' na execução '{run_id}': {e}")
+            return False
+
+    def log_system_event(self, run_id: str, service: str, job_type: str, status: str, message: str, error_message: Optional[str] = None, metrics: Optional[Dict[str, Any]] = None, end_time: Optional[datetime] = None):
         """
         Registra um evento no log do sistema.
         """
@@ -154,6 +934,15 @@ class FirestoreService:
                 }
                 log_ref.set(log_entry)
                 logging.info(f"Log de início de job registrado com run_id: {run_id}")
+            elif status == 'resumed':
+                log_ref.update({
+                    "status": status,
+                    "message": message,
+                    "resumed_at": datetime.now(timezone.utc),
+                    "end_time": None,
+                    "error_message": None
+                })
+                logging.info(f"Log de retomada de job registrado com run_id: {run_id}")
             else:
                 update_data = {
                     "status": status,
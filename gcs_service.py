@@ -1,67 +1,129 @@
 # /search_instagram/gcs_service.py
 import os
-from google.cloud import storage
+import uuid
+from google.api_core.exceptions import NotFound, PreconditionFailed
 from logging_config import logging
-from io import BytesIO
-from typing import Optional
+from clients import get_storage_client
+from storage_service import StorageService, _CountingReader, _RangeReader
+from typing import Optional, Dict, Any, BinaryIO, List, Set, Tuple
 
-class GCSService:
+class GCSService(StorageService):
     """
     Classe de serviço para interagir com o Google Cloud Storage (GCS).
+
+    Uploads paralelos usam upload composto: as partes são gravadas como
+    objetos temporários '{nome}.parts-{id}/' e combinadas com compose (até 32
+    objetos por chamada, em níveis se necessário), sendo removidas ao final.
     """
-    def __init__(self):
+    scheme = 'gs'
+    MAX_COMPOSE_SOURCES = 32
+
+    def __init__(self, storage_client=None, bucket_name: Optional[str] = None):
         """
-        Inicializa o cliente do GCS.
+        Obtém o cliente compartilhado do GCS.
+
+        Args:
+            storage_client: Cliente alternativo (ex: diretório local dos
+                            benchmarks). Por padrão, usa o cliente compartilhado.
+            bucket_name: Bucket de destino; por padrão, GCS_BUCKET_NAME.
         """
         try:
-            self.storage_client = storage.Client()
-            self.bucket_name = os.getenv("GCS_BUCKET_NAME")
+            self.storage_client = storage_client if storage_client is not None else get_storage_client()
+            super().__init__(bucket_name or os.getenv("GCS_BUCKET_NAME"))
             if not self.bucket_name:
                 raise ValueError("Variável de ambiente GCS_BUCKET_NAME não definida.")
             self.bucket = self.storage_client.bucket(self.bucket_name)
+            # Tamanho de cada parte do upload resumível; deve ser múltiplo de 256 KiB.
+            self.upload_chunk_size = int(os.getenv("GCS_UPLOAD_CHUNK_SIZE_MB", "8")) * 1024 * 1024
             logging.info(f"Conexão com o GCS no bucket '{self.bucket_name}' estabelecida.")
         except Exception as e:
             logging.error(f"Falha ao conectar com o GCS: {e}")
             raise
 
-    def upload_media_from_buffer(self, buffer: BytesIO, destination_blob_name: str) -> Optional[str]:
-        """
-        Faz o upload de um buffer de mídia em memória para o GCS.
+    def _put_stream(self, reader: _CountingReader, name: str, size: Optional[int], content_type: Optional[str], metadata: Optional[Dict[str, str]]):
+        # Upload resumível, uma parte de 'upload_chunk_size' bytes por vez: o
+        # pico de memória fica limitado ao tamanho da parte.
+        blob = self.bucket.blob(name, chunk_size=self.upload_chunk_size)
+        if metadata:
+            blob.metadata = dict(metadata)
+        blob.upload_from_file(reader, size=size, content_type=content_type)
 
-        Args:
-            buffer (BytesIO): O buffer em memória contendo os dados da mídia.
-            destination_blob_name (str): O nome do blob de destino no GCS.
+    def _put_bytes(self, data: bytes, name: str, content_type: Optional[str]):
+        self.bucket.blob(name).upload_from_string(data, content_type=content_type)
 
-        Returns:
-            str: O caminho GCS completo (gs://...) do arquivo ou None em caso de erro.
-        """
+    def _stat(self, name: str) -> Optional[Tuple[int, Dict[str, str]]]:
+        blob = self.bucket.get_blob(name)
+        return (blob.size, blob.metadata or {}) if blob is not None else None
+
+    def _get_versioned(self, name: str) -> Tuple[bytes, str]:
+        while True:
+            blob = self.bucket.get_blob(name)
+            if blob is None:
+                raise FileNotFoundError(self.uri(name))
+            # A leitura é fixada na geração consultada, para que conteúdo e
+            # versão correspondam; se o objeto foi regravado entre as duas
+            # chamadas, a consulta é refeita.
+            try:
+                return blob.download_as_bytes(if_generation_match=blob.generation), str(blob.generation)
+            except PreconditionFailed:
+                continue
+
+    def _put_bytes_if_version(self, data: bytes, name: str, content_type: Optional[str], version: Optional[str]) -> bool:
+        # if_generation_match=0 exige que o objeto ainda não exista.
         try:
-            blob = self.bucket.blob(destination_blob_name)
-            # O SDK infere o content_type a partir da extensão do nome do blob
-            blob.upload_from_file(buffer, rewind=True)
-            gcs_path = f"gs://{self.bucket_name}/{destination_blob_name}"
-            logging.info(f"Buffer enviado para {gcs_path} no GCS.")
-            return gcs_path
-        except Exception as e:
-            logging.error(f"Erro ao fazer upload do buffer para o GCS: {e}")
-            return None
+            self.bucket.blob(name).upload_from_string(data, content_type=content_type, if_generation_match=int(version) if version else 0)
+        except PreconditionFailed:
+            return False
+        return True
 
-    def download_media(self, source_blob_name: str, destination_file_name: str) -> bool:
-        """
-        Faz o download de um arquivo de mídia do GCS.
+    def _list_names(self, prefix: str) -> Set[str]:
+        return {blob.name for blob in self.storage_client.list_blobs(self.bucket_name, prefix=prefix, delimiter='/')}
 
-        Args:
-            source_blob_name (str): O nome do blob de origem no GCS.
-            destination_file_name (str): O caminho local para salvar o arquivo.
-        
-        Returns:
-            bool: True se o download for bem-sucedido, False caso contrário.
-        """
+    def _open_read(self, name: str, start: int, end: Optional[int]) -> BinaryIO:
+        blob = self.bucket.blob(name)
+        try:
+            blob.reload()
+        except NotFound:
+            raise FileNotFoundError(f"gs://{self.bucket_name}/{name}")
+        # BlobReader baixa o objeto em partes de 'upload_chunk_size' bytes via requisições com Range.
+        reader = blob.open('rb', chunk_size=self.upload_chunk_size)
+        if start:
+            reader.seek(start)
+        return _RangeReader(reader, end - start if end is not None else None)
+
+    def _start_multipart(self, name: str, content_type: Optional[str], metadata: Optional[Dict[str, str]]) -> Dict[str, Any]:
+        return {"name": name, "prefix": f"{name}.parts-{uuid.uuid4().hex[:8]}/", "content_type": content_type, "metadata": metadata}
+
+    def _upload_part(self, upload: Dict[str, Any], part_number: int, data: bytes) -> str:
+        part_name = f"{upload['prefix']}{part_number:05d}"
+        self.bucket.blob(part_name).upload_from_string(data)
+        return part_name
+
+    def _complete_multipart(self, upload: Dict[str, Any], parts: List[str]):
+        temporary = list(parts)
+        sources = [self.bucket.blob(part_name) for part_name in parts]
+        level = 0
+        while len(sources) > self.MAX_COMPOSE_SOURCES:
+            next_sources = []
+            for index in range(0, len(sources), self.MAX_COMPOSE_SOURCES):
+                intermediate = self.bucket.blob(f"{upload['prefix']}compose-{level}-{index // self.MAX_COMPOSE_SOURCES:05d}")
+                intermediate.compose(sources[index:index + self.MAX_COMPOSE_SOURCES])
+                temporary.append(intermediate.name)
+                next_sources.append(intermediate)
+            sources = next_sources
+            level += 1
+        destination = self.bucket.blob(upload['name'])
+        destination.content_type = upload['content_type']
+        if upload['metadata']:
+            destination.metadata = dict(upload['metadata'])
+        destination.compose(sources)
+        self._delete_quietly(temporary)
+
+    def _abort_multipart(self, upload: Dict[str, Any], parts: List[str]):
+        self._delete_quietly(parts)
+
+    def _delete_quietly(self, names: List[str]):
         try:
-            blob = self.bucket.blob(source_blob_name)
-            blob.download_to_filename(destination_file_name)
-            logging.info(f"Arquivo {source_blob_name} baixado para {destination_file_name}.")
-            return True
+            self.bucket.delete_blobs([self.bucket.blob(name) for name in names], on_error=lambda blob: None)
         except Exception as e:
-            logging.error(f"Erro ao fazer download do GCS: {e}")
-            return False
+            logging.warning(f"Não foi possível remover {len(names)} partes temporárias do GCS: {e}")
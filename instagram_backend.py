@@ -0,0 +1,63 @@
+# /search_instagram/instagram_backend.py
+from clients import get_http_session
+from contextlib import contextmanager
+from pacer import AdaptivePacer, PacedRateController
+from typing import Optional, Dict, Any, Iterator, Tuple, BinaryIO
+import instaloader
+import tracing
+
+class InstaloaderBackend:
+    """
+    Acesso ao Instagram usado pelo InstagramService: criação das instâncias
+    do Instaloader, construtores de Profile/Hashtag/Post e download de mídia.
+
+    Concentrar esses pontos permite executar a coleta com outro backend com a
+    mesma interface, como o Instagram sintético de benchmarks/fakes.py.
+    """
+    def create_loader(self, username: str, session_data: Dict[str, Any], pacer: AdaptivePacer, metrics=None) -> instaloader.Instaloader:
+        """
+        Cria um Instaloader com a cadência do pacer e carrega os cookies da
+        sessão direto no contexto.
+        """
+        loader = instaloader.Instaloader(rate_controller=lambda ctx: PacedRateController(ctx, pacer, metrics))
+        loader.load_session(username, session_data)
+        # As respostas alimentam o ajuste de taxa do pacer (sucesso/5xx).
+        loader.context._session.hooks['response'].append(pacer.observe_response)
+        # Todas as requisições do Instaloader (GraphQL, perfis, iteradores e
+        # as repetições do próprio contexto) passam por get_json.
+        get_json = loader.context.get_json
+
+        def traced_get_json(path, params, *args, **kwargs):
+            with tracing.span("instagram.request", path=path, account=username):
+                return get_json(path, params, *args, **kwargs)
+
+        loader.context.get_json = traced_get_json
+        return loader
+
+    def profile_from_username(self, loader: instaloader.Instaloader, username: str) -> instaloader.Profile:
+        return instaloader.Profile.from_username(loader.context, username)
+
+    def hashtag_from_name(self, loader: instaloader.Instaloader, name: str) -> instaloader.Hashtag:
+        return instaloader.Hashtag.from_name(loader.context, name)
+
+    def post_from_shortcode(self, loader: instaloader.Instaloader, shortcode: str) -> instaloader.Post:
+        return instaloader.Post.from_shortcode(loader.context, shortcode)
+
+    @contextmanager
+    def open_media(self, media_url: str) -> Iterator[Tuple[BinaryIO, Optional[int]]]:
+        """
+        Abre o download de uma mídia da CDN como stream.
+
+        Yields:
+            Tupla (stream de leitura, tamanho em bytes se conhecido). Com
+            'Content-Encoding' (gzip, deflate), o stream é decodificado e o
+            'Content-Length' se refere ao corpo comprimido, por isso o tamanho
+            não é informado.
+        """
+        with get_http_session().get(media_url, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            content_length = response.headers.get('Content-Length')
+            if response.headers.get('Content-Encoding', 'identity').lower() != 'identity':
+                content_length = None
+            yield response.raw, int(content_length) if content_length else None
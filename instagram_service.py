@@ -3,234 +3,1285 @@ import instaloader
 from instaloader.exceptions import LoginRequiredException, TooManyRequestsException, ProfileNotExistsException, PrivateProfileNotFollowedException
 from logging_config import logging
 from firestore_service import FirestoreService
-from gcs_service import GCSService
+from storage_service import StorageService, create_storage_service
 from secret_manager_service import SecretManagerService
+from instagram_backend import InstaloaderBackend
+from session_cache import get_session_cache
+from media_transfer import MediaTransferPool
+from media_dedup import MediaDedupCache
+from media_postprocess import MediaPostProcessor, pillow_available
+from scan_metrics import ScanMetrics
+from scan_checkpoint import ScanCheckpoint
+from task_queue import TaskQueue, task_name
+import tracing
+from pacer import AdaptivePacer
+from profile_cache import OwnerProfileCache
+from scan_planner import ScanPlanner
+from data_export import RunExporter
+from post_index import PostIndex
+from models.records import PostRecord, CommentRecord, StoryRecord, MonitoredTarget, RecordValidationError
 from datetime import datetime, timezone, timedelta
-from typing import Optional, Dict, Any
-import random
-import time
-import tempfile
+from typing import Optional, Dict, Any, Callable
 import os
 import itertools
 import requests
-from io import BytesIO
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
+
+class ScanCancelledError(Exception):
+    """
+    Lançada quando o cancelamento do job é solicitado durante a coleta.
+    """
+    pass
+
+class AccountSession:
+    """
+    Conta de serviço reservada para a execução e sua instância do Instaloader.
+    Cada shard da varredura usa uma sessão própria, com contexto e cadência
+    (AdaptivePacer) independentes.
+    """
+    def __init__(self, account: Dict[str, Any], loader: instaloader.Instaloader, pacer: AdaptivePacer):
+        self.account = account
+        self.loader = loader
+        self.pacer = pacer
+        self.username = account['username']
+        self.status = 'active'
+        self.posts_processed = 0
 
 class InstagramService:
     """
     Serviço de orquestração para a coleta de dados do Instagram.
     """
-    def __init__(self, run_id: str):
+    # Custo, em tokens do pacer, da pausa após cada etapa da coleta.
+    POST_PACE_COST = 1.0
+    STORY_PACE_COST = 0.5
+    TARGET_PACE_COST = 5.0
+
+    def __init__(self, run_id: str, resume: bool = False, cancel_event: Optional[threading.Event] = None,
+                 firestore_service: Optional[FirestoreService] = None,
+                 storage_service: Optional[StorageService] = None,
+                 secret_manager_service: Optional[SecretManagerService] = None,
+                 instagram_backend: Optional[InstaloaderBackend] = None):
+        """
+        Args:
+            run_id: Identificador da execução.
+            resume: Retoma a execução a partir do checkpoint gravado para 'run_id'.
+            cancel_event: Evento que, quando sinalizado, interrompe a execução no
+                          próximo post ou alvo, mantendo o checkpoint para retomada.
+            firestore_service, storage_service, secret_manager_service, instagram_backend:
+                Backends alternativos (ex: os falsos de benchmarks/fakes.py). Por
+                padrão, usa os serviços do GCP (ou o destino de
+                STORAGE_BACKEND) e o Instaloader.
+        """
         self.run_id = run_id
-        self.firestore_service = FirestoreService()
-        self.gcs_service = GCSService()
-        self.secret_manager_service = SecretManagerService()
-        self.instaloader_instance = None
-        self.service_account = None
-        self.temp_session_file = None
+        self.resume = resume
+        self.interrupted = False
+        self.cancel_event = cancel_event or threading.Event()
+        # Referência do planejador para a defasagem dos alvos varridos nesta execução.
+        self.run_started_at = datetime.now(timezone.utc)
+        self.metrics = ScanMetrics()
+        self.firestore_service = firestore_service or FirestoreService()
+        # Posts processados entre gravações da posição do iterador no checkpoint.
+        self.checkpoint = ScanCheckpoint(self.firestore_service, run_id, save_every_posts=int(os.getenv("CHECKPOINT_EVERY_POSTS", "10")))
+        self.storage_service = storage_service or create_storage_service()
+        self.secret_manager_service = secret_manager_service or SecretManagerService()
+        self.instagram_backend = instagram_backend or InstaloaderBackend()
+        # Cache de sessões compartilhado pelas execuções da instância.
+        self.session_cache = get_session_cache()
+        # Número de contas usadas em paralelo; os alvos são divididos entre elas.
+        self.scan_shards = max(1, int(os.getenv("SCAN_SHARDS", "1")))
+        self.account_lease_seconds = int(os.getenv("ACCOUNT_LEASE_MINUTES", "30")) * 60
+        # Bloqueios consecutivos tolerados por uma conta antes de encerrar sua shard.
+        self.max_consecutive_throttles = int(os.getenv("PACER_MAX_CONSECUTIVE_THROTTLES", "4"))
+        self.sessions: list = []
+        # 'incremental' interrompe a varredura ao alcançar posts já coletados;
+        # 'full' percorre todo o histórico (carga histórica).
+        self.scan_mode = os.getenv("SCAN_MODE", "incremental").lower()
+        # Janela (em dias) de posts antigos cujas curtidas/comentários são
+        # atualizados sem reprocessar mídia e comentários. 0 desativa.
+        self.refresh_window_days = int(os.getenv("REFRESH_WINDOW_DAYS", "0"))
+        # Transferências de mídia concorrentes (0 mantém a transferência síncrona).
+        self.media_transfer_workers = int(os.getenv("MEDIA_TRANSFER_WORKERS", "4"))
+        self.media_transfer_queue_size = int(os.getenv("MEDIA_TRANSFER_QUEUE_SIZE", "16"))
+        self.media_pool: Optional[MediaTransferPool] = None
+        # Calcula o SHA-256 das mídias durante o streaming para o GCS.
+        self.compute_media_hash = os.getenv("MEDIA_COMPUTE_HASH", "false").lower() == "true"
+        # Enriquecimento dos autores de comentários na varredura: 'none',
+        # 'cached' (padrão: sem requisições extras) ou 'full'. Os autores fora
+        # do cache ficam pendentes para o job /jobs/enrich-comments.
+        self.owner_profiles = OwnerProfileCache(
+            self.firestore_service,
+            policy=os.getenv("COMMENT_ENRICHMENT", "cached").lower(),
+            fetch_budget=int(os.getenv("COMMENT_ENRICHMENT_BUDGET", "500")),
+            max_entries=int(os.getenv("OWNER_PROFILE_CACHE_SIZE", "5000")),
+            ttl_seconds=int(os.getenv("OWNER_PROFILE_CACHE_TTL_HOURS", "168")) * 3600
+        )
+        # Seleção dos alvos por prioridade e defasagem, dentro do orçamento da execução.
+        self.planner = None
+        if os.getenv("PLANNER_ENABLED", "true").lower() == "true":
+            self.planner = ScanPlanner(
+                request_budget=int(os.getenv("PLANNER_REQUEST_BUDGET", "0")),
+                time_budget_minutes=int(os.getenv("PLANNER_TIME_BUDGET_MINUTES", "0")),
+                requests_per_minute=float(os.getenv("PACER_RATE_PER_MINUTE", "20")),
+                min_interval_hours=float(os.getenv("PLANNER_MIN_INTERVAL_HOURS", "4")),
+                max_interval_hours=float(os.getenv("PLANNER_MAX_INTERVAL_HOURS", "168")),
+                default_interval_hours=float(os.getenv("PLANNER_DEFAULT_INTERVAL_HOURS", "24")),
+                posts_per_scan=float(os.getenv("PLANNER_POSTS_PER_SCAN", "2"))
+            )
+        # Exportação dos registros da execução para o GCS (NDJSON + gzip).
+        self.export_enabled = os.getenv("EXPORT_ENABLED", "true").lower() == "true"
+        self.export_part_size_bytes = int(os.getenv("EXPORT_PART_SIZE_MB", "32")) * 1024 * 1024
+        # Partições abertas em memória ao mesmo tempo (~85 KB cada); as demais são enviadas.
+        self.export_max_open_parts = int(os.getenv("EXPORT_MAX_OPEN_PARTS", "64"))
+        self.exporter: Optional[RunExporter] = None
+        self.export_manifest_path: Optional[str] = None
+        # Na varredura distribuída, cada tarefa grava seu próprio manifesto.
+        self.export_manifest_id: Optional[str] = None
+        self.fanout_worker = False
+        # Lease exclusivo de cada alvo na varredura distribuída, renovado durante a varredura.
+        self.target_lease_seconds = int(os.getenv("SCAN_TASK_LEASE_MINUTES", "5")) * 60
+        # Polling de stories: prioridade mínima dos perfis e perfis por consulta get_stories.
+        self.story_poll_min_priority = float(os.getenv("STORY_POLL_MIN_PRIORITY", "0"))
+        self.story_poll_batch_size = max(1, int(os.getenv("STORY_POLL_BATCH_SIZE", "50")))
+        self._seen_story_ids: set = set()
+        self._seen_stories_lock = threading.Lock()
+        # Índice dos posts já processados, compartilhado por perfis, hashtags e
+        # shards; persistido no armazenamento entre execuções.
+        self.post_index = PostIndex(
+            self.firestore_service,
+            self.storage_service if os.getenv("POST_INDEX_PERSISTENT", "true").lower() == "true" else None,
+            capacity=int(os.getenv("POST_INDEX_CAPACITY", "1000000")),
+            false_positive_rate=float(os.getenv("POST_INDEX_FALSE_POSITIVE_RATE", "0.001"))
+        )
+        # Miniatura, hash perceptual e dimensões das mídias, em um pool de processos.
+        self.media_postprocess_enabled = os.getenv("MEDIA_POSTPROCESS_ENABLED", "false").lower() == "true"
+        if self.media_postprocess_enabled and not pillow_available():
+            logging.error("MEDIA_POSTPROCESS_ENABLED requer o pacote 'Pillow'. Pós-processamento de mídia desativado.")
+            self.media_postprocess_enabled = False
+        self.media_postprocessor: Optional[MediaPostProcessor] = None
+        self.media_dedup = None
+        if os.getenv("MEDIA_DEDUP_ENABLED", "true").lower() == "true":
+            self.media_dedup = MediaDedupCache(self.storage_service, max_entries=int(os.getenv("MEDIA_DEDUP_CACHE_SIZE", "10000")))
 
-    def _human_like_pause(self, min_seconds: int = 5, max_seconds: int = 15):
-        delay = random.uniform(min_seconds, max_seconds)
-        logging.info(f"Pausa estratégica de {delay:.2f} segundos.")
-        time.sleep(delay)
+    def _human_like_pause(self, session: AccountSession, cost: float):
+        """
+        Pausa entre etapas da coleta, consumindo 'cost' tokens do pacer da
+        conta. A duração acompanha a taxa atual do pacer em vez de um
+        intervalo fixo.
+        """
+        with self.metrics.timed('pause'), tracing.span("pacer.pause", account=session.username, cost=cost):
+            delay = session.pacer.acquire(cost)
+        if delay > 0:
+            logging.info(f"Pausa estratégica de {delay:.2f} segundos.")
 
-    def _setup_instaloader_session(self) -> bool:
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def _check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise ScanCancelledError(f"Execução '{self.run_id}' cancelada.")
+
+    @staticmethod
+    def _is_rate_limited(error: Exception) -> bool:
         """
-        Seleciona uma conta de serviço, baixa a sessão do Secret Manager,
-        e inicializa uma instância do Instaloader.
+        Indica se o erro decorre de um 429. Após esgotar as tentativas, o
+        Instaloader converte o TooManyRequestsException em ConnectionException.
         """
-        self.service_account = self.firestore_service.get_service_account_for_work()
-        if not self.service_account:
-            self.firestore_service.log_system_event(self.run_id, "Search_Instagram", "session_setup", "error", "Nenhuma conta de serviço ativa disponível.")
-            return False
+        while error is not None:
+            if isinstance(error, TooManyRequestsException):
+                return True
+            error = error.__cause__
+        return False
+
+    def _open_session(self, account: Dict[str, Any]) -> Optional[AccountSession]:
+        """
+        Obtém a sessão de uma conta de serviço (do cache em memória ou do
+        Secret Manager) e inicializa uma instância do Instaloader para ela,
+        carregando os cookies direto no contexto, sem arquivo temporário.
+        """
+        username = account['username']
+        secret_path = account['secret_manager_path']
 
-        username = self.service_account['username']
-        secret_path = self.service_account['secret_manager_path']
-        
         try:
-            session_content = self.secret_manager_service.get_secret_payload(secret_path)
-            if not session_content:
+            cached_session = self.session_cache.get(secret_path, self.secret_manager_service)
+            if not cached_session:
                 raise ValueError("Conteúdo da sessão do Secret Manager está vazio.")
 
-            with tempfile.NamedTemporaryFile(mode='wb', delete=False, prefix=f"{username}_") as tmp_file:
-                self.temp_session_file = tmp_file.name
-                tmp_file.write(session_content)
-
-            self.instaloader_instance = instaloader.Instaloader()
-            self.instaloader_instance.load_session_from_file(username, self.temp_session_file)
+            # As esperas do pacer são interrompidas quando o job é cancelado.
+            pacer = AdaptivePacer.from_config(account.get('pacer'), sleep_fn=self.cancel_event.wait)
+            loader = self.instagram_backend.create_loader(username, cached_session.session_data, pacer, self.metrics)
             logging.info(f"Sessão do Instaloader para '{username}' carregada com sucesso.")
             
-            self.instaloader_instance.test_login()
-            logging.info(f"Login para '{username}' testado e validado com sucesso.")
-            return True
+            if self.session_cache.needs_validation(cached_session):
+                with self.metrics.timed('instagram'):
+                    if loader.test_login() is None:
+                        raise LoginRequiredException("test_login não retornou um usuário autenticado.")
+                self.session_cache.mark_validated(cached_session)
+                logging.info(f"Login para '{username}' testado e validado com sucesso.")
+            else:
+                self.metrics.increment('session_validations_skipped')
+                logging.info(f"Sessão de '{username}' validada recentemente. Pulando test_login.")
+            return AccountSession(account, loader, pacer)
 
         except LoginRequiredException as e:
             logging.error(f"Sessão para a conta '{username}' é inválida. Marcando para renovação. Erro: {e}")
-            self.firestore_service.update_service_account_status(username, 'session_expired')
+            self.session_cache.invalidate(secret_path)
+            self.firestore_service.release_service_account(account['doc_id'], self.run_id, status='session_expired')
             self.firestore_service.log_system_event(self.run_id, "Search_Instagram", "session_validation", "error", f"Sessão para {username} é inválida.", str(e))
-            return False
+            return None
         except Exception as e:
             logging.error(f"Falha inesperada ao configurar a sessão para '{username}': {e}")
+            self.session_cache.invalidate(secret_path)
+            self.firestore_service.release_service_account(account['doc_id'], self.run_id, last_used_at=datetime.now(timezone.utc))
             self.firestore_service.log_system_event(self.run_id, "Search_Instagram", "session_setup", "error", f"Erro ao configurar sessão para {username}.", str(e))
-            return False
+            return None
+
+    def _open_sessions(self) -> list:
+        """
+        Reserva até 'scan_shards' contas de serviço e abre uma sessão para cada.
+        """
+        accounts = self.firestore_service.lease_service_accounts(self.run_id, self.scan_shards, self.account_lease_seconds)
+        if not accounts:
+            self.firestore_service.log_system_event(self.run_id, "Search_Instagram", "session_setup", "error", "Nenhuma conta de serviço ativa disponível.")
+            return []
+        sessions = [self._open_session(account) for account in accounts]
+        return [session for session in sessions if session is not None]
 
-    def _cleanup_temp_session_file(self):
-        if self.temp_session_file and os.path.exists(self.temp_session_file):
-            os.remove(self.temp_session_file)
-            logging.info(f"Arquivo de sessão temporário '{self.temp_session_file}' removido.")
-            self.temp_session_file = None
+    def _renew_leases_periodically(self, sessions: list, stop_event: threading.Event):
+        """
+        Renova as reservas das contas enquanto a varredura estiver em curso.
+        """
+        while not stop_event.wait(self.account_lease_seconds / 3):
+            for session in sessions:
+                self.firestore_service.renew_service_account_lease(session.account['doc_id'], self.run_id, self.account_lease_seconds)
 
-    def _download_and_upload_media(self, media_url: str, gcs_path: str) -> Optional[str]:
+    def _download_and_upload_media(self, media_url: str, gcs_path: str) -> Optional[Dict[str, Any]]:
         """
-        Baixa uma mídia da URL para a memória e faz o upload para o GCS.
+        Transfere uma mídia da URL para o armazenamento em streaming, sem
+        manter o arquivo inteiro em memória. Mídias já existentes são ignoradas.
+
+        Returns:
+            dict: 'gcs_path', 'size_bytes' e 'sha256', ou None em caso de erro.
         """
+        with self.metrics.timed('media_transfer'), tracing.span("media.transfer", gcs_path=gcs_path):
+            return self._transfer_media(media_url, gcs_path)
+
+    def _transfer_media(self, media_url: str, gcs_path: str) -> Optional[Dict[str, Any]]:
+        if self.media_dedup:
+            cached_result = self.media_dedup.lookup(gcs_path, media_url)
+            if cached_result:
+                return cached_result
         try:
-            response = requests.get(media_url, stream=True, timeout=60)
-            response.raise_for_status()
-            media_buffer = BytesIO(response.content)
-            
-            gcs_full_path = self.gcs_service.upload_media_from_buffer(media_buffer, gcs_path)
-            if gcs_full_path:
-                logging.info(f"Mídia enviada com sucesso para: {gcs_full_path}")
-            return gcs_full_path
+            with self.instagram_backend.open_media(media_url) as (stream, size):
+                upload_result = self.storage_service.upload_media_from_stream(
+                    stream,
+                    gcs_path,
+                    size=size,
+                    compute_hash=self.compute_media_hash,
+                    metadata=self.media_dedup.upload_metadata(media_url) if self.media_dedup else None
+                )
+            if upload_result:
+                logging.info(f"Mídia enviada com sucesso para: {upload_result['gcs_path']}")
+                self.metrics.increment('media_bytes_transferred', upload_result['size_bytes'])
+                if self.media_dedup:
+                    self.media_dedup.record(gcs_path, media_url, upload_result)
+            return upload_result
         except requests.RequestException as e:
             logging.error(f"Erro ao baixar mídia da URL {media_url}: {e}")
         except Exception as e:
             logging.error(f"Erro ao fazer upload da mídia para {gcs_path}: {e}")
         return None
 
-    def _process_post(self, post: instaloader.Post, from_hashtag: Optional[str] = None):
+    def _submit_media_transfer(self, media_url: str, gcs_path: str, collection_path: str, doc_id: str, is_video: bool = False, cover_url: Optional[str] = None):
+        """
+        Agenda a transferência da mídia no pool de workers e grava o
+        'gcs_media_path' no documento quando a transferência terminar. Sem
+        pool ativo, a transferência é feita de forma síncrona. Com o
+        pós-processamento ativo, a mídia transferida segue para ele.
+        """
+        def on_complete(upload_result: Optional[Dict[str, Any]]):
+            media_data = {"gcs_media_path": upload_result['gcs_path'] if upload_result else None}
+            if upload_result:
+                media_data["media_size_bytes"] = upload_result['size_bytes']
+                if upload_result.get('sha256'):
+                    media_data["media_sha256"] = upload_result['sha256']
+            self.firestore_service.update_instagram_data(collection_path, media_data, doc_id)
+            if upload_result and self.media_postprocessor:
+                self._submit_media_postprocess(gcs_path, upload_result['size_bytes'], is_video, cover_url, collection_path, doc_id)
+
+        if self.media_pool is None:
+            on_complete(self._download_and_upload_media(media_url, gcs_path))
+            return
+        self.media_pool.submit(media_url, gcs_path, on_complete)
+
+    def _submit_media_postprocess(self, gcs_path: str, size_bytes: int, is_video: bool, cover_url: Optional[str], collection_path: str, doc_id: str):
+        """
+        Agenda o pós-processamento de uma mídia transferida e grava os
+        atributos gerados (miniatura, dHash, dimensões, duração) no documento.
+        """
+        def on_complete(fields: Optional[Dict[str, Any]]):
+            if fields is None:
+                self.metrics.increment('media_postprocess_failed')
+                fields = {"media_postprocess_status": "failed"}
+            elif fields["media_postprocess_status"] == "done":
+                self.metrics.increment('media_postprocessed')
+            self.firestore_service.update_instagram_data(collection_path, fields, doc_id)
+
+        self.media_postprocessor.submit(gcs_path, size_bytes, is_video, cover_url, on_complete)
+
+    def _export(self, record_type: str, doc_id: str, row: Dict[str, Any], partition_date: Optional[datetime], owner: Optional[str]):
+        """
+        Encaminha um registro gravado no Firestore para a exportação da execução.
+        """
+        if self.exporter:
+            with self.metrics.timed('export'):
+                self.exporter.add(record_type, doc_id, row, partition_date, owner)
+
+    def _process_post(self, post: instaloader.Post, session: AccountSession, from_hashtag: Optional[str] = None):
         """
         Processa um único post, salva seus metadados, mídia e comentários enriquecidos.
+        O post e seus comentários compartilham o mesmo 'collected_at'.
         """
-        post_date_str = post.date_utc.strftime('%Y-%m')
-        file_extension = '.mp4' if post.is_video else '.jpg'
-        gcs_path = f"instagram/posts/{post.owner_username}/{post_date_str}/{post.shortcode}{file_extension}"
+        collected_at = datetime.now(timezone.utc)
+        try:
+            record = PostRecord.from_instaloader(post, collected_at, from_hashtag=from_hashtag)
+        except RecordValidationError as e:
+            logging.warning(f"Post '{post.shortcode}' ignorado: {e}")
+            self.metrics.increment('records_invalid')
+            return
 
-        media_url = post.video_url if post.is_video else post.url
-        gcs_media_path = self._download_and_upload_media(media_url, gcs_path)
+        gcs_path = record.media_path
+        self.firestore_service.save_instagram_data('instagram_posts', record.to_firestore(), record.shortcode)
+        if from_hashtag:
+            self.post_index.add_hashtag(record.shortcode, from_hashtag)
+        self._submit_media_transfer(record.media_url, gcs_path, 'instagram_posts', record.shortcode, record.is_video, record.cover_url)
+        self._export('posts', record.shortcode, record.to_export_row(self.storage_service.uri(gcs_path)), record.post_date_utc, record.owner_username)
+        
+        self.metrics.increment('posts_processed')
+        session.posts_processed += 1
 
-        post_data = {
-            "owner_username": post.owner_username,
-            "caption": post.caption,
-            "post_date_utc": post.date_utc,
+        # Processar comentários; o autor é enriquecido via cache de perfis
+        comments = list(self.metrics.timed_iter(itertools.islice(post.get_comments(), 100), 'instagram'))
+        with self.metrics.timed('firestore'):
+            self.owner_profiles.prefetch(str(comment.owner.userid) for comment in comments)
+        comments_path = f'instagram_posts/{record.shortcode}/instagram_comments'
+        for comment in comments:
+            try:
+                comment_record = CommentRecord.from_instaloader(comment, record.shortcode, collected_at, self._comment_owner_fields(comment.owner))
+            except RecordValidationError as e:
+                logging.warning(f"Comentário do post '{record.shortcode}' ignorado: {e}")
+                self.metrics.increment('records_invalid')
+                continue
+            self.firestore_service.save_instagram_data(comments_path, comment_record.to_firestore(), comment_record.comment_id)
+            self._export('comments', comment_record.comment_id, comment_record.to_export_row(), comment_record.comment_date_utc, record.owner_username)
+            self.metrics.increment('comments_collected')
+        
+        self._human_like_pause(session, self.POST_PACE_COST)
+
+    def _comment_owner_fields(self, owner: instaloader.Profile) -> Dict[str, Any]:
+        """
+        Campos de perfil do autor de um comentário. Usa o cache de perfis e,
+        na política 'full', busca o perfil no Instagram dentro do orçamento da
+        execução. Sem dados disponíveis, o comentário fica com o
+        enriquecimento pendente, preenchido depois por run_comment_enrichment.
+        """
+        user_id = str(owner.userid)
+        profile_data = self.owner_profiles.get(user_id)
+        if profile_data is None and self.owner_profiles.try_reserve_fetch():
+            try:
+                profile_data = self._cache_owner_profile(user_id, owner)
+            except Exception as e:
+                if self._is_rate_limited(e):
+                    raise
+                logging.warning(f"Não foi possível enriquecer o perfil do usuário '{owner.username}': {e}")
+        return self._owner_fields(profile_data)
+
+    def _cache_owner_profile(self, user_id: str, profile: instaloader.Profile) -> Dict[str, Any]:
+        # O acesso a 'followers' dispara uma única requisição com os demais campos.
+        with self.metrics.timed('instagram'):
+            profile_data = self.owner_profiles.put(user_id, {
+                "username": profile.username,
+                "followers": profile.followers,
+                "followees": profile.followees,
+                "biography": profile.biography,
+                "is_private": profile.is_private
+            })
+        self.metrics.increment('owner_profiles_fetched')
+        return profile_data
+
+    @staticmethod
+    def _owner_fields(profile_data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        if profile_data is None:
+            return {"user_enrichment_status": "pending"}
+        return {
+            "user_followers": profile_data.get('followers'),
+            "user_followees": profile_data.get('followees'),
+            "user_biography": profile_data.get('biography'),
+            "user_is_private": profile_data.get('is_private'),
+            "user_enrichment_status": "enriched"
+        }
+
+    def _refresh_post_engagement(self, post: instaloader.Post):
+        """
+        Atualiza apenas os contadores de engajamento de um post já coletado.
+        Na varredura, os dados vêm do próprio nó do iterador, sem requisições
+        adicionais.
+        """
+        engagement_data = {
             "likes_count": post.likes,
             "comments_count": post.comments,
-            "media_type": post.typename,
-            "gcs_media_path": gcs_media_path,
-            "collected_from_hashtag": from_hashtag,
-            "nlp_status": "pending"
+            "engagement_refreshed_at": datetime.now(timezone.utc)
         }
-        self.firestore_service.save_instagram_data('instagram_posts', post_data, post.shortcode)
-        
-        # Processar comentários com dados enriquecidos
-        comments_iterator = post.get_comments()
-        for comment in itertools.islice(comments_iterator, 100):
-            comment_data = {
-                "post_shortcode": post.shortcode,
-                "text": comment.text,
-                "username": comment.owner.username,
-                "user_followers": comment.owner.followers,
-                "user_followees": comment.owner.followees,
-                "user_biography": comment.owner.biography,
-                "user_is_private": comment.owner.is_private,
-                "likes_count": comment.likes_count,
-                "comment_date_utc": comment.created_at_utc,
-                "nlp_status": "pending"
-            }
-            self.firestore_service.save_instagram_data(f'instagram_posts/{post.shortcode}/instagram_comments', comment_data, str(comment.id))
-        
-        self._human_like_pause(8, 22)
+        self.firestore_service.update_instagram_data('instagram_posts', engagement_data, post.shortcode)
+        self.metrics.increment('posts_refreshed')
 
-    def _process_story(self, story: instaloader.StoryItem, owner_username: str):
+    @staticmethod
+    def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
         """
-        Processa um único story, salva seus metadados e mídia.
+        Normaliza datas para UTC com timezone. O Instaloader retorna datas UTC
+        "naive", enquanto o Firestore retorna datas com timezone.
         """
-        story_date_str = story.date_utc.strftime('%Y-%m')
-        file_extension = '.mp4' if story.is_video else '.jpg'
-        gcs_path = f"instagram/stories/{owner_username}/{story_date_str}/{story.mediaid}{file_extension}"
+        if value is None:
+            return None
+        if value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc)
+
+    def _scan_posts(self, posts, session: AccountSession, target: MonitoredTarget, from_hashtag: Optional[str] = None, stop_at_watermark: bool = True, checkpoint_key: Optional[str] = None, skip_posts: int = 0) -> Optional[Dict[str, Any]]:
+        """
+        Percorre um iterador de posts processando apenas o conteúdo novo.
+
+        No modo incremental, a marca d'água do alvo ('last_post_shortcode' e
+        'last_post_date_utc', com fallback para 'last_scanned_at') delimita o
+        que já foi coletado. Em perfis (stop_at_watermark=True) a iteração é
+        interrompida ao alcançá-la; em hashtags, cuja ordem não é estritamente
+        cronológica, os posts conhecidos são apenas ignorados. Posts conhecidos
+        dentro da janela de atualização têm somente o engajamento atualizado.
+
+        Com 'checkpoint_key', a posição do iterador (quando for um NodeIterator)
+        é registrada no checkpoint da execução, gravado periodicamente e na
+        interrupção. 'skip_posts' pula os primeiros posts da iteração, já
+        percorridos na página retomada do checkpoint.
+
+        Returns:
+            Os campos da nova marca d'água, ou None se nenhum post novo foi coletado.
+        """
+        incremental = self.scan_mode != "full"
+        watermark_shortcode = target.last_post_shortcode if incremental else None
+        watermark_date = (target.last_post_date_utc or target.last_scanned_at) if incremental else None
+        refresh_cutoff = None
+        if self.refresh_window_days > 0:
+            refresh_cutoff = datetime.now(timezone.utc) - timedelta(days=self.refresh_window_days)
+
+        node_iterator = posts if isinstance(posts, instaloader.NodeIterator) else None
+        # Ao retomar um alvo, parte da marca d'água já coletada antes da interrupção.
+        new_watermark = self.checkpoint.get_watermark(checkpoint_key) if checkpoint_key else None
+        newest_date = self._as_utc(new_watermark['last_post_date_utc']) if new_watermark else None
+
+        try:
+            for post in self.metrics.timed_iter(posts, 'instagram'):
+                self._check_cancelled()
+                if checkpoint_key:
+                    self.checkpoint.track_position(checkpoint_key, node_iterator)
+                if skip_posts:
+                    skip_posts -= 1
+                    continue
+                post_date = self._as_utc(post.date_utc)
+                is_known = post.shortcode == watermark_shortcode or (watermark_date is not None and post_date <= watermark_date)
 
-        media_url = story.video_url if story.is_video else story.url
-        gcs_media_path = self._download_and_upload_media(media_url, gcs_path)
+                if not is_known:
+                    # Posts já processados por outra fonte (nesta execução ou em uma
+                    # anterior) registram apenas a hashtag de origem, sem requisições.
+                    if self.post_index.claim(post.shortcode):
+                        try:
+                            self._process_post(post, session, from_hashtag=from_hashtag)
+                        except BaseException:
+                            self.post_index.release(post.shortcode)
+                            raise
+                    else:
+                        self.metrics.increment('posts_skipped_duplicate')
+                        if from_hashtag:
+                            self.post_index.add_hashtag(post.shortcode, from_hashtag)
+                    if newest_date is None or post_date > newest_date:
+                        newest_date = post_date
+                        new_watermark = self._watermark_fields(post)
+                    if checkpoint_key:
+                        self.checkpoint.save_progress(checkpoint_key, node_iterator, new_watermark)
+                    continue
 
-        story_data = {
-            "owner_username": owner_username,
-            "story_date_utc": story.date_utc,
-            "expires_at_utc": story.date_utc + timedelta(hours=24),
-            "media_type": "video" if story.is_video else "image",
-            "gcs_media_path": gcs_media_path,
+                # Posts fixados aparecem no topo do perfil independentemente da data.
+                is_pinned = getattr(post, 'is_pinned', False)
+                if refresh_cutoff is not None and post_date >= refresh_cutoff:
+                    self._refresh_post_engagement(post)
+                elif stop_at_watermark and not is_pinned:
+                    logging.info(f"Conteúdo já coletado alcançado no post '{post.shortcode}'. Interrompendo a iteração.")
+                    break
+        except BaseException:
+            # Grava a posição ainda pendente antes de propagar a interrupção.
+            if checkpoint_key:
+                self.checkpoint.flush_progress(checkpoint_key)
+            raise
+
+        return new_watermark
+
+    @staticmethod
+    def _watermark_fields(post: instaloader.Post) -> Dict[str, Any]:
+        """
+        Monta os campos de marca d'água a partir de um post coletado.
+        """
+        return {
+            "last_post_shortcode": post.shortcode,
+            "last_post_date_utc": InstagramService._as_utc(post.date_utc)
         }
-        self.firestore_service.save_instagram_data('instagram_stories', story_data, str(story.mediaid))
-        self._human_like_pause(3, 8)
 
-    def run_scan(self):
+    @staticmethod
+    def _story_media_path(story: instaloader.StoryItem, owner_username: str) -> str:
+        file_extension = '.mp4' if story.is_video else '.jpg'
+        return f"instagram/stories/{owner_username}/{story.date_utc.strftime('%Y-%m')}/{story.mediaid}{file_extension}"
+
+    def _process_story(self, story: instaloader.StoryItem, owner_username: str, session: AccountSession, collected_at: datetime):
         """
-        Ponto de entrada principal para executar a varredura de perfis e hashtags.
+        Processa um único story, salva seus metadados e mídia.
         """
-        if not self._setup_instaloader_session():
+        try:
+            record = StoryRecord.from_instaloader(story, owner_username, collected_at)
+        except RecordValidationError as e:
+            logging.warning(f"Story de '{owner_username}' ignorado: {e}")
+            self.metrics.increment('records_invalid')
             return
 
-        try:
-            # 1. Varredura de Perfis
-            profiles_to_scan = self.firestore_service.get_active_monitored_profiles()
-            for profile_info in profiles_to_scan:
-                username = profile_info.get('instagram_username')
-                if not username: continue
+        gcs_path = self._story_media_path(story, owner_username)
+        self.firestore_service.save_instagram_data('instagram_stories', record.to_firestore(), record.media_id)
+        self._submit_media_transfer(record.media_url, gcs_path, 'instagram_stories', record.media_id, record.is_video, record.cover_url)
+        self._export('stories', record.media_id, record.to_export_row(self.storage_service.uri(gcs_path)), record.story_date_utc, owner_username)
+        self.metrics.increment('stories_collected')
+        self._human_like_pause(session, self.STORY_PACE_COST)
+
+    def _process_new_stories(self, story_items: list, session: AccountSession):
+        """
+        Processa apenas os stories ainda não salvos. Os mediaids são
+        conferidos em uma leitura em lote no Firestore e em um índice da
+        execução, e a existência das mídias é verificada em lote.
+
+        Args:
+            story_items: Lista de tuplas (StoryItem, username do dono).
+        """
+        with self._seen_stories_lock:
+            story_items = [(item, owner) for item, owner in story_items if item.mediaid not in self._seen_story_ids]
+        if not story_items:
+            return
+        with self.metrics.timed('firestore'):
+            saved = self.firestore_service.get_documents('instagram_stories', [str(item.mediaid) for item, _ in story_items])
+        new_items = [(item, owner) for item, owner in story_items if str(item.mediaid) not in saved]
+        self.metrics.increment('stories_already_saved', len(story_items) - len(new_items))
+        with self._seen_stories_lock:
+            self._seen_story_ids.update(item.mediaid for item, _ in story_items)
+        if self.media_dedup and new_items:
+            self.media_dedup.prefetch(self._story_media_path(item, owner) for item, owner in new_items)
+        collected_at = datetime.now(timezone.utc)
+        for item, owner in new_items:
+            self._check_cancelled()
+            self._process_story(item, owner, session, collected_at)
+
+    def _scan_time_fields(self, session: AccountSession, target: MonitoredTarget, new_watermark: Optional[Dict[str, Any]], posts_before: int, requests_before: int) -> Optional[Dict[str, Any]]:
+        """
+        Campos gravados junto com 'last_scanned_at': a marca d'água e as
+        estatísticas usadas pelo planejador.
+        """
+        fields = dict(new_watermark or {})
+        if self.planner:
+            fields.update(ScanPlanner.updated_stats(
+                target,
+                new_posts=session.posts_processed - posts_before,
+                requests=session.pacer.stats()['requests'] - requests_before,
+                run_started_at=self.run_started_at
+            ))
+        return fields or None
+
+    def _scan_targets(self, session: AccountSession, profiles_to_scan: list, hashtags_to_scan: list):
+        """
+        Percorre os perfis e hashtags informados com a sessão de uma conta,
+        coletando posts, comentários e stories.
+        """
+        # 1. Varredura de Perfis
+        for profile_info in profiles_to_scan:
+            username = profile_info.name
+            self._check_cancelled()
+            target_key = ScanCheckpoint.target_key('profile', username)
+            if self.checkpoint.is_completed(target_key):
+                logging.info(f"Perfil '{username}' já concluído nesta execução. Pulando.")
+                continue
+            
+            logging.info(f"Iniciando varredura do perfil: {username}")
+            posts_before, requests_before = session.posts_processed, session.pacer.stats()['requests']
+            try:
+                with self.metrics.timed('instagram'):
+                    profile = self.instagram_backend.profile_from_username(session.loader, username)
                 
-                logging.info(f"Iniciando varredura do perfil: {username}")
-                try:
-                    profile = instaloader.Profile.from_username(self.instaloader_instance.context, username)
-                    
-                    logging.info(f"Coletando posts para o perfil: {username}")
-                    for post in profile.get_posts():
-                        self._process_post(post)
-                    
-                    logging.info(f"Coletando stories para o perfil: {username}")
-                    for story in self.instaloader_instance.get_stories(userids=[profile.userid]):
-                        for item in story.get_items():
-                            self._process_story(item, profile.username)
-
-                    self.firestore_service.update_monitored_item_scan_time('monitored_profiles', username)
-                    self._human_like_pause(180, 300)
-
-                except ProfileNotExistsException:
-                    logging.warning(f"Perfil '{username}' não encontrado. Considerar desativar.")
-                except PrivateProfileNotFollowedException:
-                    logging.warning(f"Perfil '{username}' é privado e não é seguido. Pulando.")
-                except Exception as e:
-                    logging.error(f"Erro ao processar o perfil '{username}': {e}", exc_info=True)
+                logging.info(f"Coletando posts para o perfil: {username}")
+                posts = profile.get_posts()
+                skip_posts = self.checkpoint.resume_iterator(target_key, posts)
+                new_watermark = self._scan_posts(posts, session, profile_info, checkpoint_key=target_key, skip_posts=skip_posts)
+                
+                logging.info(f"Coletando stories para o perfil: {username}")
+                story_items = []
+                for story in self.metrics.timed_iter(session.loader.get_stories(userids=[profile.userid]), 'instagram'):
+                    story_items.extend((item, profile.username) for item in self.metrics.timed_iter(story.get_items(), 'instagram'))
+                self._process_new_stories(story_items, session)
+
+                scan_fields = self._scan_time_fields(session, profile_info, new_watermark, posts_before, requests_before) or {}
+                if profile_info.instagram_userid != profile.userid:
+                    # Usado pelo polling de stories, que consulta os perfis pelo id.
+                    scan_fields['instagram_userid'] = profile.userid
+                self.firestore_service.update_monitored_item_scan_time('monitored_profiles', username, scan_fields or None)
+                self.checkpoint.mark_completed(target_key)
+                self.metrics.increment('profiles_scanned')
+                self._human_like_pause(session, self.TARGET_PACE_COST)
 
-            # 2. Varredura de Hashtags
+            except ScanCancelledError:
+                raise
+            except ProfileNotExistsException:
+                logging.warning(f"Perfil '{username}' não encontrado. Considerar desativar.")
+                self.checkpoint.mark_completed(target_key)
+            except PrivateProfileNotFollowedException:
+                logging.warning(f"Perfil '{username}' é privado e não é seguido. Pulando.")
+                self.checkpoint.mark_completed(target_key)
+            except Exception as e:
+                if self._is_rate_limited(e):
+                    # Propaga para que a shard aplique o backoff e retome o alvo.
+                    raise
+                logging.error(f"Erro ao processar o perfil '{username}': {e}", exc_info=True)
+
+        # 2. Varredura de Hashtags
+        for hashtag_info in hashtags_to_scan:
+            hashtag_name = hashtag_info.name
+            # Hashtags são limitadas a 50 posts e usam checkpoint apenas por alvo.
+            self._check_cancelled()
+            target_key = ScanCheckpoint.target_key('hashtag', hashtag_name)
+            if self.checkpoint.is_completed(target_key):
+                logging.info(f"Hashtag '#{hashtag_name}' já concluída nesta execução. Pulando.")
+                continue
+
+            logging.info(f"Iniciando varredura da hashtag: #{hashtag_name}")
+            posts_before, requests_before = session.posts_processed, session.pacer.stats()['requests']
+            try:
+                with self.metrics.timed('instagram'):
+                    hashtag = self.instagram_backend.hashtag_from_name(session.loader, hashtag_name)
+                
+                # Coleta os 50 posts mais recentes da hashtag
+                new_watermark = self._scan_posts(itertools.islice(hashtag.get_posts(), 50), session, hashtag_info, from_hashtag=hashtag_name, stop_at_watermark=False)
+                
+                self.firestore_service.update_monitored_item_scan_time('monitored_hashtags', hashtag_name, self._scan_time_fields(session, hashtag_info, new_watermark, posts_before, requests_before))
+                self.checkpoint.mark_completed(target_key)
+                self.metrics.increment('hashtags_scanned')
+                self._human_like_pause(session, self.TARGET_PACE_COST)
+
+            except ScanCancelledError:
+                raise
+            except Exception as e:
+                if self._is_rate_limited(e):
+                    raise
+                logging.error(f"Erro ao processar a hashtag '#{hashtag_name}': {e}", exc_info=True)
+
+    def dispatch_scan_targets(self, task_queue: TaskQueue) -> int:
+        """
+        Coordenador da varredura distribuída: seleciona os alvos (com o
+        planejador, se ativo), registra o total em system_logs e enfileira uma
+        tarefa por alvo, processada por /jobs/scan-target em qualquer
+        instância. O total é gravado antes do enfileiramento, pois as tarefas
+        podem terminar antes do fim deste método.
+
+        Returns:
+            O número de alvos distribuídos.
+        """
+        with self.metrics.timed('firestore'):
+            profiles_to_scan = self.firestore_service.get_active_monitored_profiles()
             hashtags_to_scan = self.firestore_service.get_active_monitored_hashtags()
-            for hashtag_info in hashtags_to_scan:
-                hashtag_name = hashtag_info.get('hashtag_sem_cerquilha')
-                if not hashtag_name: continue
+        if self.planner:
+            concurrency = max(1, int(os.getenv("SCAN_FANOUT_CONCURRENCY", "3")))
+            profiles_to_scan, hashtags_to_scan = self.planner.plan(profiles_to_scan, hashtags_to_scan, concurrency=concurrency, now=self.run_started_at)
 
-                logging.info(f"Iniciando varredura da hashtag: #{hashtag_name}")
-                try:
-                    hashtag = instaloader.Hashtag.from_name(self.instaloader_instance.context, hashtag_name)
-                    
-                    # Coleta os 50 posts mais recentes da hashtag
-                    for post in itertools.islice(hashtag.get_posts(), 50):
-                        self._process_post(post, from_hashtag=hashtag_name)
-                    
-                    self.firestore_service.update_monitored_item_scan_time('monitored_hashtags', hashtag_name)
-                    self._human_like_pause(180, 300)
+        tasks = [(target.kind, target.name) for target in itertools.chain(profiles_to_scan, hashtags_to_scan)]
+        self.firestore_service.start_fanout_run(self.run_id, len(tasks))
+        for target_type, target_id in tasks:
+            target_key = ScanCheckpoint.target_key(target_type, target_id)
+            try:
+                task_queue.enqueue(task_name(self.run_id, target_key), {"run_id": self.run_id, "target_type": target_type, "target_id": target_id})
+                self.metrics.increment('targets_enqueued')
+            except Exception as e:
+                # Conta como falha para que a execução ainda seja finalizada.
+                logging.error(f"Falha ao enfileirar o alvo '{target_key}': {e}")
+                self.record_target_result(target_key, 'failed')
+        logging.info(f"{self.metrics.to_dict().get('targets_enqueued', 0)} de {len(tasks)} alvos enfileirados para a execução '{self.run_id}'.")
+        return len(tasks)
+
+    def run_target_scan(self, target_type: str, target_id: str, run_started_at: Optional[datetime] = None) -> bool:
+        """
+        Worker da varredura distribuída: varre um único alvo com uma conta.
 
+        A tarefa pode ser entregue mais de uma vez, inclusive enquanto a
+        entrega anterior ainda executa (prazo da fila esgotado). O lease
+        exclusivo do alvo no checkpoint impede varreduras simultâneas; o
+        checkpoint faz uma nova entrega pular o alvo já concluído ou retomá-lo
+        da posição salva, e as escritas usam IDs estáveis (shortcode, mediaid),
+        de modo que repetir o alvo não duplica dados.
+
+        Args:
+            run_started_at: Início da varredura distribuída (planejamento do
+                            coordenador), gravado no alvo para o planejador.
+
+        Returns:
+            True se o alvo foi concluído (ou não está mais ativo); False se a
+            tarefa deve ser repetida (ex: conta bloqueada ou indisponível).
+
+        Raises:
+            TargetLeaseUnavailableError: Se outra entrega detém o lease do alvo.
+        """
+        if run_started_at is not None:
+            self.run_started_at = run_started_at
+        target = self.firestore_service.get_monitored_item(target_type, target_id)
+        if target is None:
+            logging.warning(f"Alvo '{target_type}:{target_id}' não encontrado ou inativo. Ignorando.")
+            return True
+
+        profiles_to_scan, hashtags_to_scan = ([target], []) if target_type == 'profile' else ([], [target])
+        target_key = ScanCheckpoint.target_key(target_type, target_id)
+        with self.checkpoint.target_lease(target_key, self.target_lease_seconds, on_lost=self.cancel_event.set):
+            self.checkpoint.load()
+            if self.checkpoint.is_completed(target_key):
+                logging.info(f"Alvo '{target_key}' já concluído nesta execução. Ignorando entrega repetida.")
+                return True
+
+            self.scan_shards = 1
+            self.fanout_worker = True
+            self.export_manifest_id = f"{target_type}-{target_id}"
+            with self._leased_sessions() as sessions:
+                if not sessions:
+                    self.interrupted = True
+                    return False
+                # O índice persistente é atualizado uma única vez, ao finalizar
+                # a execução (record_target_result).
+                self.post_index.load(run_id=self.run_id)
+                with self._write_pipeline():
+                    self._scan_shard(sessions[0], profiles_to_scan, hashtags_to_scan)
+            return self.checkpoint.is_completed(target_key)
+
+    def record_target_result(self, target_key: str, status: str, metrics: Optional[Dict[str, Any]] = None):
+        """
+        Agrega o resultado de um alvo da varredura distribuída em system_logs.
+        A tarefa que finaliza a execução grava no índice de posts persistente
+        os posts processados por todas as tarefas.
+
+        Args:
+            status: 'completed', 'failed' ou 'cancelled'.
+        """
+        run_status = self.firestore_service.record_scan_task_result(
+            self.run_id, target_key, status, metrics, post_shortcodes=self.post_index.claimed_shortcodes()
+        )
+        if run_status not in (None, "running"):
+            self.post_index.save_shortcodes(self.firestore_service.get_fanout_post_shortcodes(self.run_id))
+            logging.info(f"Varredura distribuída '{self.run_id}' finalizada com status '{run_status}'; índice de posts atualizado.")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Retorna as métricas da execução, no formato aceito por log_system_event.
+        """
+        metrics = self.metrics.to_dict()
+        if self.sessions:
+            metrics['pacer'] = {session.username: session.pacer.stats() for session in self.sessions}
+        metrics['owner_profile_cache'] = self.owner_profiles.stats()
+        if self.export_manifest_path:
+            metrics['export_manifest'] = self.export_manifest_path
+        if self.media_dedup:
+            metrics['media_dedup_hits'] = self.media_dedup.hits
+            metrics['media_dedup_misses'] = self.media_dedup.misses
+        return metrics
+
+    def _scan_shard(self, session: AccountSession, profiles_to_scan: list, hashtags_to_scan: list):
+        """
+        Executa a varredura de uma shard de alvos com uma conta.
+
+        Em caso de 429, o pacer da conta reduz a taxa e aplica um backoff
+        exponencial; a varredura é então retomada do ponto registrado no
+        checkpoint. Após 'max_consecutive_throttles' bloqueios seguidos, a
+        shard é encerrada e a execução fica marcada como interrompida.
+        """
+        def on_error(_, e: Exception):
+            logging.critical(f"Erro não tratado durante a varredura da conta '{session.username}': {e}", exc_info=True)
+            self.interrupted = True
+            self._log_shard_event("error", f"Erro crítico na varredura da conta {session.username}.", str(e))
+
+        self._run_shard_items(session, "varredura", [None], lambda _: self._scan_targets(session, profiles_to_scan, hashtags_to_scan), on_error, log_aborts=True)
+
+    def _run_shard_items(self, session: AccountSession, label: str, items: list, process: Callable[[Any], Optional[bool]],
+                         on_error: Callable[[Any, Exception], None], log_aborts: bool = False):
+        """
+        Processa os itens de uma shard com uma conta, um a um, com o
+        tratamento comum dos jobs:
+
+          * 429: o pacer já aplicou o backoff (PacedRateController.handle_429)
+            e o mesmo item é tentado novamente, até 'max_consecutive_throttles'
+            bloqueios seguidos, quando a shard é encerrada;
+          * sessão expirada (LoginRequiredException): a shard é encerrada e a
+            conta é liberada como 'session_expired';
+          * cancelamento: a shard é encerrada antes do próximo item;
+          * demais erros: repassados a 'on_error' e o item é pulado.
+
+        Nos três primeiros casos, a execução fica marcada como interrompida.
+
+        Args:
+            label: Nome do job nos logs (ex: 'polling de stories').
+            process: Processa um item; retornar False encerra a shard.
+            log_aborts: Registra em system_logs a shard encerrada por 429.
+        """
+        index = 0
+        while index < len(items):
+            try:
+                if self.cancelled:
+                    raise ScanCancelledError(f"Execução '{self.run_id}' cancelada.")
+                if process(items[index]) is False:
+                    return
+            except ScanCancelledError:
+                logging.warning(f"Shard da conta '{session.username}' cancelada ({label}). O checkpoint permite retomá-la.")
+                self.interrupted = True
+                return
+            except LoginRequiredException as e:
+                logging.error(f"Sessão da conta '{session.username}' expirada ({label}). Encerrando shard. Erro: {e}")
+                session.status = 'session_expired'
+                self.interrupted = True
+                self.metrics.increment('session_expired_aborts')
+                return
+            except Exception as e:
+                if not self._is_rate_limited(e):
+                    on_error(items[index], e)
+                elif session.pacer.consecutive_throttles >= self.max_consecutive_throttles:
+                    logging.warning(f"Conta '{session.username}' bloqueada repetidamente ({label}). Encerrando shard. Erro: {e}")
+                    self.interrupted = True
+                    self.metrics.increment('too_many_requests_aborts')
+                    if log_aborts:
+                        self._log_shard_event("warning", f"TooManyRequestsException recebida pela conta {session.username}.", str(e))
+                    return
+                else:
+                    logging.warning(f"Recebida exceção TooManyRequestsException na conta '{session.username}' ({label}). Retomando após o backoff do pacer. Erro: {e}")
+                    continue
+            index += 1
+
+    def _log_shard_event(self, status: str, message: str, error_message: str):
+        """
+        Registra em system_logs um erro de shard. Na varredura distribuída, o
+        registro da execução agrega as tarefas e não é sobrescrito: o
+        resultado do alvo é registrado pelo worker.
+        """
+        if self.fanout_worker:
+            return
+        self.firestore_service.log_system_event(self.run_id, "Search_Instagram", "data_collection", status, message, error_message, metrics=self.get_metrics())
+
+    def _run_shards(self, worker, sessions: list, *target_lists: list):
+        """
+        Divide cada lista de alvos entre as sessões (round-robin) e executa
+        'worker(session, *shard_lists)' em paralelo, cada sessão com seu
+        próprio contexto e cadência de requisições.
+
+        Uma shard que termina com exceção não interrompe as demais: a falha
+        é registrada em system_logs e a execução fica marcada como
+        interrompida, para ser retomada pelo checkpoint.
+        """
+        shard_count = len(sessions)
+        if shard_count == 1:
+            worker(sessions[0], *target_lists)
+            return
+
+        with ThreadPoolExecutor(max_workers=shard_count, thread_name_prefix="scan-shard") as executor:
+            futures = {
+                executor.submit(worker, session, *[targets[index::shard_count] for targets in target_lists]): session
+                for index, session in enumerate(sessions)
+            }
+            for future in as_completed(futures):
+                session = futures[future]
+                try:
+                    future.result()
+                except ScanCancelledError:
+                    logging.warning(f"Shard da conta '{session.username}' cancelada.")
+                    self.interrupted = True
                 except Exception as e:
-                    logging.error(f"Erro ao processar a hashtag '#{hashtag_name}': {e}", exc_info=True)
+                    logging.critical(f"Falha na shard da conta '{session.username}': {e}", exc_info=e)
+                    self.interrupted = True
+                    self.metrics.increment('shard_failures')
+                    self._log_shard_event("error", f"Falha na shard da conta {session.username}.", str(e))
 
-        except TooManyRequestsException as e:
-            logging.warning(f"Recebida exceção TooManyRequestsException. Encerrando job. Erro: {e}")
-            self.firestore_service.log_system_event(self.run_id, "Search_Instagram", "data_collection", "warning", "TooManyRequestsException recebida.", str(e))
-            time.sleep(random.uniform(900, 1800))
-        except Exception as e:
-            logging.critical(f"Erro não tratado durante a varredura: {e}", exc_info=True)
-            self.firestore_service.log_system_event(self.run_id, "Search_Instagram", "data_collection", "error", "Erro crítico na varredura.", str(e))
+    @contextmanager
+    def _leased_sessions(self):
+        """
+        Reserva as contas de serviço e abre suas sessões, renovando as reservas
+        em segundo plano e liberando as contas ao final. Entrega uma lista
+        vazia se nenhuma sessão puder ser aberta.
+        """
+        sessions = self._open_sessions()
+        self.sessions = sessions
+        stop_renewal = threading.Event()
+        if sessions:
+            renewal_thread = threading.Thread(target=self._renew_leases_periodically, args=(sessions, stop_renewal), name="lease-renewal", daemon=True)
+            renewal_thread.start()
+        try:
+            yield sessions
         finally:
-            if self.service_account:
-                self.firestore_service.update_service_account_status(
-                    self.service_account['username'], 
-                    'active', 
+            stop_renewal.set()
+            for session in sessions:
+                if session.status == 'active':
+                    # Cookies renovados pelo Instagram durante a execução.
+                    self.session_cache.update_session_data(session.account['secret_manager_path'], session.loader.save_session())
+                else:
+                    self.session_cache.invalidate(session.account['secret_manager_path'])
+                self.firestore_service.release_service_account(
+                    session.account['doc_id'],
+                    self.run_id,
+                    status=session.status,
                     last_used_at=datetime.now(timezone.utc)
                 )
-            self._cleanup_temp_session_file()
+
+    def _close_exporter(self):
+        """
+        Envia os arquivos pendentes da exportação e grava o manifesto da execução.
+        """
+        if not self.exporter:
+            return
+        with self.metrics.timed('export'):
+            manifest_path = self.exporter.close()
+        self.metrics.increment('export_rows', self.exporter.rows_exported)
+        self.metrics.increment('export_bytes', self.exporter.bytes_exported)
+        if manifest_path:
+            self.export_manifest_path = manifest_path
+        self.exporter = None
+
+    def _media_postprocessor(self):
+        if not self.media_postprocess_enabled:
+            return nullcontext()
+        return MediaPostProcessor(
+            self.storage_service,
+            self.instagram_backend,
+            workers=int(os.getenv("MEDIA_POSTPROCESS_WORKERS", "2")),
+            max_queue_size=int(os.getenv("MEDIA_POSTPROCESS_QUEUE_SIZE", "32")),
+            thumbnail_size=int(os.getenv("MEDIA_THUMBNAIL_SIZE", "320")),
+            max_source_bytes=int(os.getenv("MEDIA_POSTPROCESS_MAX_MB", "20")) * 1024 * 1024,
+            metrics=self.metrics
+        )
+
+    @contextmanager
+    def _buffered_writes(self):
+        """
+        Direciona as escritas ao writer em lote do Firestore. Ao sair do
+        bloco, mesmo em caso de erro, envia as operações pendentes e registra
+        os contadores e o tempo do writer nas métricas da execução.
+        """
+        with self.firestore_service.buffered_writes() as writer:
+            try:
+                yield writer
+            finally:
+                writer.close()
+                self.metrics.increment('firestore_writes', writer.committed_ops)
+                self.metrics.increment('firestore_write_failures', writer.failed_ops)
+                self.metrics.increment('firestore_write_fallbacks', writer.fallback_ops)
+                self.metrics.add_time('firestore', writer.commit_seconds)
+
+    @contextmanager
+    def _write_pipeline(self):
+        """
+        Ativa a coleta com escritas em lote, pool de transferência de mídia e
+        exportação. As escritas são enviadas ao final, mesmo em caso de erro;
+        o pool de mídia e, em seguida, o pós-processamento (que recebe as
+        mídias do pool) são encerrados antes do writer, pois gravam os
+        resultados nele, e a exportação é fechada por último.
+        """
+        if self.export_enabled:
+            self.exporter = RunExporter(self.storage_service, self.run_id, self.export_part_size_bytes, manifest_id=self.export_manifest_id, max_open_parts=self.export_max_open_parts)
+        try:
+            with self._buffered_writes():
+                try:
+                    with self._media_postprocessor() as self.media_postprocessor:
+                        if self.media_transfer_workers > 0:
+                            with MediaTransferPool(self._download_and_upload_media, self.media_transfer_workers, self.media_transfer_queue_size) as self.media_pool:
+                                yield
+                        else:
+                            yield
+                finally:
+                    self.media_pool = None
+                    self.media_postprocessor = None
+                    self.post_index.flush_hashtags()
+        finally:
+            self._close_exporter()
+
+    def _refresh_shard(self, session: AccountSession, shortcodes: list):
+        """
+        Atualiza o engajamento de uma shard de posts com uma conta, fazendo
+        apenas a requisição de metadados de cada post.
+
+        Em caso de 429, o pacer aplica o backoff e o mesmo post é tentado
+        novamente, até 'max_consecutive_throttles' bloqueios seguidos.
+        """
+        def refresh(shortcode: str):
+            with self.metrics.timed('instagram'):
+                post = self.instagram_backend.post_from_shortcode(session.loader, shortcode)
+            self._refresh_post_engagement(post)
+
+        def on_error(shortcode: str, e: Exception):
+            logging.warning(f"Não foi possível atualizar o engajamento do post '{shortcode}': {e}")
+            self.metrics.increment('posts_refresh_failed')
+
+        self._run_shard_items(session, "atualização de engajamento", shortcodes, refresh, on_error)
+
+    def run_engagement_refresh(self, shortcodes: Optional[list] = None, days: int = 7, limit: int = 10000):
+        """
+        Atualiza likes_count e comments_count de posts já coletados, sem
+        baixar mídia nem comentários. As atualizações parciais são gravadas em
+        lote.
+
+        Args:
+            shortcodes: Posts a atualizar. Se omitido, usa os posts publicados
+                        nos últimos 'days' dias.
+            limit: Número máximo de posts atualizados.
+        """
+        if shortcodes is None:
+            with self.metrics.timed('firestore'):
+                shortcodes = self.firestore_service.get_recent_post_shortcodes(days, limit)
+        shortcodes = list(dict.fromkeys(shortcodes))[:limit]
+        if not shortcodes:
+            logging.info("Nenhum post para atualizar o engajamento.")
+            return
+
+        with self._leased_sessions() as sessions:
+            if not sessions:
+                self.interrupted = True
+                return
+            self.metrics.increment('shards', len(sessions))
+            with self._buffered_writes():
+                self._run_shards(self._refresh_shard, sessions, shortcodes)
+        logging.info(f"Engajamento atualizado em {self.metrics.to_dict().get('posts_refreshed', 0)} de {len(shortcodes)} posts.")
+
+    def _write_owner_fields(self, comments: list, fields: Dict[str, Any]):
+        for comment in comments:
+            self.firestore_service.update_instagram_data(comment['collection_path'], fields, comment['doc_id'])
+        self.metrics.increment('comments_enriched' if fields['user_enrichment_status'] == 'enriched' else 'comments_enrichment_unavailable', len(comments))
+
+    def _enrich_comments_shard(self, session: AccountSession, users: list):
+        """
+        Busca no Instagram os perfis de uma shard de autores sem cache e
+        grava os campos nos seus comentários pendentes, dentro do orçamento
+        COMMENT_ENRICHMENT_BUDGET. Em caso de 429, o pacer aplica o backoff e
+        o mesmo autor é tentado novamente, até 'max_consecutive_throttles'
+        bloqueios seguidos.
+
+        Args:
+            users: Lista de tuplas (user_id, username, comentários pendentes).
+        """
+        def enrich(user: tuple) -> Optional[bool]:
+            if not self.owner_profiles.try_reserve_fetch():
+                logging.info("Orçamento de busca de perfis esgotado; os demais comentários continuam pendentes.")
+                return False
+            user_id, username, comments = user
+            try:
+                with self.metrics.timed('instagram'):
+                    profile = self.instagram_backend.profile_from_username(session.loader, username)
+                self._write_owner_fields(comments, self._owner_fields(self._cache_owner_profile(user_id, profile)))
+            except (ProfileNotExistsException, PrivateProfileNotFollowedException) as e:
+                # Perfis removidos não são consultados novamente nas próximas execuções.
+                logging.info(f"Perfil do autor '{username}' indisponível: {e}")
+                self._write_owner_fields(comments, {"user_enrichment_status": "unavailable"})
+            return None
+
+        def on_error(user: tuple, e: Exception):
+            logging.warning(f"Não foi possível enriquecer o perfil do usuário '{user[1]}': {e}")
+            self.metrics.increment('comment_enrichment_failed')
+
+        self._run_shard_items(session, "enriquecimento de comentários", users, enrich, on_error)
+
+    def run_comment_enrichment(self, limit: int = 5000):
+        """
+        Enriquece os comentários gravados com 'user_enrichment_status'
+        'pending' (autor sem cache ou acima do orçamento durante a
+        varredura). Os autores são agrupados, de modo que cada perfil é
+        resolvido uma única vez: primeiro pelo cache, sem requisições, e
+        depois buscando no Instagram dentro do orçamento da execução
+        (COMMENT_ENRICHMENT_BUDGET), qualquer que seja a política da
+        varredura, exceto 'none'. Comentários não resolvidos continuam
+        pendentes para a próxima execução.
+
+        Args:
+            limit: Número máximo de comentários pendentes lidos.
+        """
+        if self.owner_profiles.policy == 'none':
+            logging.info("COMMENT_ENRICHMENT=none; enriquecimento de comentários desativado.")
+            return
+        # O job diferido é o responsável pelas buscas no Instagram.
+        self.owner_profiles.policy = 'full'
+        with self.metrics.timed('firestore'):
+            pending = self.firestore_service.get_pending_enrichment_comments(limit)
+        users: Dict[str, Dict[str, Any]] = {}
+        for comment in pending:
+            if comment['user_id'] and comment['username']:
+                users.setdefault(comment['user_id'], {"username": comment['username'], "comments": []})["comments"].append(comment)
+        if not users:
+            logging.info("Nenhum comentário com enriquecimento pendente.")
+            return
+
+        with self._buffered_writes():
+            with self.metrics.timed('firestore'):
+                self.owner_profiles.prefetch(users)
+            to_fetch = []
+            for user_id, user in users.items():
+                profile_data = self.owner_profiles.get(user_id)
+                if profile_data is not None:
+                    self._write_owner_fields(user["comments"], self._owner_fields(profile_data))
+                else:
+                    to_fetch.append((user_id, user["username"], user["comments"]))
+
+            if to_fetch:
+                with self._leased_sessions() as sessions:
+                    if not sessions:
+                        self.interrupted = True
+                    else:
+                        self.metrics.increment('shards', len(sessions))
+                        self._run_shards(self._enrich_comments_shard, sessions, to_fetch)
+        logging.info(f"Enriquecimento: {self.metrics.to_dict().get('comments_enriched', 0)} de {len(pending)} comentários pendentes enriquecidos.")
+
+    def _resolve_story_poll_userids(self, session: AccountSession, profiles: list) -> Dict[int, str]:
+        """
+        Retorna os ids do Instagram dos perfis (id -> username). Perfis ainda
+        sem 'instagram_userid' são consultados uma única vez e o id é gravado
+        no documento, para que os próximos pollings não repitam a consulta.
+        """
+        userids = {}
+        for profile_info in profiles:
+            username = profile_info.name
+            userid = profile_info.instagram_userid
+            if not userid:
+                if self.cancelled:
+                    break
+                try:
+                    with self.metrics.timed('instagram'):
+                        userid = self.instagram_backend.profile_from_username(session.loader, username).userid
+                    self.firestore_service.update_instagram_data('monitored_profiles', {'instagram_userid': userid}, username)
+                    self.metrics.increment('story_poll_userids_resolved')
+                except Exception as e:
+                    logging.warning(f"Não foi possível obter o id do perfil '{username}' para o polling de stories: {e}")
+                    self.metrics.increment('story_poll_profiles_failed')
+                    continue
+            userids[userid] = username
+        return userids
+
+    def _story_poll_shard(self, session: AccountSession, profiles: list):
+        """
+        Consulta os stories de uma shard de perfis com uma conta, agrupando
+        até 'story_poll_batch_size' perfis em cada chamada a get_stories. Em
+        caso de 429, o pacer aplica o backoff e o mesmo lote é tentado
+        novamente, até 'max_consecutive_throttles' bloqueios seguidos.
+        """
+        userids = self._resolve_story_poll_userids(session, profiles)
+        batches = list(self._chunks(list(userids), self.story_poll_batch_size))
+
+        def poll(batch: list):
+            story_items = []
+            for story in self.metrics.timed_iter(session.loader.get_stories(userids=batch), 'instagram'):
+                owner = userids.get(story.owner_id) or story.owner_username
+                story_items.extend((item, owner) for item in self.metrics.timed_iter(story.get_items(), 'instagram'))
+            self.metrics.increment('story_poll_batches')
+            self._process_new_stories(story_items, session)
+            polled_at = datetime.now(timezone.utc)
+            for userid in batch:
+                self.firestore_service.update_instagram_data('monitored_profiles', {'last_stories_polled_at': polled_at}, userids[userid])
+            self.metrics.increment('profiles_story_polled', len(batch))
+            self._human_like_pause(session, self.TARGET_PACE_COST)
+
+        def on_error(batch: list, e: Exception):
+            logging.error(f"Erro no polling de stories de {len(batch)} perfis: {e}")
+            self.metrics.increment('story_poll_profiles_failed', len(batch))
+
+        self._run_shard_items(session, "polling de stories", batches, poll, on_error)
+
+    @staticmethod
+    def _chunks(items: list, size: int):
+        for start in range(0, len(items), size):
+            yield items[start:start + size]
+
+    def _story_poll_targets(self, profiles: list, limit: int) -> list:
+        """
+        Seleciona os perfis do polling de stories: apenas os com prioridade
+        mínima 'story_poll_min_priority' e sem 'poll_stories' desativado, dos
+        mais prioritários para os menos, e entre eles os consultados há mais
+        tempo primeiro.
+        """
+        oldest = datetime.min.replace(tzinfo=timezone.utc)
+        eligible = [profile for profile in profiles if profile.poll_stories and profile.priority >= self.story_poll_min_priority]
+        eligible.sort(key=lambda profile: (-profile.priority, profile.last_stories_polled_at or oldest))
+        return eligible[:limit]
+
+    def run_story_poll(self, usernames: Optional[list] = None, limit: int = 500):
+        """
+        Coleta os stories novos dos perfis monitorados, sem varrer posts. Os
+        perfis são consultados em lote pelo id e apenas os stories ainda não
+        salvos têm a mídia transferida, o que permite executar o polling a
+        cada poucas horas, dentro da validade de 24h dos stories.
+
+        Args:
+            usernames: Perfis a consultar. Se omitido, usa os perfis
+                       monitorados ativos.
+            limit: Número máximo de perfis consultados.
+        """
+        with self.metrics.timed('firestore'):
+            profiles = self.firestore_service.get_active_monitored_profiles()
+        if usernames is not None:
+            requested = set(usernames)
+            profiles = [profile for profile in profiles if profile.name in requested]
+        profiles = self._story_poll_targets(profiles, limit)
+        if not profiles:
+            logging.info("Nenhum perfil para o polling de stories.")
+            return
+
+        with self._leased_sessions() as sessions:
+            if not sessions:
+                self.interrupted = True
+                return
+            self.metrics.increment('shards', len(sessions))
+            with self._write_pipeline():
+                self._run_shards(self._story_poll_shard, sessions, profiles)
+        logging.info(f"Polling de stories: {self.metrics.to_dict().get('stories_collected', 0)} stories novos em {len(profiles)} perfis.")
+
+    def run_scan(self):
+        """
+        Ponto de entrada principal para executar a varredura de perfis e hashtags.
+        """
+        if self.resume and not self.checkpoint.load():
+            logging.warning(f"Nenhum checkpoint encontrado para '{self.run_id}'. A varredura começará do início.")
+
+        with self._leased_sessions() as sessions:
+            if not sessions:
+                self.interrupted = True
+                return
+            self.metrics.increment('shards', len(sessions))
+            self.checkpoint.mark_status('running')
+            try:
+                with self.metrics.timed('firestore'):
+                    profiles_to_scan = self.firestore_service.get_active_monitored_profiles()
+                    hashtags_to_scan = self.firestore_service.get_active_monitored_hashtags()
+                if self.planner:
+                    profiles_to_scan, hashtags_to_scan = self.planner.plan(profiles_to_scan, hashtags_to_scan, concurrency=len(sessions), now=self.run_started_at)
+                    self.metrics.increment('targets_planned', len(profiles_to_scan) + len(hashtags_to_scan))
+
+                self.post_index.load()
+                with self._write_pipeline():
+                    self._run_shards(self._scan_shard, sessions, profiles_to_scan, hashtags_to_scan)
+                    # Execuções interrompidas podem ser retomadas via /jobs/resume/{run_id}.
+                    self.checkpoint.mark_status('interrupted' if self.interrupted else 'completed')
+            except Exception as e:
+                logging.critical(f"Erro não tratado durante a varredura: {e}", exc_info=True)
+                self.interrupted = True
+                self.firestore_service.log_system_event(self.run_id, "Search_Instagram", "data_collection", "error", "Erro crítico na varredura.", str(e), metrics=self.get_metrics())
+            finally:
+                # Gravado após o envio dos lotes; posts cuja escrita falhou são
+                # detectados pela confirmação no Firestore na próxima execução.
+                self.post_index.save()
+                self.metrics.increment('post_index_confirmations', self.post_index.confirmations)
+                self.metrics.increment('post_index_save_conflicts', self.post_index.save_conflicts)
+                if self.media_dedup:
+                    logging.info(f"Deduplicação de mídia: {self.media_dedup.hits} acertos, {self.media_dedup.misses} transferências.")
@@ -0,0 +1,210 @@
+# /search_instagram/job_runner.py
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from logging_config import logging
+from typing import Optional, Dict, Any, Callable, TYPE_CHECKING
+import threading
+import uuid
+
+if TYPE_CHECKING:
+    from firestore_service import FirestoreService
+
+class JobAlreadyRunningError(Exception):
+    """
+    Lançada quando outra execução já detém o lock do tipo de job.
+    """
+    def __init__(self, job_type: str, holder_run_id: Optional[str]):
+        self.job_type = job_type
+        self.holder_run_id = holder_run_id
+        super().__init__(f"Já existe uma execução do job '{job_type}' em andamento: '{holder_run_id}'.")
+
+class JobLockUnavailableError(Exception):
+    """
+    Lançada quando o lock do tipo de job não pôde ser obtido por um erro do
+    Firestore, sem que se saiba se outra execução está em andamento.
+    """
+    def __init__(self, job_type: str):
+        self.job_type = job_type
+        super().__init__(f"Não foi possível obter o lock do job '{job_type}'.")
+
+class JobHandle:
+    """
+    Estado de um job submetido ao JobRunner.
+
+    A função do job recebe o handle e deve observar 'cancel_event'. Ela pode
+    registrar em 'progress_source' uma função que retorna o progresso atual
+    (ex: InstagramService.get_metrics), exposto por GET /jobs/{run_id}, e
+    retornar o status final ('completed', 'interrupted' ou 'cancelled')
+    informado pelo serviço; sem retorno, o status é 'cancelled' se o
+    cancelamento foi pedido e 'completed' caso contrário.
+    """
+    # Status finais que a função do job pode retornar.
+    RESULT_STATUSES = ('completed', 'interrupted', 'cancelled')
+
+    def __init__(self, run_id: str, job_type: str):
+        self.run_id = run_id
+        self.job_type = job_type
+        self.status = 'queued'
+        self.submitted_at = datetime.now(timezone.utc)
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.error: Optional[str] = None
+        self.cancel_event = threading.Event()
+        self.progress_source: Optional[Callable[[], Dict[str, Any]]] = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ('completed', 'interrupted', 'failed', 'cancelled')
+
+    def to_dict(self) -> Dict[str, Any]:
+        job_info = {
+            "run_id": self.run_id,
+            "job_type": self.job_type,
+            "status": self.status,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "cancel_requested": self.cancel_event.is_set(),
+            "error_message": self.error,
+            "progress": None
+        }
+        if self.progress_source:
+            try:
+                job_info["progress"] = self.progress_source()
+            except Exception as e:
+                logging.warning(f"Não foi possível obter o progresso da execução '{self.run_id}': {e}")
+        return job_info
+
+class JobRunner:
+    """
+    Executor dos jobs longos (varredura, atualização de engajamento) fora do
+    threadpool do servidor HTTP.
+
+    Os jobs rodam em um ThreadPoolExecutor limitado a 'max_workers'. Cada tipo
+    de job é single-flight: a submissão obtém o lock 'job_locks/{job_type}' no
+    Firestore, que é renovado enquanto o job estiver na fila ou em execução e
+    liberado ao final, de modo que disparos duplicados do scheduler, inclusive
+    em outras instâncias, são recusados. O cancelamento pode ser pedido
+    localmente ou por outra instância, via o campo 'cancel_requested' do lock.
+    """
+    def __init__(self, max_workers: int = 2, lock_lease_seconds: int = 600, max_finished_jobs: int = 100):
+        self.lock_lease_seconds = lock_lease_seconds
+        self.max_finished_jobs = max_finished_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: Dict[str, JobHandle] = {}
+        self._lock = threading.Lock()
+        self._firestore_service: Optional["FirestoreService"] = None
+
+    @property
+    def firestore_service(self) -> "FirestoreService":
+        # Importado e criado sob demanda para não carregar o SDK do Firestore
+        # na inicialização do app.
+        if self._firestore_service is None:
+            from firestore_service import FirestoreService
+            self._firestore_service = FirestoreService()
+        return self._firestore_service
+
+    def submit(self, job_type: str, fn: Callable[[JobHandle], Any], run_id: Optional[str] = None) -> JobHandle:
+        """
+        Obtém o lock do tipo de job e enfileira 'fn(job)' no executor.
+
+        Raises:
+            JobAlreadyRunningError: Se outra execução, ou a mesma 'run_id',
+                já detém o lock ou está em andamento nesta instância.
+            JobLockUnavailableError: Se o lock não pôde ser obtido.
+        """
+        job = JobHandle(run_id or str(uuid.uuid4()), job_type)
+        existing = self.get(job.run_id)
+        if existing is not None and not existing.is_finished:
+            # Ex: retomada de uma execução ainda em andamento nesta instância.
+            raise JobAlreadyRunningError(job_type, job.run_id)
+        result = self.firestore_service.acquire_job_lock(job_type, job.run_id, self.lock_lease_seconds)
+        if result is None:
+            raise JobLockUnavailableError(job_type)
+        acquired, holder = result
+        if not acquired:
+            raise JobAlreadyRunningError(job_type, holder)
+
+        with self._lock:
+            self._jobs[job.run_id] = job
+            self._prune_finished_jobs()
+        stop_renewal = threading.Event()
+        threading.Thread(target=self._renew_lock_periodically, args=(job, stop_renewal), name=f"job-lock-{job_type}", daemon=True).start()
+        self._executor.submit(self._run, job, fn, stop_renewal)
+        logging.info(f"Job '{job_type}' enfileirado com run_id: {job.run_id}")
+        return job
+
+    def _run(self, job: JobHandle, fn: Callable[[JobHandle], Any], stop_renewal: threading.Event):
+        try:
+            if job.cancel_event.is_set():
+                job.status = 'cancelled'
+                return
+            job.status = 'running'
+            job.started_at = datetime.now(timezone.utc)
+            status = fn(job)
+            if status not in JobHandle.RESULT_STATUSES:
+                status = 'cancelled' if job.cancel_event.is_set() else 'completed'
+            job.status = status
+        except Exception as e:
+            logging.error(f"Job '{job.job_type}' ({job.run_id}) falhou: {e}")
+            job.status = 'failed'
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.now(timezone.utc)
+            stop_renewal.set()
+            self.firestore_service.release_job_lock(job.job_type, job.run_id)
+
+    def _renew_lock_periodically(self, job: JobHandle, stop_event: threading.Event):
+        """
+        Renova o lock do job e propaga cancelamentos pedidos por outra instância.
+        Se o lock for perdido (ou não puder ser renovado), o job é cancelado,
+        pois outra instância pode obtê-lo e executar o mesmo job.
+        """
+        while not stop_event.wait(self.lock_lease_seconds / 3):
+            lock_data = self.firestore_service.renew_job_lock(job.job_type, job.run_id, self.lock_lease_seconds)
+            if lock_data is None:
+                logging.warning(f"Lock do job '{job.job_type}' perdido pela execução '{job.run_id}'. Cancelando o job.")
+                job.error = "Lock do job perdido."
+                job.cancel_event.set()
+                return
+            if lock_data.get('cancel_requested') and not job.cancel_event.is_set():
+                logging.warning(f"Cancelamento da execução '{job.run_id}' recebido via Firestore.")
+                job.cancel_event.set()
+
+    def _prune_finished_jobs(self):
+        finished = [run_id for run_id, job in self._jobs.items() if job.is_finished]
+        for run_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[run_id]
+
+    def get(self, run_id: str) -> Optional[JobHandle]:
+        with self._lock:
+            return self._jobs.get(run_id)
+
+    def cancel(self, run_id: str) -> bool:
+        """
+        Solicita o cancelamento de um job desta instância ou, se ele estiver em
+        outra instância, sinaliza o cancelamento no lock do Firestore.
+
+        Returns:
+            True se o cancelamento foi solicitado.
+        """
+        job = self.get(run_id)
+        if job is not None:
+            if job.is_finished:
+                return False
+            job.cancel_event.set()
+            logging.info(f"Cancelamento solicitado para a execução '{run_id}'.")
+            return True
+        return self.firestore_service.request_job_cancellation(run_id)
+
+    def shutdown(self):
+        """
+        Cancela os jobs ativos e aguarda seu encerramento; as varreduras
+        interrompidas podem ser retomadas a partir do checkpoint.
+        """
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            if not job.is_finished:
+                job.cancel_event.set()
+        self._executor.shutdown(wait=True)
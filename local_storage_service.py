@@ -0,0 +1,149 @@
+# /search_instagram/local_storage_service.py
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from logging_config import logging
+from storage_service import StorageService, _CountingReader, _RangeReader
+from typing import Optional, Dict, Any, BinaryIO, List, Set, Tuple
+
+class LocalStorageService(StorageService):
+    """
+    Destino de armazenamento em um diretório local (instalações on-premises,
+    desenvolvimento e testes).
+
+    Os objetos ficam em '{raiz}/{nome}' e seus metadados (content_type e
+    metadados customizados) em '{raiz}/.metadata/{nome}.json'. As gravações
+    são feitas em um arquivo temporário renomeado ao final, de modo que
+    leitores nunca veem objetos parciais.
+    """
+    scheme = 'file'
+    METADATA_DIR = '.metadata'
+    COPY_BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, root_dir: Optional[str] = None):
+        """
+        Args:
+            root_dir: Diretório raiz; por padrão, LOCAL_STORAGE_DIR.
+        """
+        try:
+            root_dir = root_dir or os.getenv("LOCAL_STORAGE_DIR")
+            if not root_dir:
+                raise ValueError("Variável de ambiente LOCAL_STORAGE_DIR não definida.")
+            self.root_dir = os.path.abspath(root_dir)
+            os.makedirs(self.root_dir, exist_ok=True)
+            super().__init__(self.root_dir)
+            logging.info(f"Armazenamento local em '{self.root_dir}' inicializado.")
+        except Exception as e:
+            logging.error(f"Falha ao inicializar o armazenamento local: {e}")
+            raise
+
+    def uri(self, name: str) -> str:
+        return f"file://{os.path.join(self.root_dir, name)}"
+
+    def _path(self, name: str) -> str:
+        path = os.path.abspath(os.path.join(self.root_dir, name))
+        if not path.startswith(self.root_dir + os.sep):
+            raise ValueError(f"Nome de objeto inválido: '{name}'.")
+        return path
+
+    def _metadata_path(self, name: str) -> str:
+        return self._path(os.path.join(self.METADATA_DIR, name + '.json'))
+
+    def _write_atomically(self, path: str, write_fn):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temp_path, 'wb') as output:
+                write_fn(output)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _write_metadata(self, name: str, content_type: Optional[str], metadata: Optional[Dict[str, str]]):
+        data = json.dumps({"content_type": content_type, "metadata": metadata or {}}).encode('utf-8')
+        self._write_atomically(self._metadata_path(name), lambda output: output.write(data))
+
+    def _put_stream(self, reader: _CountingReader, name: str, size: Optional[int], content_type: Optional[str], metadata: Optional[Dict[str, str]]):
+        self._write_atomically(self._path(name), lambda output: shutil.copyfileobj(reader, output, self.COPY_BUFFER_SIZE))
+        self._write_metadata(name, content_type, metadata)
+
+    def _put_bytes(self, data: bytes, name: str, content_type: Optional[str]):
+        self._write_atomically(self._path(name), lambda output: output.write(data))
+        self._write_metadata(name, content_type, None)
+
+    def _stat(self, name: str) -> Optional[Tuple[int, Dict[str, str]]]:
+        path = self._path(name)
+        if not os.path.isfile(path):
+            return None
+        metadata = {}
+        try:
+            with open(self._metadata_path(name)) as metadata_file:
+                metadata = json.load(metadata_file).get('metadata') or {}
+        except FileNotFoundError:
+            pass
+        return os.path.getsize(path), metadata
+
+    def _get_versioned(self, name: str) -> Tuple[bytes, str]:
+        # A versão é o hash do conteúdo: as gravações substituem o arquivo inteiro.
+        with open(self._path(name), 'rb') as data_file:
+            data = data_file.read()
+        return data, hashlib.sha256(data).hexdigest()
+
+    def _put_bytes_if_version(self, data: bytes, name: str, content_type: Optional[str], version: Optional[str]) -> bool:
+        # O flock serializa as gravações condicionais entre processos (POSIX).
+        import fcntl
+        lock_path = self._path(os.path.join(self.METADATA_DIR, name + '.lock'))
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        with open(lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                current_version = self._get_versioned(name)[1]
+            except FileNotFoundError:
+                current_version = None
+            if current_version != version:
+                return False
+            self._put_bytes(data, name, content_type)
+        return True
+
+    def _list_names(self, prefix: str) -> Set[str]:
+        directory = self._path(prefix) if prefix else self.root_dir
+        try:
+            entries = os.listdir(directory)
+        except FileNotFoundError:
+            return set()
+        return {prefix + entry for entry in entries if os.path.isfile(os.path.join(directory, entry))}
+
+    def _open_read(self, name: str, start: int, end: Optional[int]) -> BinaryIO:
+        stream = open(self._path(name), 'rb')
+        if start:
+            stream.seek(start)
+        return _RangeReader(stream, end - start if end is not None else None)
+
+    def _start_multipart(self, name: str, content_type: Optional[str], metadata: Optional[Dict[str, str]]) -> Dict[str, Any]:
+        parts_dir = self._path(os.path.join(self.METADATA_DIR, 'uploads', uuid.uuid4().hex))
+        os.makedirs(parts_dir)
+        return {"name": name, "parts_dir": parts_dir, "content_type": content_type, "metadata": metadata}
+
+    def _upload_part(self, upload: Dict[str, Any], part_number: int, data: bytes) -> str:
+        part_path = os.path.join(upload['parts_dir'], f"{part_number:05d}")
+        with open(part_path, 'wb') as part_file:
+            part_file.write(data)
+        return part_path
+
+    def _complete_multipart(self, upload: Dict[str, Any], parts: List[str]):
+        def concatenate(output):
+            for part_path in parts:
+                with open(part_path, 'rb') as part_file:
+                    shutil.copyfileobj(part_file, output, self.COPY_BUFFER_SIZE)
+
+        try:
+            self._write_atomically(self._path(upload['name']), concatenate)
+            self._write_metadata(upload['name'], upload['content_type'], upload['metadata'])
+        finally:
+            shutil.rmtree(upload['parts_dir'], ignore_errors=True)
+
+    def _abort_multipart(self, upload: Dict[str, Any], parts: List[str]):
+        shutil.rmtree(upload['parts_dir'], ignore_errors=True)
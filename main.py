@@ -1,9 +1,20 @@
 # /search_instagram/main.py
-from fastapi import FastAPI, BackgroundTasks, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
-import uuid
-from instagram_service import InstagramService
-from firestore_service import FirestoreService
+from typing import Optional, Dict, Callable
+import functools
+import os
+import threading
+# Os serviços de coleta (instaloader e SDKs do Google) são importados dentro
+# das tarefas ou no aquecimento em segundo plano, para que a instância
+# responda a '/' e '/health' logo após iniciar.
+import clients
+import tracing
+from job_runner import JobRunner, JobHandle, JobAlreadyRunningError, JobLockUnavailableError
+from models.schemas import EngagementRefreshRequest, StoryPollRequest, ScanTargetRequest, CommentEnrichmentRequest
 from logging_config import logging
 from dotenv import load_dotenv
 
@@ -11,79 +22,443 @@ from dotenv import load_dotenv
 # Essencial para o desenvolvimento local
 load_dotenv()
 
+# Os jobs longos rodam em um executor próprio, fora do threadpool do servidor HTTP.
+job_runner = JobRunner(
+    max_workers=int(os.getenv("JOB_RUNNER_MAX_WORKERS", "2")),
+    lock_lease_seconds=int(os.getenv("JOB_LOCK_LEASE_MINUTES", "10")) * 60
+)
+
+# Modo da varredura diária: 'local' (todos os alvos nesta instância) ou
+# 'fanout' (uma tarefa por alvo, processada por /jobs/scan-target).
+SCAN_DISPATCH_MODE = os.getenv("SCAN_DISPATCH_MODE", "local").lower()
+# Idade a partir da qual uma varredura distribuída não finalizada é
+# considerada abandonada e deixa de impedir uma nova.
+SCAN_FANOUT_MAX_RUN_HOURS = float(os.getenv("SCAN_FANOUT_MAX_RUN_HOURS", "24"))
+# Prazo da leitura de verificação do /health e por quanto tempo uma
+# verificação bem-sucedida é reaproveitada.
+HEALTH_CHECK_TIMEOUT_SECONDS = float(os.getenv("HEALTH_CHECK_TIMEOUT_SECONDS", "5"))
+HEALTH_CHECK_CACHE_SECONDS = float(os.getenv("HEALTH_CHECK_CACHE_SECONDS", "30"))
+_task_queue = None
+_task_queue_lock = threading.Lock()
+
+def get_task_queue():
+    """
+    Fila de tarefas da varredura distribuída, criada no primeiro uso. A fila
+    local executa as tarefas nesta instância com run_scan_target_task.
+    """
+    global _task_queue
+    with _task_queue_lock:
+        if _task_queue is None:
+            from task_queue import create_task_queue
+            _task_queue = create_task_queue(lambda payload, attempt: run_scan_target_task(ScanTargetRequest(**payload), attempt))
+        return _task_queue
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true":
+        clients.start_warm_up()
+    yield
+    # No encerramento da instância, os jobs ativos são cancelados e gravam seu checkpoint.
+    await run_in_threadpool(job_runner.shutdown)
+
 app = FastAPI(
     title="Search Instagram Service",
     description="Micro-serviço para coleta de dados do Instagram.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-def run_daily_scan_task():
+def _run_job(job: JobHandle, job_type: str, messages: Dict[str, str], work: Callable, resume: bool = False) -> Optional[str]:
     """
-    Função que será executada em background para a coleta diária.
-    Orquestra o processo de login, coleta e logging.
+    Executa um job do JobRunner com o InstagramService, registrando em
+    system_logs o início, o status final ('completed', 'interrupted' ou
+    'cancelled') com as métricas e, em caso de exceção não tratada, o erro.
+
+    Args:
+        job: Handle do job; seu run_id identifica a execução.
+        job_type: Tipo do job gravado em system_logs.
+        messages: Mensagens de cada status ('started' ou 'resumed',
+                  'completed', 'interrupted', 'cancelled' e 'error'); podem
+                  usar {run_id}.
+        work: work(service, firestore_logger) executa o job. Retorna False
+              quando o status final não é registrado aqui (ex: a varredura
+              distribuída, finalizada pela última tarefa).
+        resume: Retoma a execução com esse run_id a partir do checkpoint.
+
+    Returns:
+        O status final, ou None se não foi registrado.
     """
-    run_id = str(uuid.uuid4())
+    from instagram_service import InstagramService
+    from firestore_service import FirestoreService
+
+    run_id = job.run_id
     firestore_logger = None
-    
+    service = None
+
     try:
         # Inicializa o logger do Firestore para registrar o início
         firestore_logger = FirestoreService()
+        start_status = "resumed" if resume else "started"
         firestore_logger.log_system_event(
             run_id=run_id,
             service="Search_Instagram",
-            job_type="daily_scan",
-            status="started",
-            message="Iniciando varredura diária de perfis e hashtags."
+            job_type=job_type,
+            status=start_status,
+            message=messages[start_status].format(run_id=run_id)
         )
 
         # Inicializa e executa o serviço principal
-        service = InstagramService(run_id=run_id)
-        service.run_scan()
+        service = InstagramService(run_id=run_id, resume=resume, cancel_event=job.cancel_event)
+        job.progress_source = service.get_metrics
+        if work(service, firestore_logger) is False:
+            return None
 
         # Registra a conclusão
+        if service.cancelled:
+            status = "cancelled"
+        elif service.interrupted:
+            status = "interrupted"
+        else:
+            status = "completed"
         firestore_logger.log_system_event(
             run_id=run_id,
             service="Search_Instagram",
-            job_type="daily_scan",
-            status="completed",
-            message="Varredura diária concluída com sucesso.",
+            job_type=job_type,
+            status=status,
+            message=messages[status].format(run_id=run_id),
+            metrics=service.get_metrics(),
             end_time=datetime.now(timezone.utc)
-            # TODO: Capturar e passar métricas do serviço
         )
+        return status
 
     except Exception as e:
-        logging.critical(f"[RUN_ID: {run_id}] - Uma exceção não tratada ocorreu na tarefa de background: {e}", exc_info=True)
+        logging.critical(f"[RUN_ID: {run_id}] - Uma exceção não tratada ocorreu no job '{job_type}': {e}", exc_info=True)
         if firestore_logger:
             firestore_logger.log_system_event(
                 run_id=run_id,
                 service="Search_Instagram",
-                job_type="daily_scan",
+                job_type=job_type,
                 status="error",
-                message="A tarefa de varredura falhou criticamente.",
+                message=messages["error"].format(run_id=run_id),
                 error_message=str(e),
+                metrics=service.get_metrics() if service else None,
                 end_time=datetime.now(timezone.utc)
             )
         # Re-raise para que qualquer monitoramento de nível superior possa capturar
         raise
 
+def run_daily_scan_task(job: JobHandle, resume: bool = False):
+    """
+    Função executada pelo JobRunner para a coleta diária.
+    Orquestra o processo de login, coleta e logging.
+
+    Args:
+        job: Handle do job; seu run_id identifica a execução.
+        resume: Retoma a execução interrompida com esse run_id a partir do
+                seu checkpoint.
+    """
+    def work(service, firestore_logger):
+        if SCAN_DISPATCH_MODE == "fanout" and not resume:
+            # O lock do job é liberado ao fim da distribuição, com as tarefas
+            # ainda em execução; verificado aqui, sob o lock, para não haver corrida.
+            unfinished_run_id = firestore_logger.get_unfinished_fanout_run(SCAN_FANOUT_MAX_RUN_HOURS)
+            if unfinished_run_id:
+                firestore_logger.log_system_event(
+                    run_id=job.run_id,
+                    service="Search_Instagram",
+                    job_type="daily_scan",
+                    status="skipped",
+                    message=f"Varredura distribuída '{unfinished_run_id}' ainda em andamento. Nenhum alvo distribuído."
+                )
+                return False
+            # A execução é finalizada pela última tarefa, em record_scan_task_result.
+            service.dispatch_scan_targets(get_task_queue())
+            return False
+        service.run_scan()
+
+    return _run_job(job, "daily_scan", {
+        "started": "Iniciando varredura diária de perfis e hashtags.",
+        "resumed": "Retomando varredura diária a partir do checkpoint.",
+        "completed": "Varredura diária concluída com sucesso.",
+        "interrupted": "Varredura diária interrompida. Retome via /jobs/resume/{run_id}.",
+        "cancelled": "Varredura diária cancelada. Retome via /jobs/resume/{run_id}.",
+        "error": "A tarefa de varredura falhou criticamente."
+    }, work, resume=resume)
+
+def run_engagement_refresh_task(job: JobHandle, request: EngagementRefreshRequest):
+    """
+    Função executada pelo JobRunner para atualizar apenas likes_count e
+    comments_count de posts já coletados.
+    """
+    return _run_job(job, "engagement_refresh", {
+        "started": "Iniciando atualização de engajamento dos posts.",
+        "completed": "Atualização de engajamento concluída com sucesso.",
+        "interrupted": "Atualização de engajamento interrompida.",
+        "cancelled": "Atualização de engajamento cancelada.",
+        "error": "A tarefa de atualização de engajamento falhou criticamente."
+    }, lambda service, _: service.run_engagement_refresh(shortcodes=request.shortcodes, days=request.days, limit=request.limit))
+
+def run_story_poll_task(job: JobHandle, request: StoryPollRequest):
+    """
+    Função executada pelo JobRunner para coletar apenas os stories novos dos
+    perfis monitorados.
+    """
+    return _run_job(job, "story_poll", {
+        "started": "Iniciando polling de stories.",
+        "completed": "Polling de stories concluído com sucesso.",
+        "interrupted": "Polling de stories interrompido.",
+        "cancelled": "Polling de stories cancelado.",
+        "error": "A tarefa de polling de stories falhou criticamente."
+    }, lambda service, _: service.run_story_poll(usernames=request.usernames, limit=request.limit))
+
+def run_comment_enrichment_task(job: JobHandle, request: CommentEnrichmentRequest):
+    """
+    Função executada pelo JobRunner para enriquecer os autores dos
+    comentários gravados com o enriquecimento pendente.
+    """
+    return _run_job(job, "comment_enrichment", {
+        "started": "Iniciando enriquecimento dos comentários pendentes.",
+        "completed": "Enriquecimento de comentários concluído com sucesso.",
+        "interrupted": "Enriquecimento de comentários interrompido.",
+        "cancelled": "Enriquecimento de comentários cancelado.",
+        "error": "A tarefa de enriquecimento de comentários falhou criticamente."
+    }, lambda service, _: service.run_comment_enrichment(limit=request.limit))
+
+def run_scan_target_task(request: ScanTargetRequest, attempt: int = 1) -> bool:
+    """
+    Processa uma tarefa da varredura distribuída (um alvo) e agrega o
+    resultado em system_logs/{run_id}.
+
+    Returns:
+        True se a tarefa foi concluída, descartada ou esgotou as tentativas;
+        False se deve ser repetida pela fila.
+    """
+    from instagram_service import InstagramService
+    from firestore_service import FirestoreService
+    from scan_checkpoint import ScanCheckpoint, TargetLeaseUnavailableError
+
+    run_id = request.run_id
+    target_key = ScanCheckpoint.target_key(request.target_type, request.target_id)
+    max_attempts = int(os.getenv("SCAN_TASK_MAX_ATTEMPTS", "5"))
+    firestore_service = FirestoreService()
+
+    log_entry = firestore_service.get_system_log(run_id)
+    if not log_entry or 'fanout' not in log_entry:
+        logging.warning(f"[RUN_ID: {run_id}] - Tarefa do alvo '{target_key}' sem varredura distribuída correspondente. Descartando.")
+        return True
+
+    service = None
+    try:
+        # O resultado é registrado pelo serviço: a tarefa que finaliza a
+        # execução também atualiza o índice de posts persistente.
+        service = InstagramService(run_id=run_id, firestore_service=firestore_service)
+        if log_entry.get('cancel_requested'):
+            service.record_target_result(target_key, 'cancelled')
+            return True
+        completed = service.run_target_scan(request.target_type, request.target_id, run_started_at=log_entry.get('start_time'))
+    except TargetLeaseUnavailableError as e:
+        # A entrega que detém o lease registra o resultado; esta é repetida até
+        # encontrar o alvo concluído ou o lease expirado, sem contar como falha.
+        logging.warning(f"[RUN_ID: {run_id}] - {e} A tarefa será repetida.")
+        return False
+    except Exception as e:
+        logging.critical(f"[RUN_ID: {run_id}] - Uma exceção não tratada ocorreu na tarefa do alvo '{target_key}': {e}", exc_info=True)
+        completed = False
+    if not completed and attempt < max_attempts:
+        logging.warning(f"[RUN_ID: {run_id}] - Alvo '{target_key}' não concluído (tentativa {attempt}/{max_attempts}). A tarefa será repetida.")
+        return False
+    if service:
+        service.record_target_result(target_key, 'completed' if completed else 'failed', service.get_metrics())
+    else:
+        firestore_service.record_scan_task_result(run_id, target_key, 'failed')
+    return True
+
+async def submit_job(job_type: str, fn, run_id: Optional[str] = None) -> JobHandle:
+    """
+    Submete um job ao JobRunner, respondendo 409 se já houver uma execução do
+    mesmo tipo em andamento e 503 se o lock não pôde ser obtido.
+    """
+    try:
+        return await run_in_threadpool(job_runner.submit, job_type, fn, run_id)
+    except JobAlreadyRunningError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "run_id": e.holder_run_id})
+    except JobLockUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
 @app.post("/jobs/start-daily-scan", status_code=202, tags=["Jobs"])
-async def start_daily_scan(background_tasks: BackgroundTasks):
+async def start_daily_scan():
     """
     Endpoint para iniciar a tarefa de varredura diária de perfis e hashtags.
     Este endpoint é projetado para ser acionado pelo Google Cloud Scheduler.
     """
     logging.info("Recebida requisição para iniciar o job de varredura diária.")
-    background_tasks.add_task(run_daily_scan_task)
-    return {"message": "Job de varredura diária iniciado em background."}
+    if SCAN_DISPATCH_MODE == "fanout":
+        unfinished_run_id = await run_in_threadpool(job_runner.firestore_service.get_unfinished_fanout_run, SCAN_FANOUT_MAX_RUN_HOURS)
+        if unfinished_run_id:
+            raise HTTPException(status_code=409, detail={"message": "Já existe uma varredura distribuída em andamento.", "run_id": unfinished_run_id})
+    job = await submit_job("daily_scan", run_daily_scan_task)
+    return {"message": "Job de varredura diária iniciado em background.", "run_id": job.run_id}
+
+@app.post("/jobs/scan-target", tags=["Jobs"])
+async def scan_target(request: ScanTargetRequest, retry_count: int = Header(default=0, alias="X-CloudTasks-TaskRetryCount")):
+    """
+    Endpoint das tarefas da varredura distribuída (SCAN_DISPATCH_MODE=fanout),
+    chamado pelo Cloud Tasks com um alvo por requisição. Responde 503 para
+    que a fila repita a tarefa quando o alvo não pôde ser concluído; o número
+    de tentativas vem do cabeçalho X-CloudTasks-TaskRetryCount.
+    """
+    if not await run_in_threadpool(run_scan_target_task, request, retry_count + 1):
+        raise HTTPException(status_code=503, detail=f"Alvo '{request.target_type}:{request.target_id}' não concluído; a tarefa será repetida.")
+    return {"message": "Tarefa processada.", "run_id": request.run_id}
+
+@app.post("/jobs/resume/{run_id}", status_code=202, tags=["Jobs"])
+async def resume_scan(run_id: str):
+    """
+    Endpoint para retomar uma varredura interrompida (429, falha, cancelamento
+    ou reciclagem da instância) a partir do último checkpoint gravado.
+    Responde 409 se a execução ainda estiver em andamento, nesta instância
+    ou em outra (lock do job não expirado, verificado na submissão).
+    """
+    checkpoint = await run_in_threadpool(job_runner.firestore_service.get_scan_checkpoint, run_id)
+    if not checkpoint:
+        raise HTTPException(status_code=404, detail=f"Nenhum checkpoint encontrado para o run_id '{run_id}'.")
+    if checkpoint.get('status') == 'completed':
+        raise HTTPException(status_code=409, detail=f"A execução '{run_id}' já foi concluída.")
+    job = job_runner.get(run_id)
+    if job is not None and not job.is_finished:
+        raise HTTPException(status_code=409, detail={"message": f"A execução '{run_id}' ainda está em andamento.", "run_id": run_id})
+
+    logging.info(f"Recebida requisição para retomar a varredura '{run_id}'.")
+    await submit_job("daily_scan", functools.partial(run_daily_scan_task, resume=True), run_id=run_id)
+    return {"message": "Retomada da varredura iniciada em background.", "run_id": run_id}
+
+@app.post("/jobs/refresh-engagement", status_code=202, tags=["Jobs"])
+async def refresh_engagement(request: Optional[EngagementRefreshRequest] = None):
+    """
+    Endpoint para atualizar o engajamento (likes e comentários) de posts já
+    coletados, fazendo apenas requisições de metadados. Sem corpo, atualiza
+    os posts publicados nos últimos 7 dias.
+    """
+    request = request or EngagementRefreshRequest()
+    logging.info("Recebida requisição para iniciar o job de atualização de engajamento.")
+    job = await submit_job("engagement_refresh", functools.partial(run_engagement_refresh_task, request=request))
+    return {"message": "Job de atualização de engajamento iniciado em background.", "run_id": job.run_id}
+
+@app.post("/jobs/poll-stories", status_code=202, tags=["Jobs"])
+async def poll_stories(request: Optional[StoryPollRequest] = None):
+    """
+    Endpoint para coletar apenas os stories novos dos perfis monitorados.
+    Projetado para ser acionado pelo Cloud Scheduler a cada poucas horas,
+    dentro da validade de 24h dos stories.
+    """
+    request = request or StoryPollRequest()
+    logging.info("Recebida requisição para iniciar o job de polling de stories.")
+    job = await submit_job("story_poll", functools.partial(run_story_poll_task, request=request))
+    return {"message": "Job de polling de stories iniciado em background.", "run_id": job.run_id}
+
+@app.post("/jobs/enrich-comments", status_code=202, tags=["Jobs"])
+async def enrich_comments(request: Optional[CommentEnrichmentRequest] = None):
+    """
+    Endpoint para enriquecer os autores dos comentários que ficaram com o
+    enriquecimento pendente na varredura (cache miss ou orçamento
+    esgotado). Projetado para ser acionado pelo Cloud Scheduler após a
+    varredura diária.
+    """
+    request = request or CommentEnrichmentRequest()
+    logging.info("Recebida requisição para iniciar o job de enriquecimento de comentários.")
+    job = await submit_job("comment_enrichment", functools.partial(run_comment_enrichment_task, request=request))
+    return {"message": "Job de enriquecimento de comentários iniciado em background.", "run_id": job.run_id}
+
+@app.get("/jobs/{run_id}", tags=["Jobs"])
+async def get_job_status(run_id: str):
+    """
+    Retorna o status e o progresso de uma execução. Jobs desta instância
+    trazem as métricas parciais; os demais, o registro em system_logs.
+    """
+    job = job_runner.get(run_id)
+    # Na varredura distribuída, o job local apenas enfileira os alvos; depois
+    # disso, o andamento vem do registro agregado em system_logs.
+    if job is not None and not (job.is_finished and job.job_type == "daily_scan" and SCAN_DISPATCH_MODE == "fanout"):
+        return job.to_dict()
+
+    log_entry = await run_in_threadpool(job_runner.firestore_service.get_system_log, run_id)
+    if not log_entry:
+        raise HTTPException(status_code=404, detail=f"Execução '{run_id}' não encontrada.")
+    return {
+        "run_id": run_id,
+        "job_type": log_entry.get('job_type'),
+        "status": log_entry.get('status'),
+        "started_at": log_entry.get('start_time'),
+        "finished_at": log_entry.get('end_time'),
+        "error_message": log_entry.get('error_message'),
+        "progress": log_entry.get('metrics'),
+        "fanout": log_entry.get('fanout')
+    }
+
+@app.post("/jobs/{run_id}/cancel", status_code=202, tags=["Jobs"])
+async def cancel_job(run_id: str):
+    """
+    Solicita o cancelamento de uma execução em andamento. A varredura é
+    interrompida no próximo post e pode ser retomada via /jobs/resume/{run_id}.
+    """
+    if not await run_in_threadpool(job_runner.cancel, run_id) and not await run_in_threadpool(job_runner.firestore_service.request_fanout_cancellation, run_id):
+        raise HTTPException(status_code=404, detail=f"Nenhuma execução em andamento com o run_id '{run_id}'.")
+    return {"message": "Cancelamento solicitado.", "run_id": run_id}
+
+def _require_debug_endpoints():
+    # Os endpoints de diagnóstico expõem detalhes internos e são desativados por padrão.
+    if os.getenv("DEBUG_ENDPOINTS_ENABLED", "false").lower() != "true":
+        raise HTTPException(status_code=404, detail="Not Found")
+
+@app.get("/debug/profile", response_class=PlainTextResponse, tags=["Debug"])
+async def debug_profile(
+    seconds: float = Query(default=10, gt=0, le=120, description="Duração da amostragem."),
+    interval_ms: float = Query(default=10, ge=1, le=1000, description="Intervalo entre amostras."),
+    thread_prefix: Optional[str] = Query(default=None, description="Amostra apenas threads com esse prefixo (ex: 'job', 'scan-shard', 'media-transfer').")
+):
+    """
+    Amostra as pilhas das threads da instância (incluindo o job em execução)
+    durante 'seconds' e retorna as pilhas colapsadas, prontas para
+    flamegraph.pl ou speedscope. Requer DEBUG_ENDPOINTS_ENABLED=true.
+    """
+    _require_debug_endpoints()
+    from profiler import SamplingProfiler, ProfilerBusyError
+
+    profiler = SamplingProfiler(interval_seconds=interval_ms / 1000, thread_prefix=thread_prefix)
+    try:
+        return await run_in_threadpool(profiler.run, seconds)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/debug/spans", tags=["Debug"])
+async def debug_spans(limit: int = Query(default=100, ge=0, le=10000), clear: bool = False):
+    """
+    Resumo por nome e os últimos 'limit' spans registrados com TRACING=memory.
+    Requer DEBUG_ENDPOINTS_ENABLED=true.
+    """
+    _require_debug_endpoints()
+    exporter = tracing.get_exporter()
+    if exporter is None:
+        raise HTTPException(status_code=409, detail="Spans em memória indisponíveis; defina TRACING=memory.")
+    spans = exporter.spans()
+    response = {"summary": exporter.summary(), "spans": [span.to_dict() for span in spans[len(spans) - limit:]] if limit else []}
+    if clear:
+        exporter.clear()
+    return response
 
 @app.get("/health", status_code=200, tags=["Monitoring"])
 async def health_check():
     """
     Endpoint de health check para o Google Cloud Run.
-    Verifica a conectividade com o Firestore.
+    Verifica a conectividade com o Firestore com uma leitura leve
+    (clients.check_firestore), com ou sem aquecimento. Enquanto o aquecimento
+    em segundo plano ainda cria o cliente do Firestore, a conexão é
+    informada como 'pending', sem aguardá-lo.
     """
+    if clients.warm_up_state()["status"] == "running" and not clients.is_initialized("firestore"):
+        return {"status": "ok", "firestore_connection": "pending"}
     try:
-        FirestoreService()
+        await run_in_threadpool(clients.check_firestore, HEALTH_CHECK_TIMEOUT_SECONDS, HEALTH_CHECK_CACHE_SECONDS)
         return {"status": "ok", "firestore_connection": "ok"}
     except Exception as e:
         logging.error(f"Health check falhou: {e}")
@@ -0,0 +1,111 @@
+# /search_instagram/media_dedup.py
+from collections import OrderedDict
+from logging_config import logging
+from typing import Optional, Dict, Any, Iterable, Set
+from urllib.parse import urlparse
+import posixpath
+import threading
+
+class MediaDedupCache:
+    """
+    Camada de deduplicação à frente dos uploads de mídia.
+
+    Os objetos no armazenamento são endereçados pelo shortcode/mediaid, e o id
+    do asset na CDN (nome do arquivo na URL) é gravado como metadado
+    'source_asset_id'. Antes de uma transferência, verifica-se um índice local
+    em memória e, em seguida, os metadados do objeto (sem baixar o conteúdo).
+    Se o objeto já existe com o mesmo asset, a transferência é pulada. Com
+    prefetch(), a existência de várias mídias é verificada em lote e as
+    inexistentes dispensam a consulta individual.
+    """
+    ASSET_METADATA_KEY = "source_asset_id"
+
+    def __init__(self, storage_service, max_entries: int = 10000):
+        self.storage_service = storage_service
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._index: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # Objetos confirmados como inexistentes por prefetch(), ainda não consultados.
+        self._missing: Set[str] = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def asset_id_from_url(media_url: str) -> Optional[str]:
+        """
+        Extrai o id do asset da URL da CDN (ex: '123456_789_n.jpg'), que é
+        estável entre execuções, ao contrário dos parâmetros de assinatura.
+        """
+        if not media_url:
+            return None
+        return posixpath.basename(urlparse(media_url).path) or None
+
+    def prefetch(self, gcs_paths: Iterable[str]):
+        """
+        Verifica em lote a existência das mídias que ainda não estão no índice.
+        """
+        with self._lock:
+            pending = [path for path in dict.fromkeys(gcs_paths) if path not in self._index and path not in self._missing]
+        if not pending:
+            return
+        existing = self.storage_service.exists_many(pending)
+        with self._lock:
+            self._missing.update(path for path in pending if path not in existing)
+
+    def lookup(self, gcs_path: str, media_url: str) -> Optional[Dict[str, Any]]:
+        """
+        Retorna o resultado de um upload já existente para a mídia, ou None se
+        ela precisar ser transferida.
+        """
+        asset_id = self.asset_id_from_url(media_url)
+        with self._lock:
+            entry = self._index.get(gcs_path)
+            if entry is not None:
+                self._index.move_to_end(gcs_path)
+            known_missing = entry is None and gcs_path in self._missing
+            self._missing.discard(gcs_path)
+        if entry is None and not known_missing:
+            media_info = self.storage_service.get_media_info(gcs_path)
+            if media_info is not None:
+                entry = {
+                    "gcs_path": media_info['gcs_path'],
+                    "size_bytes": media_info['size_bytes'],
+                    "asset_id": media_info['metadata'].get(self.ASSET_METADATA_KEY)
+                }
+                self._remember(gcs_path, entry)
+
+        # Objetos gravados antes da deduplicação não têm o asset registrado;
+        # como a mídia de um post não muda, são considerados válidos.
+        if entry is not None and (entry['asset_id'] is None or entry['asset_id'] == asset_id):
+            with self._lock:
+                self.hits += 1
+            logging.info(f"Mídia já existente no armazenamento, transferência ignorada: {entry['gcs_path']}")
+            return {"gcs_path": entry['gcs_path'], "size_bytes": entry['size_bytes'], "sha256": None}
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def upload_metadata(self, media_url: str) -> Dict[str, str]:
+        """
+        Metadados a gravar no objeto para permitir a deduplicação futura.
+        """
+        asset_id = self.asset_id_from_url(media_url)
+        return {self.ASSET_METADATA_KEY: asset_id} if asset_id else {}
+
+    def record(self, gcs_path: str, media_url: str, upload_result: Dict[str, Any]):
+        """
+        Registra no índice local uma mídia recém-enviada.
+        """
+        self._remember(gcs_path, {
+            "gcs_path": upload_result['gcs_path'],
+            "size_bytes": upload_result['size_bytes'],
+            "asset_id": self.asset_id_from_url(media_url)
+        })
+
+    def _remember(self, gcs_path: str, entry: Dict[str, Any]):
+        with self._lock:
+            self._index[gcs_path] = entry
+            self._index.move_to_end(gcs_path)
+            while len(self._index) > self.max_entries:
+                self._index.popitem(last=False)
@@ -0,0 +1,259 @@
+# /search_instagram/media_postprocess.py
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+from logging_config import logging
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+import importlib.util
+import multiprocessing
+import posixpath
+import struct
+import threading
+
+def pillow_available() -> bool:
+    return importlib.util.find_spec("PIL") is not None
+
+def thumbnail_path(media_path: str) -> str:
+    """
+    Caminho da miniatura, ao lado da mídia original
+    (ex: '.../ABC123.mp4' -> '.../ABC123.thumb.jpg').
+    """
+    return posixpath.splitext(media_path)[0] + ".thumb.jpg"
+
+def _dhash(image) -> str:
+    """
+    Hash perceptual de 64 bits (dHash): compara o brilho de pixels vizinhos
+    na imagem reduzida a 9x8 em tons de cinza. Imagens visualmente iguais
+    (recompressões, redimensionamentos) têm hashes a poucos bits de distância.
+    """
+    from PIL import Image
+
+    pixels = image.convert('L').resize((9, 8), Image.Resampling.LANCZOS).tobytes()
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+def analyze_image(data: bytes, thumbnail_size: int, thumbnail_quality: int) -> Dict[str, Any]:
+    """
+    Executada nos processos do pool: dimensões, dHash e miniatura JPEG de uma
+    imagem. Em JPEGs, a decodificação já é feita em escala reduzida (draft).
+    """
+    from PIL import Image
+
+    with Image.open(BytesIO(data)) as image:
+        width, height = image.size
+        image.draft('RGB', (thumbnail_size, thumbnail_size))
+        thumbnail = image.convert('RGB')
+    thumbnail.thumbnail((thumbnail_size, thumbnail_size))
+    buffer = BytesIO()
+    thumbnail.save(buffer, 'JPEG', quality=thumbnail_quality, optimize=True)
+    return {"width": width, "height": height, "dhash": _dhash(thumbnail), "thumbnail": buffer.getvalue()}
+
+def _read_box_header(data: bytes, offset: int, end: int) -> Optional[Tuple[bytes, int, int]]:
+    """
+    Lê o cabeçalho de uma caixa MP4 (ISO BMFF) em 'offset'.
+
+    Returns:
+        Tupla (tipo, tamanho do cabeçalho, tamanho da caixa), ou None se o
+        cabeçalho estiver incompleto ou inválido. Tamanho 0 vai até 'end'.
+    """
+    if offset + 8 > len(data):
+        return None
+    box_size, box_type = struct.unpack_from(">I4s", data, offset)
+    header_size = 8
+    if box_size == 1:
+        if offset + 16 > len(data):
+            return None
+        box_size = struct.unpack_from(">Q", data, offset + 8)[0]
+        header_size = 16
+    elif box_size == 0:
+        box_size = end - offset
+    if box_size < header_size:
+        return None
+    return box_type, header_size, box_size
+
+def _iter_boxes(data: bytes, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    offset = start
+    while offset < end:
+        header = _read_box_header(data, offset, end)
+        if header is None:
+            return
+        box_type, header_size, box_size = header
+        yield box_type, offset + header_size, min(offset + box_size, end)
+        offset += box_size
+
+def parse_mp4_moov(moov: bytes) -> Dict[str, Any]:
+    """
+    Extrai a duração (caixa 'mvhd') e as dimensões da primeira trilha de
+    vídeo (caixa 'tkhd') do conteúdo de uma caixa 'moov'.
+    """
+    info: Dict[str, Any] = {}
+    for box_type, start, end in _iter_boxes(moov, 0, len(moov)):
+        if box_type == b'mvhd' and end - start >= 32:
+            if moov[start] == 1:
+                timescale, duration = struct.unpack_from(">IQ", moov, start + 20)
+            else:
+                timescale, duration = struct.unpack_from(">II", moov, start + 12)
+            if timescale:
+                info["duration_seconds"] = round(duration / timescale, 3)
+        elif box_type == b'trak' and "width" not in info:
+            for child_type, child_start, child_end in _iter_boxes(moov, start, end):
+                # Largura e altura ocupam os últimos 8 bytes do 'tkhd', em ponto fixo 16.16.
+                if child_type == b'tkhd' and child_end - child_start >= 84:
+                    width, height = struct.unpack_from(">II", moov, child_end - 8)
+                    if width and height:
+                        info["width"], info["height"] = width >> 16, height >> 16
+    return info
+
+class MediaPostProcessor:
+    """
+    Pós-processamento das mídias já transferidas: miniatura JPEG, hash
+    perceptual (dHash), dimensões, duração dos vídeos e tamanho em bytes,
+    para que os consumidores não precisem baixar as mídias originais para
+    gerar prévias ou comparar imagens.
+
+    A decodificação e o redimensionamento das imagens rodam em um
+    ProcessPoolExecutor, fora do GIL e das threads de coleta. As leituras e
+    gravações (armazenamento e CDN) ficam em threads próprias, com fila
+    limitada como a do MediaTransferPool: quando está cheia, submit()
+    bloqueia (backpressure).
+
+    Imagens são lidas do armazenamento. Em vídeos, a duração e as dimensões
+    vêm dos cabeçalhos do MP4 (caixa 'moov', lida por faixas de bytes) e a
+    miniatura, da imagem de capa do post/story na CDN.
+
+    Requer o pacote opcional 'Pillow'.
+    """
+    # Caixas de nível superior percorridas em busca da 'moov'.
+    MAX_MP4_BOXES = 32
+
+    def __init__(self, storage_service, instagram_backend, workers: int = 2, max_queue_size: int = 32,
+                 thumbnail_size: int = 320, thumbnail_quality: int = 75, max_source_bytes: int = 20 * 1024 * 1024, metrics=None):
+        """
+        Args:
+            workers: Número de processos (e de threads de E/S) do pool.
+            max_queue_size: Número de mídias aguardando um worker livre.
+            thumbnail_size: Maior lado da miniatura, em pixels.
+            max_source_bytes: Tamanho máximo das imagens e da caixa 'moov' lidas.
+        """
+        self.storage_service = storage_service
+        self.instagram_backend = instagram_backend
+        self.thumbnail_size = thumbnail_size
+        self.thumbnail_quality = thumbnail_quality
+        self.max_source_bytes = max_source_bytes
+        self.metrics = metrics
+        # 'spawn' evita herdar, com fork, locks de threads do processo principal.
+        self._processes = ProcessPoolExecutor(max_workers=max(1, workers), mp_context=multiprocessing.get_context("spawn"))
+        self._threads = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="media-postprocess")
+        self._slots = threading.BoundedSemaphore(max(1, workers) + max_queue_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def submit(self, media_path: str, size_bytes: int, is_video: bool, cover_url: Optional[str], on_complete: Callable[[Optional[Dict[str, Any]]], None]):
+        """
+        Enfileira o pós-processamento de uma mídia. 'on_complete' é chamado
+        na thread do worker com os campos a gravar no documento (ou None em
+        caso de erro).
+
+        Args:
+            media_path: Caminho da mídia no armazenamento.
+            cover_url: URL da imagem de capa, usada na miniatura de vídeos.
+        """
+        self._slots.acquire()
+        try:
+            self._threads.submit(self._run, media_path, size_bytes, is_video, cover_url, on_complete)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _run(self, media_path: str, size_bytes: int, is_video: bool, cover_url: Optional[str], on_complete: Callable[[Optional[Dict[str, Any]]], None]):
+        fields = None
+        try:
+            if self.metrics:
+                with self.metrics.timed('media_postprocess'):
+                    fields = self.process(media_path, size_bytes, is_video, cover_url)
+            else:
+                fields = self.process(media_path, size_bytes, is_video, cover_url)
+        except Exception as e:
+            logging.warning(f"Erro no pós-processamento da mídia {media_path}: {e}")
+        finally:
+            self._slots.release()
+        try:
+            on_complete(fields)
+        except Exception as e:
+            logging.error(f"Erro ao registrar o pós-processamento de {media_path}: {e}")
+
+    def process(self, media_path: str, size_bytes: int, is_video: bool, cover_url: Optional[str]) -> Dict[str, Any]:
+        """
+        Processa uma mídia de forma síncrona (a análise da imagem ainda roda
+        no pool de processos).
+
+        Returns:
+            Campos 'media_width', 'media_height', 'media_dhash',
+            'media_thumbnail_path', 'media_duration_seconds' (vídeos) e
+            'media_postprocess_status' ('done' ou 'skipped', quando não há
+            imagem a analisar dentro do limite de tamanho).
+        """
+        fields: Dict[str, Any] = {}
+        if is_video:
+            moov = self._read_mp4_moov(media_path, size_bytes)
+            info = parse_mp4_moov(moov) if moov else {}
+            if "duration_seconds" in info:
+                fields["media_duration_seconds"] = info["duration_seconds"]
+            if "width" in info:
+                fields["media_width"], fields["media_height"] = info["width"], info["height"]
+            image_data = self._download_cover(cover_url) if cover_url else None
+        else:
+            image_data = self.storage_service.download_bytes(media_path) if size_bytes <= self.max_source_bytes else None
+
+        if image_data:
+            analysis = self._processes.submit(analyze_image, image_data, self.thumbnail_size, self.thumbnail_quality).result()
+            fields.setdefault("media_width", analysis["width"])
+            fields.setdefault("media_height", analysis["height"])
+            fields["media_dhash"] = analysis["dhash"]
+            fields["media_thumbnail_path"] = self.storage_service.upload_bytes(analysis["thumbnail"], thumbnail_path(media_path), 'image/jpeg')
+        fields["media_postprocess_status"] = "done" if image_data else "skipped"
+        return fields
+
+    def _download_cover(self, cover_url: str) -> Optional[bytes]:
+        with self.instagram_backend.open_media(cover_url) as (stream, size):
+            if size is not None and size > self.max_source_bytes:
+                return None
+            data = stream.read(self.max_source_bytes + 1)
+        return data if len(data) <= self.max_source_bytes else None
+
+    def _read_mp4_moov(self, media_path: str, size_bytes: int) -> Optional[bytes]:
+        """
+        Localiza a caixa 'moov' percorrendo os cabeçalhos de nível superior
+        com leituras de 16 bytes e lê apenas o seu conteúdo. Funciona com a
+        'moov' no início (faststart) ou após os dados ('mdat').
+        """
+        offset = 0
+        for _ in range(self.MAX_MP4_BOXES):
+            if offset + 8 > size_bytes:
+                return None
+            data = self.storage_service.read_media_range(media_path, offset, min(offset + 16, size_bytes))
+            header = _read_box_header(data, 0, size_bytes - offset) if data else None
+            if header is None:
+                return None
+            box_type, header_size, box_size = header
+            if box_type == b'moov':
+                if box_size > self.max_source_bytes:
+                    return None
+                return self.storage_service.read_media_range(media_path, offset + header_size, offset + box_size)
+            offset += box_size
+        return None
+
+    def close(self):
+        """
+        Aguarda a conclusão dos pós-processamentos enfileirados.
+        """
+        self._threads.shutdown(wait=True)
+        self._processes.shutdown(wait=True)
+        logging.info("Pós-processamentos de mídia pendentes concluídos.")
@@ -0,0 +1,66 @@
+# /search_instagram/media_transfer.py
+from concurrent.futures import ThreadPoolExecutor
+from logging_config import logging
+from typing import Callable, Optional, Any
+import threading
+
+class MediaTransferPool:
+    """
+    Pool limitado de workers para a transferência de mídias (CDN -> GCS),
+    desacoplado do loop de coleta de metadados.
+
+    O loop de coleta enfileira transferências com submit() e segue para o
+    próximo post; apenas as chamadas ao Instagram permanecem serializadas.
+    A fila tem capacidade limitada: quando está cheia, submit() bloqueia até
+    que um worker conclua uma transferência (backpressure).
+    """
+    def __init__(self, transfer_fn: Callable[[str, str], Any], max_workers: int = 4, max_queue_size: int = 16):
+        """
+        Args:
+            transfer_fn: Função que recebe (media_url, gcs_path) e realiza a transferência.
+            max_workers: Número de transferências simultâneas.
+            max_queue_size: Número de transferências aguardando um worker livre.
+        """
+        self.transfer_fn = transfer_fn
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="media-transfer")
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def submit(self, media_url: str, gcs_path: str, on_complete: Callable[[Optional[Any]], None]):
+        """
+        Enfileira uma transferência. 'on_complete' é chamado na thread do
+        worker com o resultado de 'transfer_fn' (ou None em caso de erro).
+        """
+        self._slots.acquire()
+        try:
+            self._executor.submit(self._run, media_url, gcs_path, on_complete)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _run(self, media_url: str, gcs_path: str, on_complete: Callable[[Optional[Any]], None]):
+        result = None
+        try:
+            result = self.transfer_fn(media_url, gcs_path)
+        except Exception as e:
+            logging.error(f"Erro inesperado na transferência da mídia para {gcs_path}: {e}")
+        finally:
+            self._slots.release()
+        try:
+            on_complete(result)
+        except Exception as e:
+            logging.error(f"Erro ao registrar o resultado da transferência de {gcs_path}: {e}")
+
+    def close(self):
+        """
+        Aguarda a conclusão de todas as transferências enfileiradas.
+        """
+        self._executor.shutdown(wait=True)
+        logging.info("Transferências de mídia pendentes concluídas.")
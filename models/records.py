@@ -0,0 +1,265 @@
+# /search_instagram/models/records.py
+# Registros tipados dos dados coletados (posts, comentários e stories) e dos
+# alvos monitorados.
+#
+# Os registros são validados uma única vez, na fronteira em que os dados
+# entram no serviço (objetos do Instaloader ou documentos do Firestore), e
+# convertidos diretamente para o payload do Firestore e para a linha da
+# exportação. As classes usam __slots__ (dataclass(slots=True)): cada
+# instância ocupa bem menos memória que um dict e não há dicionários
+# intermediários entre a coleta e a escrita.
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, ClassVar, Dict, Optional, Tuple
+
+class RecordValidationError(ValueError):
+    """
+    Lançada quando um dado recebido não pode ser convertido em registro.
+    """
+    pass
+
+def _required(value: Any, name: str) -> Any:
+    if value is None or value == '':
+        raise RecordValidationError(f"Campo obrigatório ausente: '{name}'.")
+    return value
+
+def _optional_int(value: Any, name: str) -> Optional[int]:
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise RecordValidationError(f"Valor inválido para '{name}': {value!r}.")
+
+def _optional_float(value: Any, name: str) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise RecordValidationError(f"Valor inválido para '{name}': {value!r}.")
+
+def _datetime(value: Any, name: str) -> datetime:
+    if not isinstance(value, datetime):
+        raise RecordValidationError(f"Data inválida para '{name}': {value!r}.")
+    return value
+
+def _optional_utc(value: Any, name: str) -> Optional[datetime]:
+    """
+    Datas do Firestore vêm com timezone e as do Instaloader, em UTC "naive";
+    ambas são normalizadas para UTC com timezone.
+    """
+    if value is None:
+        return None
+    value = _datetime(value, name)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+@dataclass(slots=True)
+class PostRecord:
+    """
+    Post coletado, salvo em 'instagram_posts/{shortcode}'.
+    """
+    shortcode: str
+    owner_username: str
+    caption: Optional[str]
+    post_date_utc: datetime
+    likes_count: Optional[int]
+    comments_count: Optional[int]
+    media_type: str
+    is_video: bool
+    media_url: Optional[str]
+    collected_at: datetime
+    # Imagem de capa dos vídeos (thumbnail do Instagram), sem requisição adicional.
+    cover_url: Optional[str] = None
+    collected_from_hashtag: Optional[str] = None
+    nlp_status: str = "pending"
+
+    @classmethod
+    def from_instaloader(cls, post, collected_at: datetime, from_hashtag: Optional[str] = None) -> "PostRecord":
+        is_video = bool(post.is_video)
+        return cls(
+            shortcode=_required(post.shortcode, 'shortcode'),
+            owner_username=_required(post.owner_username, 'owner_username'),
+            caption=post.caption,
+            post_date_utc=_datetime(post.date_utc, 'post_date_utc'),
+            likes_count=_optional_int(post.likes, 'likes_count'),
+            comments_count=_optional_int(post.comments, 'comments_count'),
+            media_type=post.typename,
+            is_video=is_video,
+            media_url=post.video_url if is_video else post.url,
+            collected_at=collected_at,
+            cover_url=post.url if is_video else None,
+            collected_from_hashtag=from_hashtag
+        )
+
+    @property
+    def media_path(self) -> str:
+        file_extension = '.mp4' if self.is_video else '.jpg'
+        return f"instagram/posts/{self.owner_username}/{self.post_date_utc.strftime('%Y-%m')}/{self.shortcode}{file_extension}"
+
+    def to_firestore(self) -> Dict[str, Any]:
+        return {
+            "owner_username": self.owner_username,
+            "caption": self.caption,
+            "post_date_utc": self.post_date_utc,
+            "likes_count": self.likes_count,
+            "comments_count": self.comments_count,
+            "media_type": self.media_type,
+            "collected_from_hashtag": self.collected_from_hashtag,
+            "nlp_status": self.nlp_status,
+            "collected_at": self.collected_at
+        }
+
+    def to_export_row(self, gcs_media_uri: str) -> Dict[str, Any]:
+        row = self.to_firestore()
+        row["gcs_media_path"] = gcs_media_uri
+        return row
+
+@dataclass(slots=True)
+class CommentRecord:
+    """
+    Comentário de um post, salvo em
+    'instagram_posts/{shortcode}/instagram_comments/{id}'. 'owner_fields'
+    guarda o enriquecimento do autor (user_followers, ...,
+    user_enrichment_status).
+    """
+    comment_id: str
+    post_shortcode: str
+    text: Optional[str]
+    username: str
+    user_id: str
+    likes_count: Optional[int]
+    comment_date_utc: datetime
+    collected_at: datetime
+    owner_fields: Dict[str, Any] = field(default_factory=dict)
+    nlp_status: str = "pending"
+
+    @classmethod
+    def from_instaloader(cls, comment, post_shortcode: str, collected_at: datetime, owner_fields: Dict[str, Any]) -> "CommentRecord":
+        owner = comment.owner
+        return cls(
+            comment_id=str(_required(comment.id, 'id')),
+            post_shortcode=post_shortcode,
+            text=comment.text,
+            username=_required(owner.username, 'username'),
+            user_id=str(_required(owner.userid, 'user_id')),
+            likes_count=_optional_int(comment.likes_count, 'likes_count'),
+            comment_date_utc=_datetime(comment.created_at_utc, 'comment_date_utc'),
+            collected_at=collected_at,
+            owner_fields=owner_fields
+        )
+
+    def to_firestore(self) -> Dict[str, Any]:
+        return {
+            "post_shortcode": self.post_shortcode,
+            "text": self.text,
+            "username": self.username,
+            "user_id": self.user_id,
+            "likes_count": self.likes_count,
+            "comment_date_utc": self.comment_date_utc,
+            "nlp_status": self.nlp_status,
+            **self.owner_fields,
+            "collected_at": self.collected_at
+        }
+
+    def to_export_row(self) -> Dict[str, Any]:
+        return self.to_firestore()
+
+@dataclass(slots=True)
+class StoryRecord:
+    """
+    Story coletado, salvo em 'instagram_stories/{mediaid}'.
+    """
+    media_id: str
+    owner_username: str
+    story_date_utc: datetime
+    is_video: bool
+    media_url: Optional[str]
+    collected_at: datetime
+    cover_url: Optional[str] = None
+
+    # Validade de um story no Instagram.
+    LIFETIME: ClassVar[timedelta] = timedelta(hours=24)
+
+    @classmethod
+    def from_instaloader(cls, story, owner_username: str, collected_at: datetime) -> "StoryRecord":
+        is_video = bool(story.is_video)
+        return cls(
+            media_id=str(_required(story.mediaid, 'mediaid')),
+            owner_username=_required(owner_username, 'owner_username'),
+            story_date_utc=_datetime(story.date_utc, 'story_date_utc'),
+            is_video=is_video,
+            media_url=story.video_url if is_video else story.url,
+            collected_at=collected_at,
+            cover_url=story.url if is_video else None
+        )
+
+    def to_firestore(self) -> Dict[str, Any]:
+        return {
+            "owner_username": self.owner_username,
+            "story_date_utc": self.story_date_utc,
+            "expires_at_utc": self.story_date_utc + self.LIFETIME,
+            "media_type": "video" if self.is_video else "image",
+            "collected_at": self.collected_at
+        }
+
+    def to_export_row(self, gcs_media_uri: str) -> Dict[str, Any]:
+        row = self.to_firestore()
+        row["gcs_media_path"] = gcs_media_uri
+        return row
+
+@dataclass(slots=True)
+class MonitoredTarget:
+    """
+    Perfil ou hashtag monitorado, lido de 'monitored_profiles' ou
+    'monitored_hashtags'. As datas são normalizadas para UTC com timezone e
+    os campos numéricos convertidos na leitura, de modo que o planejador e a
+    varredura não precisam repetir a validação.
+    """
+    # Coleção e campo de ID de cada tipo de alvo.
+    COLLECTIONS: ClassVar[Dict[str, Tuple[str, str]]] = {
+        "profile": ("monitored_profiles", "instagram_username"),
+        "hashtag": ("monitored_hashtags", "hashtag_sem_cerquilha")
+    }
+
+    kind: str
+    name: str
+    priority: float = 1.0
+    last_scanned_at: Optional[datetime] = None
+    # Início da execução que varreu o alvo pela última vez.
+    last_scan_run_started_at: Optional[datetime] = None
+    last_post_shortcode: Optional[str] = None
+    last_post_date_utc: Optional[datetime] = None
+    avg_posts_per_day: Optional[float] = None
+    avg_requests_per_scan: Optional[float] = None
+    instagram_userid: Optional[int] = None
+    poll_stories: bool = True
+    last_stories_polled_at: Optional[datetime] = None
+
+    @classmethod
+    def from_firestore(cls, kind: str, doc_id: str, data: Dict[str, Any]) -> "MonitoredTarget":
+        if kind not in cls.COLLECTIONS:
+            raise RecordValidationError(f"Tipo de alvo desconhecido: '{kind}'.")
+        # Prioridade 0 é um valor válido (a menor), distinto do campo ausente.
+        priority = data.get('priority')
+        return cls(
+            kind=kind,
+            name=_required(doc_id, cls.COLLECTIONS[kind][1]),
+            priority=1.0 if priority is None else _optional_float(priority, 'priority'),
+            last_scanned_at=_optional_utc(data.get('last_scanned_at'), 'last_scanned_at'),
+            last_scan_run_started_at=_optional_utc(data.get('last_scan_run_started_at'), 'last_scan_run_started_at'),
+            last_post_shortcode=data.get('last_post_shortcode'),
+            last_post_date_utc=_optional_utc(data.get('last_post_date_utc'), 'last_post_date_utc'),
+            avg_posts_per_day=_optional_float(data.get('avg_posts_per_day'), 'avg_posts_per_day'),
+            avg_requests_per_scan=_optional_float(data.get('avg_requests_per_scan'), 'avg_requests_per_scan'),
+            instagram_userid=_optional_int(data.get('instagram_userid'), 'instagram_userid'),
+            poll_stories=bool(data.get('poll_stories', True)),
+            last_stories_polled_at=_optional_utc(data.get('last_stories_polled_at'), 'last_stories_polled_at')
+        )
+
+    @property
+    def collection(self) -> str:
+        return self.COLLECTIONS[self.kind][0]
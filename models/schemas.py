@@ -1,20 +1,39 @@
-# Este arquivo conterá os schemas Pydantic para validação de dados.
+# /search_instagram/models/schemas.py
+# Schemas Pydantic para validação dos dados recebidos pela API.
 
-# Exemplo da estrutura futura:
-#
-# from pydantic import BaseModel
-# from datetime import datetime
-# from typing import Optional
-#
-# class InstagramPost(BaseModel):
-#     shortcode: str
-#     owner_username: str
-#     caption: Optional[str] = None
-#     post_date_utc: datetime
-#     likes_count: int
-#     comments_count: int
-#     media_type: str
-#     gcs_media_path: str
-#     collected_at: datetime
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
 
-pass
+class EngagementRefreshRequest(BaseModel):
+    """
+    Parâmetros do job de atualização de engajamento. Se 'shortcodes' não for
+    informado, são atualizados os posts publicados nos últimos 'days' dias.
+    """
+    shortcodes: Optional[List[str]] = Field(default=None, description="Shortcodes dos posts a atualizar.")
+    days: int = Field(default=7, ge=1, le=90, description="Janela de publicação dos posts, em dias.")
+    limit: int = Field(default=10000, ge=1, le=50000, description="Número máximo de posts atualizados.")
+
+class StoryPollRequest(BaseModel):
+    """
+    Parâmetros do job de polling de stories. Se 'usernames' não for
+    informado, são consultados os perfis monitorados ativos, dos mais
+    prioritários para os menos.
+    """
+    usernames: Optional[List[str]] = Field(default=None, description="Perfis a consultar.")
+    limit: int = Field(default=500, ge=1, le=5000, description="Número máximo de perfis consultados.")
+
+class CommentEnrichmentRequest(BaseModel):
+    """
+    Parâmetros do job de enriquecimento dos autores de comentários
+    pendentes ('user_enrichment_status' == 'pending').
+    """
+    limit: int = Field(default=5000, ge=1, le=50000, description="Número máximo de comentários pendentes lidos.")
+
+class ScanTargetRequest(BaseModel):
+    """
+    Tarefa da varredura distribuída: um único alvo de uma execução,
+    enfileirada pelo coordenador de /jobs/start-daily-scan.
+    """
+    run_id: str = Field(description="Execução à qual o alvo pertence.")
+    target_type: Literal["profile", "hashtag"] = Field(description="Tipo do alvo.")
+    target_id: str = Field(description="Username do perfil ou hashtag sem cerquilha.")
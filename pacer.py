@@ -0,0 +1,191 @@
+# /search_instagram/pacer.py
+from logging_config import logging
+from typing import Optional, Dict, Any, Callable
+import instaloader
+import os
+import random
+import threading
+import time
+
+class AdaptivePacer:
+    """
+    Controle de cadência adaptativo para as requisições de uma conta.
+
+    Combina um token bucket, que define quantas requisições por minuto podem
+    ser feitas, com um ajuste AIMD da taxa: cada resposta saudável aumenta a
+    taxa de forma aditiva, enquanto respostas 429 ou 5xx a reduzem de forma
+    multiplicativa e impõem um backoff exponencial. Assim o tempo de espera
+    acompanha o orçamento de requisições observado, em vez de pausas fixas.
+    """
+    def __init__(self,
+                 rate_per_minute: float = 20.0,
+                 min_rate_per_minute: float = 2.0,
+                 max_rate_per_minute: float = 60.0,
+                 burst: float = 5.0,
+                 increase_per_success: float = 0.1,
+                 decrease_factor: float = 0.5,
+                 backoff_base_seconds: float = 60.0,
+                 backoff_max_seconds: float = 1800.0,
+                 server_error_backoff_seconds: float = 5.0,
+                 jitter: float = 0.3,
+                 sleep_fn: Callable[[float], Any] = time.sleep):
+        self.rate_per_minute = rate_per_minute
+        self.min_rate_per_minute = min_rate_per_minute
+        self.max_rate_per_minute = max_rate_per_minute
+        self.burst = burst
+        self.increase_per_success = increase_per_success
+        self.decrease_factor = decrease_factor
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.server_error_backoff_seconds = server_error_backoff_seconds
+        self.jitter = jitter
+        self.sleep_fn = sleep_fn
+        self.consecutive_throttles = 0
+        self._tokens = burst
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "successes": 0, "throttles": 0, "server_errors": 0, "wait_seconds": 0.0, "backoff_seconds": 0.0}
+
+    @classmethod
+    def from_config(cls, overrides: Optional[Dict[str, Any]] = None, **kwargs) -> "AdaptivePacer":
+        """
+        Cria um pacer com os valores das variáveis de ambiente PACER_*,
+        sobrescritos pela configuração da conta de serviço (campo 'pacer').
+        """
+        config = {
+            "rate_per_minute": float(os.getenv("PACER_RATE_PER_MINUTE", "20")),
+            "min_rate_per_minute": float(os.getenv("PACER_MIN_RATE_PER_MINUTE", "2")),
+            "max_rate_per_minute": float(os.getenv("PACER_MAX_RATE_PER_MINUTE", "60")),
+            "burst": float(os.getenv("PACER_BURST", "5")),
+            "backoff_base_seconds": float(os.getenv("PACER_BACKOFF_BASE_SECONDS", "60")),
+            "backoff_max_seconds": float(os.getenv("PACER_BACKOFF_MAX_SECONDS", "1800")),
+        }
+        for key, value in (overrides or {}).items():
+            if key in config:
+                config[key] = float(value)
+        config.update(kwargs)
+        return cls(**config)
+
+    def _jittered(self, seconds: float) -> float:
+        return seconds * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate_per_minute / 60)
+        self._last_refill = now
+
+    def acquire(self, cost: float = 1.0) -> float:
+        """
+        Consome 'cost' tokens, aguardando o tempo necessário se o bucket
+        estiver vazio.
+
+        Returns:
+            O tempo aguardado, em segundos.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= cost
+            wait = 0.0 if self._tokens >= 0 else self._jittered(-self._tokens * 60 / self.rate_per_minute)
+            self._stats["wait_seconds"] += wait
+        if wait > 0:
+            self.sleep_fn(wait)
+        return wait
+
+    def on_request(self):
+        with self._lock:
+            self._stats["requests"] += 1
+
+    def on_success(self):
+        """
+        Resposta saudável: aumento aditivo da taxa.
+        """
+        with self._lock:
+            self._stats["successes"] += 1
+            self.consecutive_throttles = 0
+            self.rate_per_minute = min(self.max_rate_per_minute, self.rate_per_minute + self.increase_per_success)
+
+    def _decrease(self):
+        self.rate_per_minute = max(self.min_rate_per_minute, self.rate_per_minute * self.decrease_factor)
+        self._tokens = min(self._tokens, 0.0)
+
+    def on_throttle(self) -> float:
+        """
+        Resposta 429 ou TooManyRequestsException: redução multiplicativa da
+        taxa e backoff exponencial, que dobra a cada bloqueio consecutivo.
+
+        Returns:
+            O tempo de backoff aguardado, em segundos.
+        """
+        with self._lock:
+            self._stats["throttles"] += 1
+            self.consecutive_throttles += 1
+            self._decrease()
+            backoff = self._jittered(min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** (self.consecutive_throttles - 1)))
+            self._stats["backoff_seconds"] += backoff
+        logging.warning(f"Limite de requisições atingido. Nova taxa: {self.rate_per_minute:.1f}/min. Aguardando {backoff:.0f}s.")
+        self.sleep_fn(backoff)
+        return backoff
+
+    def on_server_error(self):
+        """
+        Resposta 5xx: redução multiplicativa da taxa e um backoff curto.
+        """
+        with self._lock:
+            self._stats["server_errors"] += 1
+            self._decrease()
+            backoff = self._jittered(self.server_error_backoff_seconds)
+            self._stats["backoff_seconds"] += backoff
+        self.sleep_fn(backoff)
+
+    def observe_response(self, response, *args, **kwargs):
+        """
+        Hook de resposta do requests.Session usado pelo Instaloader. As
+        respostas 429 são tratadas em PacedRateController.handle_429.
+        """
+        if response.status_code >= 500:
+            self.on_server_error()
+        elif response.status_code < 400:
+            self.on_success()
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Decisões do pacer, no formato exportado para as métricas da execução.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["wait_seconds"] = round(stats["wait_seconds"], 3)
+            stats["backoff_seconds"] = round(stats["backoff_seconds"], 3)
+            stats["rate_per_minute"] = round(self.rate_per_minute, 2)
+        return stats
+
+class PacedRateController(instaloader.RateController):
+    """
+    RateController do Instaloader que consome um token do AdaptivePacer antes
+    de cada requisição e, em respostas 429, aplica o backoff exponencial do
+    pacer no lugar da espera fixa do Instaloader. É o único ponto que
+    registra o 429 no pacer: quem recebe o TooManyRequestsException não deve
+    chamar on_throttle de novo. Os limites de janela deslizante do
+    Instaloader continuam valendo como teto de segurança.
+    """
+    def __init__(self, context: instaloader.InstaloaderContext, pacer: AdaptivePacer, metrics=None):
+        super().__init__(context)
+        self._pacer = pacer
+        self._metrics = metrics
+
+    def sleep(self, secs: float):
+        if self._metrics:
+            self._metrics.add_time('rate_limit_wait', secs)
+        super().sleep(secs)
+
+    def wait_before_query(self, query_type: str) -> None:
+        waited = self._pacer.acquire()
+        if self._metrics and waited:
+            self._metrics.add_time('pacer_wait', waited)
+        self._pacer.on_request()
+        super().wait_before_query(query_type)
+
+    def handle_429(self, query_type: str) -> None:
+        if self._metrics:
+            self._metrics.increment('rate_limit_429')
+        self._pacer.on_throttle()
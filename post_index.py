@@ -0,0 +1,276 @@
+# /search_instagram/post_index.py
+from logging_config import logging
+from typing import Iterable, List, Optional, Dict, Set, Tuple
+import hashlib
+import math
+import struct
+import threading
+import zlib
+
+class BloomFilter:
+    """
+    Filtro de Bloom sobre um bytearray, com k posições derivadas de um único
+    hash BLAKE2b (hashing duplo). Dois filtros com os mesmos parâmetros são
+    combinados por um OU bit a bit, o que permite mesclar o índice gravado
+    por outra execução sem perder entradas.
+    """
+    MAGIC = b"PIDX1"
+    HEADER = struct.Struct(">QIQ")
+
+    def __init__(self, bit_count: int, hash_count: int, bits: Optional[bytearray] = None, item_count: int = 0):
+        self.bit_count = bit_count
+        self.hash_count = hash_count
+        self.bits = bits if bits is not None else bytearray((bit_count + 7) // 8)
+        self.item_count = item_count
+
+    @classmethod
+    def for_capacity(cls, capacity: int, false_positive_rate: float) -> "BloomFilter":
+        """
+        Dimensiona o filtro para 'capacity' itens com a taxa de falsos
+        positivos informada (ex: 1 milhão de posts a 0,1% ocupa ~1,8 MiB).
+        """
+        bit_count = max(8, int(math.ceil(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2))))
+        hash_count = max(1, int(round(bit_count / capacity * math.log(2))))
+        return cls(bit_count, hash_count)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first, second = struct.unpack(">QQ", digest)
+        for index in range(self.hash_count):
+            yield (first + index * second) % self.bit_count
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.item_count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def same_shape(self, other: "BloomFilter") -> bool:
+        return self.bit_count == other.bit_count and self.hash_count == other.hash_count
+
+    def merge(self, other: "BloomFilter"):
+        """
+        Acrescenta as entradas de outro filtro com os mesmos parâmetros.
+        """
+        merged = int.from_bytes(self.bits, 'big') | int.from_bytes(other.bits, 'big')
+        self.bits = bytearray(merged.to_bytes(len(self.bits), 'big'))
+        self.item_count = self.estimated_items()
+
+    def estimated_items(self) -> int:
+        """
+        Estimativa do número de itens a partir dos bits ligados (após mesclas,
+        a soma das contagens superestimaria as entradas em comum).
+        """
+        set_bits = int.from_bytes(self.bits, 'big').bit_count()
+        if set_bits >= self.bit_count:
+            return self.item_count
+        return int(round(-self.bit_count / self.hash_count * math.log(1 - set_bits / self.bit_count)))
+
+    def to_bytes(self) -> bytes:
+        return self.MAGIC + self.HEADER.pack(self.bit_count, self.hash_count, self.item_count) + zlib.compress(bytes(self.bits), 6)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BloomFilter":
+        if not data.startswith(cls.MAGIC):
+            raise ValueError("Formato de índice de posts desconhecido.")
+        offset = len(cls.MAGIC)
+        bit_count, hash_count, item_count = cls.HEADER.unpack_from(data, offset)
+        bits = bytearray(zlib.decompress(data[offset + cls.HEADER.size:]))
+        if len(bits) != (bit_count + 7) // 8:
+            raise ValueError("Índice de posts corrompido.")
+        return cls(bit_count, hash_count, bits, item_count)
+
+# Índice carregado uma vez por processo e por execução na varredura
+# distribuída, compartilhado (somente leitura) pelas tarefas da instância.
+_process_blooms: Dict[str, Tuple[str, BloomFilter]] = {}
+_process_blooms_lock = threading.Lock()
+
+class PostIndex:
+    """
+    Índice dos posts já processados, compartilhado pelas varreduras de perfis
+    e hashtags (e pelas shards) de uma execução.
+
+    Um post aparece em mais de uma fonte quando o perfil monitorado usa uma
+    hashtag monitorada, e posts em alta aparecem em várias hashtags. claim()
+    reserva o shortcode antes de qualquer requisição de comentários ou mídia:
+    apenas a primeira fonte processa o post, e as demais registram só a
+    hashtag de origem, gravada ao final com ArrayUnion em
+    'collected_from_hashtags'.
+
+    Entre execuções, os shortcodes ficam em um filtro de Bloom gravado no
+    armazenamento ('storage_path'), carregado no início e mesclado com a
+    versão atual ao salvar. Como o filtro admite falsos positivos, um
+    shortcode presente nele é confirmado com uma leitura no Firestore antes
+    de o post ser ignorado; um post nunca é perdido por colisão. Na
+    varredura distribuída, o filtro é carregado uma vez por processo e os
+    posts de todas as tarefas são gravados nele uma única vez, pela tarefa
+    que finaliza a execução (save_shortcodes).
+    """
+    def __init__(self, firestore_service, storage_service=None, storage_path: str = "instagram/indexes/posts.bloom",
+                 capacity: int = 1000000, false_positive_rate: float = 0.001, max_save_attempts: int = 5):
+        self.firestore_service = firestore_service
+        # Sem 'storage_service', o índice vale apenas para a execução.
+        self.storage_service = storage_service
+        self.storage_path = storage_path
+        self.capacity = capacity
+        self.false_positive_rate = false_positive_rate
+        self.max_save_attempts = max_save_attempts
+        self.bloom: Optional[BloomFilter] = None
+        self.duplicates = 0
+        self.confirmations = 0
+        self.save_conflicts = 0
+        self._claimed: Set[str] = set()
+        self._hashtags: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def _new_bloom(self) -> BloomFilter:
+        return BloomFilter.for_capacity(self.capacity, self.false_positive_rate)
+
+    def _download(self) -> Optional[BloomFilter]:
+        data = self.storage_service.download_bytes(self.storage_path)
+        if data is None:
+            return None
+        return BloomFilter.from_bytes(data)
+
+    def load(self, run_id: Optional[str] = None):
+        """
+        Carrega o índice persistente. Em caso de erro ou de índice ausente,
+        começa vazio: os posts são reprocessados como antes do índice.
+
+        Args:
+            run_id: Na varredura distribuída, reaproveita o índice já carregado
+                    por outra tarefa da mesma execução neste processo.
+        """
+        if self.storage_service is None:
+            return
+        if run_id is None:
+            self._load()
+            return
+        with _process_blooms_lock:
+            cached = _process_blooms.get(self.storage_path)
+            if cached is not None and cached[0] == run_id:
+                self.bloom = cached[1]
+                return
+            self._load()
+            _process_blooms[self.storage_path] = (run_id, self.bloom)
+
+    def _load(self):
+        try:
+            bloom = self._download()
+            configured = self._new_bloom()
+            if bloom is not None and not bloom.same_shape(configured):
+                # Capacidade alterada: o índice é recriado com os novos parâmetros.
+                logging.warning("Parâmetros do índice de posts alterados; o índice anterior foi descartado.")
+                bloom = None
+            if bloom is not None and bloom.estimated_items() > self.capacity:
+                logging.warning(f"Índice de posts acima da capacidade ({bloom.estimated_items()} > {self.capacity}); a taxa de falsos positivos aumentou. Considere aumentar POST_INDEX_CAPACITY.")
+            self.bloom = bloom or configured
+            logging.info(f"Índice de posts carregado com ~{self.bloom.item_count} posts.")
+        except Exception as e:
+            logging.error(f"Falha ao carregar o índice de posts '{self.storage_path}': {e}")
+            self.bloom = self._new_bloom()
+
+    def claim(self, shortcode: str) -> bool:
+        """
+        Reserva o post para processamento nesta execução.
+
+        Returns:
+            False se o post já foi processado, nesta execução ou em uma
+            anterior (confirmado no Firestore).
+        """
+        with self._lock:
+            if shortcode in self._claimed:
+                self.duplicates += 1
+                return False
+            self._claimed.add(shortcode)
+            maybe_known = self.bloom is not None and shortcode in self.bloom
+        if not maybe_known:
+            return True
+
+        with self._lock:
+            self.confirmations += 1
+        if self.firestore_service.get_documents('instagram_posts', [shortcode]):
+            with self._lock:
+                self.duplicates += 1
+            return False
+        return True
+
+    def release(self, shortcode: str):
+        """
+        Desfaz a reserva de um post cujo processamento falhou, para que seja
+        tentado novamente (ex: após um 429).
+        """
+        with self._lock:
+            self._claimed.discard(shortcode)
+
+    def add_hashtag(self, shortcode: str, hashtag: str):
+        with self._lock:
+            self._hashtags.setdefault(shortcode, set()).add(hashtag)
+
+    def flush_hashtags(self):
+        """
+        Grava as hashtags de origem acumuladas, uma operação por post.
+        """
+        with self._lock:
+            hashtags, self._hashtags = self._hashtags, {}
+        if hashtags:
+            self.firestore_service.append_post_hashtags(hashtags)
+
+    def claimed_shortcodes(self) -> List[str]:
+        with self._lock:
+            return list(self._claimed)
+
+    def save(self):
+        """
+        Acrescenta os posts da execução ao índice persistente, mesclando com a
+        versão gravada por execuções concorrentes desde o carregamento.
+        """
+        if self.storage_service is None or self.bloom is None:
+            return
+        shortcodes = self.claimed_shortcodes()
+        if not shortcodes:
+            return
+        try:
+            for shortcode in shortcodes:
+                self.bloom.add(shortcode)
+            self._merge_and_upload(self.bloom)
+        except Exception as e:
+            logging.error(f"Falha ao salvar o índice de posts '{self.storage_path}': {e}")
+
+    def save_shortcodes(self, shortcodes: Iterable[str]):
+        """
+        Acrescenta ao índice persistente os posts informados, sem depender do
+        índice carregado por esta instância. Usado ao finalizar a varredura
+        distribuída, com os posts de todas as tarefas.
+        """
+        if self.storage_service is None:
+            return
+        bloom = self._new_bloom()
+        for shortcode in shortcodes:
+            bloom.add(shortcode)
+        if not bloom.item_count:
+            return
+        try:
+            self._merge_and_upload(bloom)
+        except Exception as e:
+            logging.error(f"Falha ao salvar o índice de posts '{self.storage_path}': {e}")
+
+    def _merge_and_upload(self, bloom: BloomFilter):
+        """
+        Mescla o filtro com a versão gravada e o envia com uma precondição
+        sobre essa versão (geração no GCS). Se outra execução gravou o índice
+        entre a leitura e o envio, a leitura e a mescla são refeitas, de modo
+        que nenhuma das duas perde os seus posts.
+        """
+        for _ in range(self.max_save_attempts):
+            data, version = self.storage_service.download_bytes_versioned(self.storage_path)
+            current = BloomFilter.from_bytes(data) if data is not None else None
+            if current is not None and current.same_shape(bloom):
+                bloom.merge(current)
+            if self.storage_service.upload_bytes_if_version(bloom.to_bytes(), self.storage_path, 'application/octet-stream', version):
+                return
+            self.save_conflicts += 1
+            logging.info("Índice de posts gravado por outra execução durante o salvamento; mesclando novamente.")
+        raise RuntimeError(f"índice alterado concorrentemente em {self.max_save_attempts} tentativas")
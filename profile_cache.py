@@ -0,0 +1,109 @@
+# /search_instagram/profile_cache.py
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from typing import Optional, Dict, Any, Iterable
+import threading
+
+class OwnerProfileCache:
+    """
+    Cache dos dados de perfil dos autores de comentários, indexado pelo id do
+    usuário no Instagram.
+
+    Mantém um LRU em memória e persiste as entradas na coleção
+    'instagram_user_profiles' com o campo 'cached_at', considerado válido por
+    'ttl_seconds'. Como os mesmos autores comentam em vários posts e dias, a
+    maior parte dos comentários é enriquecida sem novas requisições.
+
+    A política de enriquecimento define o que acontece em um cache miss:
+    'none' não enriquece, 'cached' usa apenas o cache e 'full' busca o perfil
+    no Instagram enquanto houver orçamento ('fetch_budget') na execução.
+    """
+    COLLECTION = 'instagram_user_profiles'
+    POLICIES = ('none', 'cached', 'full')
+
+    def __init__(self, firestore_service, policy: str = 'cached', fetch_budget: int = 500, max_entries: int = 5000, ttl_seconds: int = 7 * 24 * 3600):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Política de enriquecimento inválida: '{policy}'. Use uma de {self.POLICIES}.")
+        self.firestore_service = firestore_service
+        self.policy = policy
+        self.fetch_budget = fetch_budget
+        self.max_entries = max_entries
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, entry: Dict[str, Any]) -> bool:
+        cached_at = entry.get('cached_at')
+        if cached_at is None:
+            return False
+        if cached_at.tzinfo is None:
+            cached_at = cached_at.replace(tzinfo=timezone.utc)
+        return datetime.now(timezone.utc) - cached_at < self.ttl
+
+    def _remember(self, user_id: str, entry: Dict[str, Any]):
+        with self._lock:
+            self._entries[user_id] = entry
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def prefetch(self, user_ids: Iterable[str]):
+        """
+        Carrega do Firestore, em uma única leitura em lote, as entradas que
+        ainda não estão no LRU.
+        """
+        if self.policy == 'none':
+            return
+        with self._lock:
+            missing = [user_id for user_id in set(user_ids) if user_id not in self._entries]
+        if not missing:
+            return
+        for user_id, entry in self.firestore_service.get_documents(self.COLLECTION, missing).items():
+            if self._is_fresh(entry):
+                self._remember(user_id, entry)
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Retorna os dados em cache de um usuário, se válidos.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+        if entry is not None and self._is_fresh(entry):
+            with self._lock:
+                self.hits += 1
+            return entry
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def try_reserve_fetch(self) -> bool:
+        """
+        Reserva uma busca de perfil no Instagram, se a política e o orçamento
+        da execução permitirem.
+        """
+        if self.policy != 'full':
+            return False
+        with self._lock:
+            if self.fetches >= self.fetch_budget:
+                return False
+            self.fetches += 1
+            return True
+
+    def put(self, user_id: str, profile_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Armazena os dados de um perfil no LRU e no Firestore, criando o
+        documento se o perfil ainda não estiver no cache.
+        """
+        entry = {**profile_data, "cached_at": datetime.now(timezone.utc)}
+        self._remember(user_id, entry)
+        self.firestore_service.save_instagram_data(self.COLLECTION, dict(entry), user_id)
+        return entry
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "fetches": self.fetches}
@@ -0,0 +1,87 @@
+# /search_instagram/profiler.py
+from collections import Counter
+from logging_config import logging
+from typing import Optional
+import os
+import sys
+import threading
+import time
+
+class ProfilerBusyError(Exception):
+    """
+    Lançada quando já há uma amostragem em andamento na instância.
+    """
+    pass
+
+class SamplingProfiler:
+    """
+    Profiler por amostragem das threads do processo, para uso em produção.
+
+    Uma thread auxiliar lê as pilhas de todas as threads (sys._current_frames)
+    a cada 'interval_seconds', sem instrumentar o código: o custo é o da
+    leitura das pilhas, proporcional à frequência de amostragem, e o job em
+    execução não precisa ser reiniciado. O resultado está no formato de
+    pilhas colapsadas ('thread;func (arquivo:linha);... contagem'), aceito
+    por flamegraph.pl, speedscope e pelo Grafana Pyroscope.
+
+    Os quadros são identificados pela primeira linha da função, de modo que
+    as amostras de uma mesma função são somadas.
+    """
+    _active_lock = threading.Lock()
+
+    def __init__(self, interval_seconds: float = 0.01, thread_prefix: Optional[str] = None):
+        """
+        Args:
+            interval_seconds: Intervalo entre amostras.
+            thread_prefix: Amostra apenas as threads cujo nome começa com o
+                           prefixo (ex: 'job', 'scan-shard', 'media-transfer').
+        """
+        self.interval_seconds = interval_seconds
+        self.thread_prefix = thread_prefix
+        self.samples = 0
+        self._stacks: Counter = Counter()
+
+    @staticmethod
+    def _frame_label(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ',')
+
+    def _sample(self, own_ident: int):
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            thread_name = thread_names.get(ident, str(ident))
+            if self.thread_prefix and not thread_name.startswith(self.thread_prefix):
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(self._frame_label(frame))
+                frame = frame.f_back
+            labels.append(thread_name.replace(';', ','))
+            self._stacks[';'.join(reversed(labels))] += 1
+        self.samples += 1
+
+    def run(self, duration_seconds: float) -> str:
+        """
+        Amostra as threads durante 'duration_seconds' e retorna as pilhas
+        colapsadas, das mais frequentes para as menos. Apenas uma amostragem
+        por processo é permitida por vez.
+        """
+        if not self._active_lock.acquire(blocking=False):
+            raise ProfilerBusyError("Já existe uma amostragem em andamento nesta instância.")
+        try:
+            own_ident = threading.get_ident()
+            deadline = time.monotonic() + duration_seconds
+            next_sample = time.monotonic()
+            while next_sample < deadline:
+                self._sample(own_ident)
+                next_sample += self.interval_seconds
+                time.sleep(max(0.0, next_sample - time.monotonic()))
+            logging.info(f"Amostragem concluída: {self.samples} amostras, {len(self._stacks)} pilhas distintas.")
+        finally:
+            self._active_lock.release()
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        return ''.join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
@@ -0,0 +1,130 @@
+# /search_instagram/s3_storage_service.py
+import os
+from logging_config import logging
+from clients import get_s3_client
+from storage_service import StorageService, _CountingReader
+from typing import Optional, Dict, Any, BinaryIO, List, Set, Tuple
+
+class S3StorageService(StorageService):
+    """
+    Destino de armazenamento no Amazon S3 ou em serviços compatíveis (MinIO,
+    Ceph, R2), configurados via S3_ENDPOINT_URL. Requer o pacote opcional
+    boto3; as credenciais seguem a cadeia padrão do boto3 (AWS_ACCESS_KEY_ID,
+    AWS_SECRET_ACCESS_KEY, perfis etc.).
+
+    Uploads paralelos usam o multipart upload nativo do S3.
+    """
+    scheme = 's3'
+    # O S3 exige partes de ao menos 5 MiB, exceto a última.
+    MIN_PART_SIZE = 5 * 1024 * 1024
+
+    def __init__(self, s3_client=None, bucket_name: Optional[str] = None):
+        """
+        Args:
+            s3_client: Cliente alternativo. Por padrão, usa o cliente compartilhado.
+            bucket_name: Bucket de destino; por padrão, S3_BUCKET_NAME.
+        """
+        try:
+            self.s3_client = s3_client if s3_client is not None else get_s3_client()
+            super().__init__(bucket_name or os.getenv("S3_BUCKET_NAME"))
+            if not self.bucket_name:
+                raise ValueError("Variável de ambiente S3_BUCKET_NAME não definida.")
+            self.part_size = max(self.part_size, self.MIN_PART_SIZE)
+            logging.info(f"Conexão com o S3 no bucket '{self.bucket_name}' estabelecida.")
+        except Exception as e:
+            logging.error(f"Falha ao conectar com o S3: {e}")
+            raise
+
+    @staticmethod
+    def _is_not_found(error: Exception) -> bool:
+        code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+        return code in ('404', 'NoSuchKey', 'NotFound')
+
+    @staticmethod
+    def _is_precondition_failed(error: Exception) -> bool:
+        # 409 ConditionalRequestConflict: outra gravação condicional concorrente no mesmo objeto.
+        code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+        return code in ('412', 'PreconditionFailed', '409', 'ConditionalRequestConflict')
+
+    @staticmethod
+    def _extra_args(content_type: Optional[str], metadata: Optional[Dict[str, str]]) -> Dict[str, Any]:
+        extra_args: Dict[str, Any] = {}
+        if content_type:
+            extra_args['ContentType'] = content_type
+        if metadata:
+            extra_args['Metadata'] = dict(metadata)
+        return extra_args
+
+    def _put_stream(self, reader: _CountingReader, name: str, size: Optional[int], content_type: Optional[str], metadata: Optional[Dict[str, str]]):
+        from boto3.s3.transfer import TransferConfig
+        # Envio sequencial em partes de 'part_size' bytes: o pico de memória
+        # fica limitado ao tamanho da parte, mesmo sem o tamanho total.
+        config = TransferConfig(multipart_threshold=self.part_size, multipart_chunksize=self.part_size, use_threads=False)
+        self.s3_client.upload_fileobj(reader, self.bucket_name, name, ExtraArgs=self._extra_args(content_type, metadata), Config=config)
+
+    def _put_bytes(self, data: bytes, name: str, content_type: Optional[str]):
+        self.s3_client.put_object(Bucket=self.bucket_name, Key=name, Body=data, **self._extra_args(content_type, None))
+
+    def _stat(self, name: str) -> Optional[Tuple[int, Dict[str, str]]]:
+        try:
+            response = self.s3_client.head_object(Bucket=self.bucket_name, Key=name)
+        except Exception as e:
+            if self._is_not_found(e):
+                return None
+            raise
+        return response['ContentLength'], response.get('Metadata') or {}
+
+    def _get_versioned(self, name: str) -> Tuple[bytes, str]:
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=name)
+        except Exception as e:
+            if self._is_not_found(e):
+                raise FileNotFoundError(f"s3://{self.bucket_name}/{name}")
+            raise
+        return response['Body'].read(), response['ETag']
+
+    def _put_bytes_if_version(self, data: bytes, name: str, content_type: Optional[str], version: Optional[str]) -> bool:
+        # Escritas condicionais do S3 (If-Match / If-None-Match); requer um boto3 recente.
+        condition = {"IfMatch": version} if version else {"IfNoneMatch": "*"}
+        try:
+            self.s3_client.put_object(Bucket=self.bucket_name, Key=name, Body=data, **condition, **self._extra_args(content_type, None))
+        except Exception as e:
+            if self._is_precondition_failed(e):
+                return False
+            raise
+        return True
+
+    def _list_names(self, prefix: str) -> Set[str]:
+        names: Set[str] = set()
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix, Delimiter='/'):
+            names.update(item['Key'] for item in page.get('Contents', []))
+        return names
+
+    def _open_read(self, name: str, start: int, end: Optional[int]) -> BinaryIO:
+        request: Dict[str, Any] = {"Bucket": self.bucket_name, "Key": name}
+        if start or end is not None:
+            request['Range'] = f"bytes={start}-{end - 1 if end is not None else ''}"
+        try:
+            return self.s3_client.get_object(**request)['Body']
+        except Exception as e:
+            if self._is_not_found(e):
+                raise FileNotFoundError(f"s3://{self.bucket_name}/{name}")
+            raise
+
+    def _start_multipart(self, name: str, content_type: Optional[str], metadata: Optional[Dict[str, str]]) -> Dict[str, Any]:
+        response = self.s3_client.create_multipart_upload(Bucket=self.bucket_name, Key=name, **self._extra_args(content_type, metadata))
+        return {"name": name, "upload_id": response['UploadId']}
+
+    def _upload_part(self, upload: Dict[str, Any], part_number: int, data: bytes) -> Dict[str, Any]:
+        response = self.s3_client.upload_part(Bucket=self.bucket_name, Key=upload['name'], UploadId=upload['upload_id'], PartNumber=part_number, Body=data)
+        return {"PartNumber": part_number, "ETag": response['ETag']}
+
+    def _complete_multipart(self, upload: Dict[str, Any], parts: List[Dict[str, Any]]):
+        self.s3_client.complete_multipart_upload(Bucket=self.bucket_name, Key=upload['name'], UploadId=upload['upload_id'], MultipartUpload={"Parts": parts})
+
+    def _abort_multipart(self, upload: Dict[str, Any], parts: List[Dict[str, Any]]):
+        try:
+            self.s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=upload['name'], UploadId=upload['upload_id'])
+        except Exception as e:
+            logging.warning(f"Não foi possível abortar o multipart upload de '{upload['name']}': {e}")
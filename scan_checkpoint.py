@@ -0,0 +1,247 @@
+# /search_instagram/scan_checkpoint.py
+from contextlib import contextmanager
+from logging_config import logging
+from typing import Callable, Optional, Dict, Any
+import json
+import instaloader
+import threading
+import uuid
+
+class TargetLeaseUnavailableError(Exception):
+    """
+    Lançada quando o lease de um alvo pertence a outra entrega da tarefa,
+    ou foi perdido durante a varredura.
+    """
+    def __init__(self, target_key: str):
+        self.target_key = target_key
+        super().__init__(f"O alvo '{target_key}' está sendo varrido por outra entrega da tarefa.")
+
+class ScanCheckpoint:
+    """
+    Checkpoint durável de uma execução de varredura, gravado no documento
+    'scan_checkpoints/{run_id}'.
+
+    Registra os alvos já concluídos ('completed_targets') e, para os alvos em
+    andamento ('in_progress'), a posição do iterador de posts do Instaloader
+    e a marca d'água parcial. Com isso, uma execução interrompida por 429,
+    falha ou reciclagem da instância pode ser retomada de onde parou.
+
+    A posição é gravada sem a página de posts já baixada ('remaining_data' do
+    FrozenNodeIterator): apenas o cursor que busca a página atual e o número
+    de posts já percorridos nela. Na retomada, a página é buscada novamente
+    (uma requisição) e esses posts são pulados. A posição é atualizada em
+    memória a cada post e gravada no início de cada página, a cada
+    'save_every_posts' posts e na interrupção do alvo; após uma falha da
+    instância, no máximo esses últimos posts são processados novamente.
+
+    A página atual é lida de atributos privados do NodeIterator ('_data' e
+    '_page_index'; ver requirements.txt para a versão fixada do Instaloader).
+    Se eles não existirem, a posição é gravada com o freeze() completo do
+    iterador, incluindo a página baixada, apenas a cada 'save_every_posts'
+    posts e na interrupção do alvo.
+
+    As gravações passam pelo writer em lote do Firestore quando ativo, sendo
+    enviadas sempre depois dos dados dos posts que as antecedem.
+    """
+    def __init__(self, firestore_service, run_id: str, save_every_posts: int = 10):
+        self.firestore_service = firestore_service
+        self.run_id = run_id
+        self.save_every_posts = max(1, save_every_posts)
+        self.completed_targets = set()
+        self.in_progress: Dict[str, Dict[str, Any]] = {}
+        # Página atual do iterador de cada alvo e posts ainda não gravados.
+        self._pages: Dict[str, Dict[str, Any]] = {}
+        self._unsaved_posts: Dict[str, int] = {}
+        # Iteradores sem os atributos de página, gravados com o freeze() completo.
+        self._untracked_iterators: Dict[str, instaloader.NodeIterator] = {}
+
+    @staticmethod
+    def target_key(kind: str, name: str) -> str:
+        return f"{kind}:{name}"
+
+    def load(self) -> bool:
+        """
+        Carrega o checkpoint existente da execução.
+
+        Returns:
+            True se havia um checkpoint para a execução.
+        """
+        data = self.firestore_service.get_scan_checkpoint(self.run_id)
+        if not data:
+            return False
+        self.completed_targets = set(data.get('completed_targets') or [])
+        self.in_progress = data.get('in_progress') or {}
+        logging.info(f"Checkpoint carregado para '{self.run_id}': {len(self.completed_targets)} alvos concluídos, {len(self.in_progress)} em andamento.")
+        return True
+
+    def is_completed(self, target_key: str) -> bool:
+        return target_key in self.completed_targets
+
+    def get_watermark(self, target_key: str) -> Optional[Dict[str, Any]]:
+        """
+        Marca d'água parcial registrada antes da interrupção, se houver.
+        """
+        return (self.in_progress.get(target_key) or {}).get('watermark')
+
+    def resume_iterator(self, target_key: str, node_iterator: instaloader.NodeIterator) -> int:
+        """
+        Restaura a posição salva em um iterador ainda não utilizado e passa a
+        acompanhar as suas páginas.
+
+        Returns:
+            O número de posts do início da iteração a pular, já percorridos
+            na página em que ela foi interrompida. Se a posição não for
+            compatível (ex: outra conta de serviço ou posição expirada), o
+            alvo é varrido desde o início, limitado pela marca d'água, e o
+            retorno é 0.
+        """
+        self._pages.pop(target_key, None)
+        self._unsaved_posts.pop(target_key, None)
+        self._untracked_iterators.pop(target_key, None)
+        if not isinstance(node_iterator, instaloader.NodeIterator):
+            return 0
+        progress = self.in_progress.get(target_key) or {}
+        frozen_json = progress.get('frozen_iterator')
+        skip_posts = 0
+        if frozen_json:
+            try:
+                frozen = json.loads(frozen_json)
+                if frozen.get('remaining_data') is None:
+                    skip_posts = progress.get('page_offset') or 0
+                    # Sem cursor, a interrupção ocorreu na primeira página, que o iterador novo já contém.
+                    if progress.get('page_cursor') is not None:
+                        frozen['remaining_data'] = {"page_info": {"has_next_page": True, "end_cursor": progress['page_cursor']}, "edges": []}
+                        frozen['total_index'] = progress.get('page_start_index') or 0
+                        node_iterator.thaw(instaloader.FrozenNodeIterator(**frozen))
+                else:
+                    # Checkpoints gravados com a página completa.
+                    node_iterator.thaw(instaloader.FrozenNodeIterator(**frozen))
+                logging.info(f"Iteração de '{target_key}' retomada a partir do checkpoint.")
+            except Exception as e:
+                logging.warning(f"Não foi possível retomar a iteração de '{target_key}': {e}. Reiniciando o alvo.")
+                skip_posts = 0
+        self.track_position(target_key, node_iterator)
+        return skip_posts
+
+    def track_position(self, target_key: str, node_iterator: Optional[instaloader.NodeIterator]):
+        """
+        Acompanha a troca de página do iterador; chamado a cada post obtido,
+        mesmo os que não são processados. O NodeIterator não expõe a página
+        atual, lida dos atributos '_data' e '_page_index'; sem eles, o
+        iterador passa a ser gravado com o freeze() completo.
+        """
+        if node_iterator is None or target_key in self._untracked_iterators:
+            return
+        if not (hasattr(node_iterator, '_data') and hasattr(node_iterator, '_page_index')):
+            logging.warning(f"NodeIterator sem os atributos de página nesta versão do Instaloader; a posição de '{target_key}' será gravada com freeze().")
+            self._untracked_iterators[target_key] = node_iterator
+            return
+        page = self._pages.get(target_key)
+        data = node_iterator._data
+        if page is not None and page['data'] is data:
+            return
+        self._pages[target_key] = {
+            "data": data,
+            # Cursor que busca a página atual: o 'end_cursor' da página anterior.
+            "cursor": (page['data'].get('page_info') or {}).get('end_cursor') if page is not None else None,
+            "start_index": node_iterator.total_index - node_iterator._page_index,
+            "frozen": None
+        }
+
+    def save_progress(self, target_key: str, node_iterator: Optional[instaloader.NodeIterator], watermark: Optional[Dict[str, Any]]):
+        """
+        Registra a posição atual do iterador e a marca d'água parcial do alvo
+        após um post processado. A gravação ocorre no primeiro post de cada
+        página e a cada 'save_every_posts' posts.
+        """
+        progress: Dict[str, Any] = {"watermark": watermark}
+        new_page = False
+        if node_iterator is not None:
+            self.track_position(target_key, node_iterator)
+        # Sem a página atual (iterador sem os atributos de página), o freeze() é gravado em _save_progress.
+        page = self._pages.get(target_key) if node_iterator is not None else None
+        if page is not None:
+            if page['frozen'] is None:
+                frozen = node_iterator.freeze()._asdict()
+                frozen['remaining_data'] = None
+                page['frozen'] = json.dumps(frozen)
+                new_page = True
+            progress.update(
+                frozen_iterator=page['frozen'],
+                page_cursor=page['cursor'],
+                page_start_index=page['start_index'],
+                page_offset=node_iterator._page_index
+            )
+        self.in_progress[target_key] = progress
+        unsaved_posts = self._unsaved_posts.get(target_key, 0) + 1
+        if new_page or unsaved_posts >= self.save_every_posts:
+            self._save_progress(target_key)
+            unsaved_posts = 0
+        self._unsaved_posts[target_key] = unsaved_posts
+
+    def _save_progress(self, target_key: str):
+        progress = self.in_progress[target_key]
+        node_iterator = self._untracked_iterators.get(target_key)
+        if node_iterator is not None:
+            # Serializado só ao gravar, pois inclui a página baixada.
+            progress['frozen_iterator'] = json.dumps(node_iterator.freeze()._asdict())
+        self.firestore_service.save_scan_checkpoint_progress(self.run_id, target_key, progress)
+
+    def flush_progress(self, target_key: str):
+        """
+        Grava a posição ainda não gravada do alvo (ex: ao ser interrompido).
+        """
+        if self._unsaved_posts.get(target_key) and target_key in self.in_progress:
+            self._save_progress(target_key)
+            self._unsaved_posts[target_key] = 0
+
+    def mark_completed(self, target_key: str):
+        self.completed_targets.add(target_key)
+        self.in_progress.pop(target_key, None)
+        self._pages.pop(target_key, None)
+        self._unsaved_posts.pop(target_key, None)
+        self._untracked_iterators.pop(target_key, None)
+        self.firestore_service.complete_scan_checkpoint_target(self.run_id, target_key)
+
+    def mark_status(self, status: str):
+        self.firestore_service.update_scan_checkpoint_status(self.run_id, status)
+
+    @contextmanager
+    def target_lease(self, target_key: str, lease_seconds: int, on_lost: Callable[[], None]):
+        """
+        Mantém o lease exclusivo do alvo enquanto o bloco executa, renovando-o
+        a cada terço da sua duração. Se a renovação falhar, 'on_lost' é
+        chamado (ex: para cancelar a varredura) e o bloco termina com
+        TargetLeaseUnavailableError.
+
+        Raises:
+            TargetLeaseUnavailableError: Se o lease pertence a outra entrega
+                ou foi perdido.
+        """
+        holder = uuid.uuid4().hex
+        current = self.firestore_service.acquire_scan_target_lease(self.run_id, target_key, holder, lease_seconds)
+        if current != holder:
+            raise TargetLeaseUnavailableError(target_key)
+
+        stop_renewal = threading.Event()
+        lost = threading.Event()
+
+        def renew_periodically():
+            while not stop_renewal.wait(lease_seconds / 3):
+                if not self.firestore_service.renew_scan_target_lease(self.run_id, target_key, holder, lease_seconds):
+                    logging.warning(f"Lease do alvo '{target_key}' perdido. Interrompendo a varredura do alvo.")
+                    lost.set()
+                    on_lost()
+                    return
+
+        renewal = threading.Thread(target=renew_periodically, name="target-lease", daemon=True)
+        renewal.start()
+        try:
+            yield
+        finally:
+            stop_renewal.set()
+            renewal.join()
+            if not lost.is_set():
+                self.firestore_service.release_scan_target_lease(self.run_id, target_key, holder)
+        if lost.is_set():
+            raise TargetLeaseUnavailableError(target_key)
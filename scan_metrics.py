@@ -0,0 +1,65 @@
+# /search_instagram/scan_metrics.py
+from contextlib import contextmanager
+from typing import Dict, Any, Iterable, Iterator
+import threading
+import time
+
+class ScanMetrics:
+    """
+    Coleta contadores e tempos de uma execução de varredura.
+
+    Os tempos são acumulados por categoria ('instagram', 'firestore',
+    'media_transfer', 'pause', ...) e exportados como '<categoria>_seconds'.
+    É seguro para uso a partir das threads de transferência de mídia.
+    """
+    def __init__(self):
+        self._counters: Dict[str, int] = {}
+        self._timers: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+
+    def increment(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def add_time(self, category: str, seconds: float):
+        with self._lock:
+            self._timers[category] = self._timers.get(category, 0.0) + seconds
+
+    @contextmanager
+    def timed(self, category: str):
+        """
+        Acumula o tempo gasto no bloco na categoria informada.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(category, time.perf_counter() - start)
+
+    def timed_iter(self, iterable: Iterable, category: str) -> Iterator:
+        """
+        Envolve um iterador preguiçoso (ex: posts do Instaloader), acumulando
+        apenas o tempo gasto em cada next(), onde ocorrem as requisições.
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.add_time(category, time.perf_counter() - start)
+            yield item
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Retorna um snapshot das métricas, no formato gravado em system_logs.
+        """
+        with self._lock:
+            metrics: Dict[str, Any] = dict(self._counters)
+            for category, seconds in self._timers.items():
+                metrics[f"{category}_seconds"] = round(seconds, 3)
+        metrics["wall_time_seconds"] = round(time.monotonic() - self._started_at, 3)
+        return metrics
@@ -0,0 +1,144 @@
+# /search_instagram/scan_planner.py
+from datetime import datetime, timezone
+from logging_config import logging
+from models.records import MonitoredTarget
+import itertools
+from typing import List, Dict, Any, Optional, Tuple
+
+class ScanPlanner:
+    """
+    Seleciona e ordena os alvos de uma execução por prioridade e defasagem.
+
+    Cada alvo tem um intervalo desejado entre varreduras, derivado da sua
+    frequência histórica de posts ('avg_posts_per_day') e do campo opcional
+    'priority' (padrão 1, mínimo efetivo 0,1; maior significa mais
+    importante): contas ativas
+    são varridas várias vezes ao dia e contas dormentes, semanalmente. Alvos
+    vencidos são ordenados pela razão entre a defasagem e o intervalo
+    desejado e incluídos até esgotar o orçamento de requisições e de tempo
+    da execução.
+    """
+    # Custo estimado, em requisições, de alvos sem histórico.
+    DEFAULT_REQUESTS_PER_SCAN = {"profile": 30.0, "hashtag": 60.0}
+    # Peso da varredura mais recente nas médias móveis exponenciais.
+    EWMA_ALPHA = 0.3
+
+    def __init__(self,
+                 request_budget: int = 0,
+                 time_budget_minutes: int = 0,
+                 requests_per_minute: float = 20.0,
+                 min_interval_hours: float = 4.0,
+                 max_interval_hours: float = 168.0,
+                 default_interval_hours: float = 24.0,
+                 posts_per_scan: float = 2.0,
+                 slack_hours: float = 1.0):
+        """
+        Args:
+            request_budget: Máximo de requisições estimadas na execução (0 = sem limite).
+            time_budget_minutes: Duração máxima estimada da execução (0 = sem limite).
+            requests_per_minute: Taxa de cada conta, usada para estimar a duração.
+            posts_per_scan: Número de posts novos esperado por varredura, que define o intervalo desejado.
+            slack_hours: Tolerância para alvos quase vencidos, compensando a defasagem do agendamento.
+        """
+        self.request_budget = request_budget
+        self.time_budget_minutes = time_budget_minutes
+        self.requests_per_minute = requests_per_minute
+        self.min_interval_hours = min_interval_hours
+        self.max_interval_hours = max_interval_hours
+        self.default_interval_hours = default_interval_hours
+        self.posts_per_scan = posts_per_scan
+        self.slack_hours = slack_hours
+
+    def desired_interval_hours(self, target: MonitoredTarget) -> float:
+        priority = max(target.priority, 0.1)
+        posts_per_day = target.avg_posts_per_day
+        if posts_per_day is None:
+            interval = self.default_interval_hours
+        elif posts_per_day <= 0:
+            interval = self.max_interval_hours
+        else:
+            interval = self.posts_per_scan / posts_per_day * 24
+        return min(self.max_interval_hours, max(self.min_interval_hours, interval / priority))
+
+    def estimated_requests(self, target: MonitoredTarget) -> float:
+        return target.avg_requests_per_scan or self.DEFAULT_REQUESTS_PER_SCAN[target.kind]
+
+    def _score(self, target: MonitoredTarget, now: datetime) -> Optional[float]:
+        """
+        Razão entre a defasagem e o intervalo desejado, ou None se o alvo não
+        estiver vencido. Alvos nunca varridos têm prioridade máxima.
+
+        A defasagem é medida a partir do início da execução que varreu o alvo
+        ('now' é o início da execução atual): medida a partir de
+        'last_scanned_at', um alvo diário varrido horas após o início da
+        execução ainda não estaria vencido na execução do dia seguinte e
+        seria varrido só a cada dois dias.
+        """
+        last_scan = target.last_scan_run_started_at or target.last_scanned_at
+        if last_scan is None:
+            return float('inf')
+        staleness_hours = (now - last_scan).total_seconds() / 3600
+        interval_hours = self.desired_interval_hours(target)
+        if staleness_hours + self.slack_hours < interval_hours:
+            return None
+        return staleness_hours / interval_hours
+
+    def plan(self, profiles: List[MonitoredTarget], hashtags: List[MonitoredTarget], concurrency: int = 1, now: Optional[datetime] = None) -> Tuple[List[MonitoredTarget], List[MonitoredTarget]]:
+        """
+        Retorna os perfis e hashtags selecionados para a execução, cada lista
+        ordenada da maior para a menor urgência.
+
+        Args:
+            concurrency: Número de contas em paralelo, que multiplica a taxa
+                usada no orçamento de tempo.
+        """
+        now = now or datetime.now(timezone.utc)
+        candidates = []
+        for target in itertools.chain(profiles, hashtags):
+            score = self._score(target, now)
+            if score is not None:
+                candidates.append((score, target))
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+
+        request_limit = self.request_budget or float('inf')
+        if self.time_budget_minutes:
+            request_limit = min(request_limit, self.time_budget_minutes * self.requests_per_minute * max(1, concurrency))
+
+        selected = {"profile": [], "hashtag": []}
+        planned_requests = 0.0
+        for score, target in candidates:
+            cost = self.estimated_requests(target)
+            if planned_requests + cost > request_limit:
+                continue
+            planned_requests += cost
+            selected[target.kind].append(target)
+
+        skipped = len(profiles) + len(hashtags) - len(selected["profile"]) - len(selected["hashtag"])
+        logging.info(f"Plano da varredura: {len(selected['profile'])} perfis e {len(selected['hashtag'])} hashtags selecionados "
+                     f"(~{planned_requests:.0f} requisições); {skipped} alvos adiados.")
+        return selected["profile"], selected["hashtag"]
+
+    @classmethod
+    def updated_stats(cls, target: MonitoredTarget, new_posts: int, requests: int, run_started_at: Optional[datetime] = None, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Atualiza as médias de posts por dia e de requisições por varredura de
+        um alvo, gravadas junto com 'last_scanned_at'.
+
+        Args:
+            run_started_at: Início da execução, referência da defasagem no
+                            planejamento seguinte.
+        """
+        now = now or datetime.now(timezone.utc)
+        stats: Dict[str, Any] = {"last_new_posts": new_posts}
+        if run_started_at is not None:
+            stats["last_scan_run_started_at"] = run_started_at
+
+        previous_requests = target.avg_requests_per_scan
+        stats["avg_requests_per_scan"] = float(requests) if previous_requests is None else cls.EWMA_ALPHA * requests + (1 - cls.EWMA_ALPHA) * previous_requests
+
+        if target.last_scanned_at is not None:
+            elapsed_days = max((now - target.last_scanned_at).total_seconds() / 86400, 1 / 24)
+            posts_per_day = new_posts / elapsed_days
+            previous_rate = target.avg_posts_per_day
+            stats["avg_posts_per_day"] = posts_per_day if previous_rate is None else cls.EWMA_ALPHA * posts_per_day + (1 - cls.EWMA_ALPHA) * previous_rate
+        return stats
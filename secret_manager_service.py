@@ -1,20 +1,25 @@
 # /search_instagram/secret_manager_service.py
 import os
-from google.cloud import secretmanager
+from clients import get_secret_manager_client
 from logging_config import logging
-from typing import Optional
+from typing import Optional, Tuple
 
 class SecretManagerService:
     """
     Classe de serviço para interagir com o Google Secret Manager.
     """
-    def __init__(self):
+    def __init__(self, client=None, project_id: Optional[str] = None):
         """
-        Inicializa o cliente do Secret Manager.
+        Obtém o cliente compartilhado do Secret Manager.
+
+        Args:
+            client: Cliente alternativo (ex: segredos estáticos dos benchmarks).
+                    Por padrão, usa o cliente compartilhado.
+            project_id: Projeto do GCP; por padrão, GCP_PROJECT_ID.
         """
         try:
-            self.client = secretmanager.SecretManagerServiceClient()
-            self.project_id = os.getenv("GCP_PROJECT_ID")
+            self.client = client if client is not None else get_secret_manager_client()
+            self.project_id = project_id or os.getenv("GCP_PROJECT_ID")
             if not self.project_id:
                 raise ValueError("Variável de ambiente GCP_PROJECT_ID não definida.")
             logging.info("Cliente do Secret Manager inicializado com sucesso.")
@@ -43,3 +48,31 @@ class SecretManagerService:
         except Exception as e:
             logging.error(f"Erro ao acessar o payload do segredo '{secret_path}': {e}")
             return None
+
+    def get_secret_version(self, secret_path: str) -> Optional[Tuple[str, bytes]]:
+        """
+        Busca o payload de um segredo junto com o nome da versão acessada.
+        Para caminhos com alias (ex: versions/latest), o nome retornado é o
+        da versão concreta, permitindo detectar rotações do segredo.
+
+        Returns:
+            Tupla (nome da versão, payload), ou None em caso de erro.
+        """
+        try:
+            response = self.client.access_secret_version(request={"name": secret_path})
+            logging.info(f"Payload do segredo '{secret_path}' acessado com sucesso (versão '{response.name}').")
+            return response.name, response.payload.data
+        except Exception as e:
+            logging.error(f"Erro ao acessar o payload do segredo '{secret_path}': {e}")
+            return None
+
+    def resolve_secret_version(self, secret_path: str) -> Optional[str]:
+        """
+        Resolve o nome da versão concreta de um segredo lendo apenas seus
+        metadados, sem acessar o payload.
+        """
+        try:
+            return self.client.get_secret_version(request={"name": secret_path}).name
+        except Exception as e:
+            logging.error(f"Erro ao resolver a versão do segredo '{secret_path}': {e}")
+            return None
@@ -0,0 +1,99 @@
+# /search_instagram/session_cache.py
+from logging_config import logging
+from typing import Optional, Dict, Any
+import os
+import pickle
+import re
+import threading
+import time
+
+class CachedSession:
+    """
+    Sessão do Instaloader (cookies) desserializada a partir de uma versão do
+    segredo no Secret Manager.
+    """
+    def __init__(self, version: str, session_data: Dict[str, Any]):
+        self.version = version
+        self.session_data = session_data
+        self.checked_at = time.monotonic()
+        self.validated_at: Optional[float] = None
+
+class SessionCache:
+    """
+    Cache em memória, compartilhado pelas execuções de uma instância, das
+    sessões das contas de serviço.
+
+    Evita baixar o segredo do Secret Manager e gravá-lo em disco a cada
+    execução: os cookies ficam desserializados em memória e são carregados
+    direto no contexto do Instaloader. Após 'ttl_seconds', a versão do segredo
+    é conferida pelos metadados e o payload só é baixado novamente se houver
+    uma versão nova; caminhos com versão fixa nunca mudam. O test_login é
+    dispensado se a sessão foi validada há menos de 'validation_ttl_seconds'.
+    """
+    PINNED_VERSION = re.compile(r"/versions/\d+$")
+
+    def __init__(self, ttl_seconds: int = 3600, validation_ttl_seconds: int = 6 * 3600):
+        self.ttl_seconds = ttl_seconds
+        self.validation_ttl_seconds = validation_ttl_seconds
+        self._entries: Dict[str, CachedSession] = {}
+        self._lock = threading.Lock()
+
+    def get(self, secret_path: str, secret_manager_service) -> Optional[CachedSession]:
+        """
+        Retorna a sessão do segredo, baixando-a apenas se não estiver em cache
+        ou se a versão do segredo tiver mudado.
+        """
+        with self._lock:
+            entry = self._entries.get(secret_path)
+        if entry is not None:
+            if self.PINNED_VERSION.search(secret_path) or time.monotonic() - entry.checked_at < self.ttl_seconds:
+                return entry
+            if secret_manager_service.resolve_secret_version(secret_path) == entry.version:
+                entry.checked_at = time.monotonic()
+                return entry
+            logging.info(f"Nova versão do segredo '{secret_path}' detectada. Recarregando a sessão.")
+
+        secret = secret_manager_service.get_secret_version(secret_path)
+        if not secret or not secret[1]:
+            return None
+        version, payload = secret
+        entry = CachedSession(version, pickle.loads(payload))
+        with self._lock:
+            self._entries[secret_path] = entry
+        return entry
+
+    def needs_validation(self, entry: CachedSession) -> bool:
+        return entry.validated_at is None or time.monotonic() - entry.validated_at >= self.validation_ttl_seconds
+
+    def mark_validated(self, entry: CachedSession):
+        entry.validated_at = time.monotonic()
+
+    def update_session_data(self, secret_path: str, session_data: Dict[str, Any]):
+        """
+        Guarda os cookies atualizados pelo Instagram durante a execução, para
+        que a próxima execução na instância parta deles.
+        """
+        with self._lock:
+            entry = self._entries.get(secret_path)
+            if entry is not None:
+                entry.session_data = session_data
+
+    def invalidate(self, secret_path: str):
+        with self._lock:
+            self._entries.pop(secret_path, None)
+
+_session_cache: Optional[SessionCache] = None
+_session_cache_lock = threading.Lock()
+
+def get_session_cache() -> SessionCache:
+    """
+    Retorna o cache de sessões do processo, criado na primeira utilização.
+    """
+    global _session_cache
+    with _session_cache_lock:
+        if _session_cache is None:
+            _session_cache = SessionCache(
+                ttl_seconds=int(os.getenv("SESSION_CACHE_TTL_MINUTES", "60")) * 60,
+                validation_ttl_seconds=int(os.getenv("SESSION_VALIDATION_TTL_MINUTES", "360")) * 60
+            )
+        return _session_cache
@@ -0,0 +1,437 @@
+# /search_instagram/storage_service.py
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from logging_config import logging
+from io import BytesIO
+from typing import Optional, Dict, Any, BinaryIO, Iterable, Iterator, List, Set, Tuple
+import hashlib
+import mimetypes
+import os
+import posixpath
+import shutil
+import threading
+
+class _CountingReader:
+    """
+    Envolve um stream de leitura contando os bytes lidos e, opcionalmente,
+    calculando o hash SHA-256 do conteúdo durante a leitura.
+    """
+    def __init__(self, stream: BinaryIO, compute_hash: bool = False):
+        self._stream = stream
+        self._hash = hashlib.sha256() if compute_hash else None
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._stream.read(size)
+        if data:
+            self.bytes_read += len(data)
+            if self._hash:
+                self._hash.update(data)
+        return data
+
+    def read_exact(self, size: int) -> bytes:
+        """
+        Lê até 'size' bytes, repetindo a leitura em streams (ex: respostas
+        HTTP) que retornam menos bytes que o pedido antes do fim.
+        """
+        chunks = []
+        remaining = size
+        while remaining > 0:
+            data = self.read(remaining)
+            if not data:
+                break
+            chunks.append(data)
+            remaining -= len(data)
+        return b''.join(chunks)
+
+    def tell(self) -> int:
+        return self.bytes_read
+
+    def hexdigest(self) -> Optional[str]:
+        return self._hash.hexdigest() if self._hash else None
+
+class _RangeReader:
+    """
+    Limita a leitura de um stream a 'length' bytes (None = até o fim).
+    """
+    def __init__(self, stream: BinaryIO, length: Optional[int]):
+        self._stream = stream
+        self._remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if self._remaining is None:
+            return self._stream.read(size)
+        if self._remaining <= 0:
+            return b''
+        size = self._remaining if size is None or size < 0 else min(size, self._remaining)
+        data = self._stream.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._stream.close()
+
+class StorageService:
+    """
+    Destino de armazenamento das mídias e exportações da coleta.
+
+    Implementa a interface pública usada pelo restante do serviço (uploads em
+    streaming, leitura de metadados, verificação de existência em lote e
+    leitura por faixa de bytes), delegando as operações de baixo nível aos
+    métodos '_' de cada implementação: GCSService (Google Cloud Storage),
+    LocalStorageService (diretório local) e S3StorageService (S3 e
+    compatíveis, como o MinIO). Use create_storage_service() para obter a
+    implementação configurada em STORAGE_BACKEND.
+
+    Uploads de tamanho conhecido a partir de 'parallel_upload_threshold' bytes
+    são divididos em partes de 'part_size' bytes enviadas em paralelo por
+    'upload_workers' threads (upload composto no GCS, multipart no S3); no
+    máximo 2 x upload_workers partes ficam em memória por upload.
+    """
+    scheme = ''
+    # Grupos com ao menos esse número de objetos no mesmo diretório são
+    # verificados com uma listagem, em vez de uma consulta por objeto.
+    LIST_THRESHOLD = 8
+
+    def __init__(self, bucket_name: str):
+        self.bucket_name = bucket_name
+        self.parallel_upload_threshold = int(os.getenv("STORAGE_PARALLEL_UPLOAD_THRESHOLD_MB", "64")) * 1024 * 1024
+        self.part_size = int(os.getenv("STORAGE_PART_SIZE_MB", "16")) * 1024 * 1024
+        self.upload_workers = int(os.getenv("STORAGE_UPLOAD_WORKERS", "4"))
+
+    def uri(self, name: str) -> str:
+        """
+        Caminho completo do objeto (ex: gs://bucket/nome), gravado nos documentos.
+        """
+        return f"{self.scheme}://{self.bucket_name}/{name}"
+
+    # ------------------------------------------------------------------
+    # Operações de baixo nível de cada implementação
+    # ------------------------------------------------------------------
+
+    def _put_stream(self, reader: _CountingReader, name: str, size: Optional[int], content_type: Optional[str], metadata: Optional[Dict[str, str]]):
+        raise NotImplementedError
+
+    def _put_bytes(self, data: bytes, name: str, content_type: Optional[str]):
+        raise NotImplementedError
+
+    def _stat(self, name: str) -> Optional[Tuple[int, Dict[str, str]]]:
+        """
+        Retorna (tamanho, metadados) do objeto, ou None se ele não existir.
+        """
+        raise NotImplementedError
+
+    def _get_versioned(self, name: str) -> Tuple[bytes, str]:
+        """
+        Retorna o conteúdo do objeto e a sua versão (geração no GCS, ETag no
+        S3). Lança FileNotFoundError se ele não existir.
+        """
+        raise NotImplementedError
+
+    def _put_bytes_if_version(self, data: bytes, name: str, content_type: Optional[str], version: Optional[str]) -> bool:
+        """
+        Grava o objeto apenas se ele ainda estiver na versão 'version' (None:
+        apenas se ele não existir).
+
+        Returns:
+            False se a precondição falhou.
+        """
+        raise NotImplementedError
+
+    def _list_names(self, prefix: str) -> Set[str]:
+        """
+        Nomes dos objetos diretamente sob o diretório 'prefix' (terminado em '/').
+        """
+        raise NotImplementedError
+
+    def _open_read(self, name: str, start: int, end: Optional[int]) -> BinaryIO:
+        """
+        Abre a leitura dos bytes [start, end) do objeto. Lança FileNotFoundError
+        se ele não existir.
+        """
+        raise NotImplementedError
+
+    def _start_multipart(self, name: str, content_type: Optional[str], metadata: Optional[Dict[str, str]]) -> Any:
+        raise NotImplementedError
+
+    def _upload_part(self, upload: Any, part_number: int, data: bytes) -> Any:
+        raise NotImplementedError
+
+    def _complete_multipart(self, upload: Any, parts: List[Any]):
+        raise NotImplementedError
+
+    def _abort_multipart(self, upload: Any, parts: List[Any]):
+        raise NotImplementedError
+
+    # ------------------------------------------------------------------
+    # Interface pública
+    # ------------------------------------------------------------------
+
+    def upload_media_from_buffer(self, buffer: BytesIO, destination_blob_name: str) -> Optional[str]:
+        """
+        Faz o upload de um buffer de mídia em memória.
+
+        Returns:
+            str: O caminho completo do objeto ou None em caso de erro.
+        """
+        buffer.seek(0)
+        upload_result = self.upload_media_from_stream(buffer, destination_blob_name, size=buffer.getbuffer().nbytes)
+        return upload_result['gcs_path'] if upload_result else None
+
+    def upload_media_from_stream(self, stream: BinaryIO, destination_blob_name: str, size: Optional[int] = None, compute_hash: bool = False, metadata: Optional[Dict[str, str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Faz o upload de um stream de mídia sem manter o arquivo inteiro em
+        memória. Mídias grandes de tamanho conhecido são enviadas em partes
+        paralelas.
+
+        Args:
+            stream: Stream de leitura (ex: resposta HTTP) com os dados da mídia.
+            destination_blob_name (str): O nome do objeto de destino.
+            size (int): Tamanho total, se conhecido (ex: Content-Length).
+            compute_hash (bool): Calcula o SHA-256 do conteúdo durante o envio.
+            metadata (dict): Metadados customizados gravados no objeto.
+
+        Returns:
+            dict: 'gcs_path' (caminho completo do objeto), 'size_bytes' e
+                  'sha256' (None se não calculado), ou None em caso de erro.
+        """
+        try:
+            reader = _CountingReader(stream, compute_hash=compute_hash)
+            content_type = mimetypes.guess_type(destination_blob_name)[0]
+            if size is not None and self.upload_workers > 1 and size >= max(self.parallel_upload_threshold, 2 * self.part_size):
+                self._upload_in_parts(reader, destination_blob_name, content_type, metadata)
+            else:
+                # Se a leitura falhar no meio, o upload não é finalizado e
+                # nenhum objeto parcial é gravado.
+                self._put_stream(reader, destination_blob_name, size, content_type, metadata)
+            path = self.uri(destination_blob_name)
+            logging.info(f"Stream de {reader.bytes_read} bytes enviado para {path}.")
+            return {"gcs_path": path, "size_bytes": reader.bytes_read, "sha256": reader.hexdigest()}
+        except Exception as e:
+            logging.error(f"Erro ao fazer upload do stream para {destination_blob_name}: {e}")
+            return None
+
+    def _upload_in_parts(self, reader: _CountingReader, name: str, content_type: Optional[str], metadata: Optional[Dict[str, str]]):
+        """
+        Lê o stream em partes e as envia em paralelo, limitando as partes em
+        memória. Em caso de erro, as partes já enviadas são descartadas.
+        """
+        upload = self._start_multipart(name, content_type, metadata)
+        in_flight = threading.BoundedSemaphore(2 * self.upload_workers)
+        failed = threading.Event()
+        futures = []
+
+        def on_part_done(future):
+            if future.exception():
+                failed.set()
+            in_flight.release()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.upload_workers, thread_name_prefix="storage-part") as executor:
+                part_number = 1
+                # Uma parte com erro interrompe a leitura; o erro é lançado abaixo.
+                while not failed.is_set():
+                    in_flight.acquire()
+                    data = reader.read_exact(self.part_size)
+                    if not data:
+                        in_flight.release()
+                        break
+                    future = executor.submit(self._upload_part, upload, part_number, data)
+                    future.add_done_callback(on_part_done)
+                    futures.append(future)
+                    part_number += 1
+            parts = [future.result() for future in futures]
+        except Exception:
+            uploaded = [future.result() for future in futures if future.done() and not future.exception()]
+            self._abort_multipart(upload, uploaded)
+            raise
+        self._complete_multipart(upload, parts)
+        logging.info(f"Upload de {name} concluído em {len(parts)} partes paralelas.")
+
+    def upload_bytes(self, data: bytes, destination_blob_name: str, content_type: str) -> Optional[str]:
+        """
+        Faz o upload de um conteúdo em memória (ex: arquivos de exportação e
+        manifestos) com o content_type informado.
+
+        Returns:
+            str: O caminho completo do objeto ou None em caso de erro.
+        """
+        try:
+            self._put_bytes(data, destination_blob_name, content_type)
+            path = self.uri(destination_blob_name)
+            logging.info(f"{len(data)} bytes enviados para {path}.")
+            return path
+        except Exception as e:
+            logging.error(f"Erro ao fazer upload de {destination_blob_name}: {e}")
+            return None
+
+    def download_bytes(self, blob_name: str) -> Optional[bytes]:
+        """
+        Baixa o conteúdo de um objeto para a memória.
+
+        Returns:
+            bytes: O conteúdo, ou None se o objeto não existir ou em caso de erro.
+        """
+        try:
+            with self.open_media_stream(blob_name) as stream:
+                return stream.read()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.error(f"Erro ao baixar {blob_name}: {e}")
+            return None
+
+    def download_bytes_versioned(self, blob_name: str) -> Tuple[Optional[bytes], Optional[str]]:
+        """
+        Baixa o conteúdo de um objeto e a sua versão, usada como precondição
+        em upload_bytes_if_version para gravações de leitura-modificação-
+        escrita sem perder alterações concorrentes. Erros são propagados.
+
+        Returns:
+            Tupla (conteúdo, versão), ou (None, None) se o objeto não existir.
+        """
+        try:
+            return self._get_versioned(blob_name)
+        except FileNotFoundError:
+            return None, None
+
+    def upload_bytes_if_version(self, data: bytes, destination_blob_name: str, content_type: str, version: Optional[str]) -> bool:
+        """
+        Faz o upload de um conteúdo em memória somente se o objeto não tiver
+        sido alterado desde a leitura da versão 'version' (None: somente se o
+        objeto ainda não existir). Erros são propagados.
+
+        Returns:
+            True se o objeto foi gravado; False se ele foi alterado por outro
+            processo (a leitura e a mesclagem devem ser refeitas).
+        """
+        if not self._put_bytes_if_version(data, destination_blob_name, content_type, version):
+            logging.info(f"{self.uri(destination_blob_name)} alterado desde a versão '{version}'; upload condicional recusado.")
+            return False
+        logging.info(f"{len(data)} bytes enviados para {self.uri(destination_blob_name)} (upload condicional).")
+        return True
+
+    def get_media_info(self, blob_name: str) -> Optional[Dict[str, Any]]:
+        """
+        Consulta os metadados de um objeto sem baixar seu conteúdo.
+
+        Returns:
+            dict: 'gcs_path', 'size_bytes' e 'metadata', ou None se o objeto
+                  não existir ou em caso de erro.
+        """
+        try:
+            stat = self._stat(blob_name)
+            if stat is None:
+                return None
+            size, metadata = stat
+            return {"gcs_path": self.uri(blob_name), "size_bytes": size, "metadata": metadata or {}}
+        except Exception as e:
+            logging.error(f"Erro ao consultar metadados de {blob_name}: {e}")
+            return None
+
+    def exists_many(self, blob_names: Iterable[str]) -> Set[str]:
+        """
+        Verifica a existência de vários objetos de uma vez. Os nomes são
+        agrupados por diretório: grupos grandes são resolvidos com uma
+        listagem do diretório e os demais com consultas em paralelo.
+
+        Returns:
+            O conjunto dos nomes que existem. Em caso de erro em um grupo, seus
+            objetos são considerados inexistentes.
+        """
+        groups: Dict[str, List[str]] = {}
+        for name in dict.fromkeys(blob_names):
+            groups.setdefault(posixpath.dirname(name), []).append(name)
+
+        existing: Set[str] = set()
+        single_checks: List[str] = []
+        for directory, names in groups.items():
+            if len(names) < self.LIST_THRESHOLD:
+                single_checks.extend(names)
+                continue
+            try:
+                listed = self._list_names(f"{directory}/" if directory else "")
+                existing.update(name for name in names if name in listed)
+            except Exception as e:
+                logging.error(f"Erro ao listar o diretório '{directory}': {e}")
+
+        def check(name: str) -> Optional[str]:
+            try:
+                return name if self._stat(name) is not None else None
+            except Exception as e:
+                logging.error(f"Erro ao verificar a existência de {name}: {e}")
+                return None
+
+        if single_checks:
+            with ThreadPoolExecutor(max_workers=min(8, len(single_checks)), thread_name_prefix="storage-exists") as executor:
+                existing.update(name for name in executor.map(check, single_checks) if name)
+        return existing
+
+    @contextmanager
+    def open_media_stream(self, blob_name: str, start: int = 0, end: Optional[int] = None) -> Iterator[BinaryIO]:
+        """
+        Abre a leitura em streaming de um objeto, opcionalmente limitada aos
+        bytes [start, end), sem baixá-lo para o disco.
+
+        Raises:
+            FileNotFoundError: Se o objeto não existir.
+        """
+        stream = self._open_read(blob_name, start, end)
+        try:
+            yield stream
+        finally:
+            stream.close()
+
+    def read_media_range(self, blob_name: str, start: int, end: int) -> Optional[bytes]:
+        """
+        Lê os bytes [start, end) de um objeto.
+
+        Returns:
+            bytes: O conteúdo da faixa, ou None se o objeto não existir ou em caso de erro.
+        """
+        try:
+            with self.open_media_stream(blob_name, start, end) as stream:
+                return stream.read()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.error(f"Erro ao ler os bytes {start}-{end} de {blob_name}: {e}")
+            return None
+
+    def download_media(self, source_blob_name: str, destination_file_name: str) -> bool:
+        """
+        Faz o download de um arquivo de mídia em streaming.
+
+        Args:
+            source_blob_name (str): O nome do objeto de origem.
+            destination_file_name (str): O caminho local para salvar o arquivo.
+
+        Returns:
+            bool: True se o download for bem-sucedido, False caso contrário.
+        """
+        try:
+            with self.open_media_stream(source_blob_name) as stream, open(destination_file_name, 'wb') as destination:
+                shutil.copyfileobj(stream, destination, 1024 * 1024)
+            logging.info(f"Arquivo {source_blob_name} baixado para {destination_file_name}.")
+            return True
+        except Exception as e:
+            logging.error(f"Erro ao fazer download de {source_blob_name}: {e}")
+            return False
+
+def create_storage_service() -> StorageService:
+    """
+    Cria o destino de armazenamento configurado em STORAGE_BACKEND: 'gcs'
+    (padrão), 'local' ou 's3'. As implementações são importadas sob demanda,
+    de modo que o boto3 só é necessário com 's3'.
+    """
+    backend = os.getenv("STORAGE_BACKEND", "gcs").lower()
+    if backend == "gcs":
+        from gcs_service import GCSService
+        return GCSService()
+    if backend == "local":
+        from local_storage_service import LocalStorageService
+        return LocalStorageService()
+    if backend == "s3":
+        from s3_storage_service import S3StorageService
+        return S3StorageService()
+    raise ValueError(f"STORAGE_BACKEND inválido: '{backend}'. Use 'gcs', 'local' ou 's3'.")
@@ -0,0 +1,130 @@
+# /search_instagram/task_queue.py
+from concurrent.futures import ThreadPoolExecutor
+from logging_config import logging
+from typing import Any, Callable, Dict, Optional
+import json
+import os
+import re
+import threading
+import time
+import zlib
+
+def task_name(run_id: str, target_key: str) -> str:
+    """
+    Nome determinístico da tarefa de um alvo. Reenfileirar o mesmo alvo na
+    mesma execução gera o mesmo nome, que o Cloud Tasks deduplica. Caracteres
+    fora de [A-Za-z0-9_-] são substituídos e um CRC32 da chave original evita
+    colisões entre nomes que diferem apenas neles.
+    """
+    safe_key = re.sub(r'[^A-Za-z0-9_-]', '_', target_key)[:200]
+    return f"{run_id}-{safe_key}-{zlib.crc32(target_key.encode('utf-8')):08x}"
+
+class TaskQueue:
+    """
+    Fila de tarefas da varredura distribuída. Cada tarefa é um alvo
+    ({"run_id", "target_type", "target_id"}) entregue pelo menos uma vez a
+    um worker, que responde se ela foi concluída ou deve ser repetida.
+    """
+    def enqueue(self, name: str, payload: Dict[str, Any]):
+        raise NotImplementedError
+
+class CloudTasksQueue(TaskQueue):
+    """
+    Fila no Google Cloud Tasks. Cada tarefa é um POST autenticado (OIDC) para
+    '/jobs/scan-target' do próprio serviço; respostas diferentes de 2xx são
+    repetidas com o backoff e o limite de tentativas configurados na fila.
+    """
+    # Prazo máximo de uma requisição do Cloud Tasks (30 minutos).
+    DISPATCH_DEADLINE_SECONDS = 1800
+
+    def __init__(self, client=None):
+        from clients import get_cloud_tasks_client
+
+        self.client = client or get_cloud_tasks_client()
+        project_id = os.getenv("TASKS_PROJECT_ID") or os.getenv("GCP_PROJECT_ID")
+        location = os.getenv("TASKS_LOCATION", "us-central1")
+        queue = os.getenv("TASKS_QUEUE", "search-instagram-scan")
+        self.target_url = os.getenv("TASKS_TARGET_URL")
+        if not project_id or not self.target_url:
+            raise ValueError("Variáveis de ambiente TASKS_PROJECT_ID (ou GCP_PROJECT_ID) e TASKS_TARGET_URL são obrigatórias para o Cloud Tasks.")
+        self.target_url = self.target_url.rstrip('/') + "/jobs/scan-target"
+        self.service_account_email = os.getenv("TASKS_SERVICE_ACCOUNT_EMAIL")
+        self.project_id, self.location, self.queue = project_id, location, queue
+        self.parent = self.client.queue_path(project_id, location, queue)
+
+    def enqueue(self, name: str, payload: Dict[str, Any]):
+        from google.api_core.exceptions import AlreadyExists
+
+        http_request: Dict[str, Any] = {
+            "http_method": "POST",
+            "url": self.target_url,
+            "headers": {"Content-Type": "application/json"},
+            "body": json.dumps(payload).encode('utf-8')
+        }
+        if self.service_account_email:
+            http_request["oidc_token"] = {"service_account_email": self.service_account_email, "audience": self.target_url}
+        task = {
+            "name": self.client.task_path(self.project_id, self.location, self.queue, name),
+            "http_request": http_request,
+            "dispatch_deadline": {"seconds": self.DISPATCH_DEADLINE_SECONDS}
+        }
+        try:
+            self.client.create_task(request={"parent": self.parent, "task": task})
+        except AlreadyExists:
+            logging.info(f"Tarefa '{name}' já enfileirada. Ignorando.")
+
+class LocalTaskQueue(TaskQueue):
+    """
+    Fila em processo, para desenvolvimento, testes e instalações sem Cloud
+    Tasks. As tarefas são executadas por 'workers' threads chamando
+    'handler(payload, tentativa)', que retorna False para repetir a tarefa;
+    as repetições seguem um backoff exponencial até 'max_attempts'.
+    """
+    def __init__(self, handler: Callable[[Dict[str, Any], int], bool], workers: int = 2, max_attempts: int = 5, backoff_seconds: float = 30.0):
+        self.handler = handler
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="scan-task")
+        self._names = set()
+        self._lock = threading.Lock()
+
+    def enqueue(self, name: str, payload: Dict[str, Any]):
+        with self._lock:
+            if name in self._names:
+                logging.info(f"Tarefa '{name}' já enfileirada. Ignorando.")
+                return
+            self._names.add(name)
+        self._executor.submit(self._run, name, payload)
+
+    def _run(self, name: str, payload: Dict[str, Any]):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                if self.handler(payload, attempt):
+                    return
+            except Exception as e:
+                logging.error(f"Erro na tarefa '{name}' (tentativa {attempt}/{self.max_attempts}): {e}", exc_info=True)
+            if attempt < self.max_attempts:
+                time.sleep(self.backoff_seconds * 2 ** (attempt - 1))
+        logging.error(f"Tarefa '{name}' descartada após {self.max_attempts} tentativas.")
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+def create_task_queue(handler: Optional[Callable[[Dict[str, Any], int], bool]] = None) -> TaskQueue:
+    """
+    Cria a fila configurada em TASK_QUEUE_BACKEND: 'cloud_tasks' (padrão) ou
+    'local', que executa as tarefas nesta instância com 'handler'.
+    """
+    backend = os.getenv("TASK_QUEUE_BACKEND", "cloud_tasks").lower()
+    if backend == "cloud_tasks":
+        return CloudTasksQueue()
+    if backend == "local":
+        if handler is None:
+            raise ValueError("A fila local requer um handler para executar as tarefas.")
+        return LocalTaskQueue(
+            handler,
+            workers=int(os.getenv("LOCAL_TASK_QUEUE_WORKERS", "2")),
+            max_attempts=int(os.getenv("SCAN_TASK_MAX_ATTEMPTS", "5")),
+            backoff_seconds=float(os.getenv("LOCAL_TASK_QUEUE_BACKOFF_SECONDS", "30"))
+        )
+    raise ValueError(f"TASK_QUEUE_BACKEND inválido: '{backend}'. Use 'cloud_tasks' ou 'local'.")
@@ -0,0 +1,6 @@
+# /search_instagram/tests/conftest.py
+import os
+import sys
+
+# Os módulos do serviço ficam na raiz do repositório, como em benchmarks/.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
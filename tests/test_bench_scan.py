@@ -0,0 +1,33 @@
+# /search_instagram/tests/test_bench_scan.py
+import pytest
+
+from benchmarks import bench_scan
+
+@pytest.fixture(autouse=True)
+def restore_environment(monkeypatch):
+    # run_benchmark configura o serviço pelas variáveis de ambiente.
+    for name in ("SCAN_SHARDS", "MEDIA_TRANSFER_WORKERS", "EXPORT_ENABLED", "COMMENT_ENRICHMENT", "PLANNER_ENABLED"):
+        monkeypatch.setenv(name, "")
+
+@pytest.mark.parametrize("extra_args", [[], ["--shards", "2", "--throttle-rate", "0.05", "--hashtag-overlap", "0.5"]])
+def test_small_scan_stays_within_the_default_limits(tmp_path, extra_args):
+    args = bench_scan.parse_args([
+        "--profiles", "6", "--posts-per-profile", "15", "--comments-per-post", "2", "--stories-per-profile", "1",
+        "--hashtags", "1", "--hashtag-posts", "5", "--media-kb", "1", *extra_args
+    ])
+
+    report = bench_scan.run_benchmark(args, str(tmp_path))
+
+    assert not report["interrupted"]
+    assert report["posts"] >= 90
+    assert report["firestore_write_fallbacks"] == 0
+    assert report["firestore_commits_per_post"] <= args.max_firestore_commits_per_post
+    assert bench_scan.check_limits(args, report) == []
+
+def test_exceeded_limits_are_reported():
+    args = bench_scan.parse_args(["--min-posts-per-sec", "100", "--max-firestore-commits-per-post", "0.05"])
+    report = {"posts_per_sec": 50.0, "firestore_ops_per_post": 3.0, "firestore_commits_per_post": 0.2,
+              "firestore_write_fallbacks": 2, "peak_rss_mb": 80.0}
+    failures = bench_scan.check_limits(args, report)
+    assert len(failures) == 3
+    assert any("reenviadas individualmente" in failure for failure in failures)
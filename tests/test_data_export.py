@@ -0,0 +1,96 @@
+# /search_instagram/tests/test_data_export.py
+from datetime import datetime, timezone
+import gzip
+import json
+
+import pytest
+
+from data_export import RunExporter
+from local_storage_service import LocalStorageService
+
+DAY = datetime(2026, 1, 10, 15, tzinfo=timezone.utc)
+
+@pytest.fixture
+def storage(tmp_path):
+    return LocalStorageService(str(tmp_path))
+
+def read_rows(storage, path: str):
+    data = storage.download_bytes(path[len(f"file://{storage.root_dir}/"):])
+    return [json.loads(line) for line in gzip.decompress(data).splitlines()]
+
+def read_manifest(storage, name: str):
+    return json.loads(storage.download_bytes(name))
+
+def test_close_uploads_open_parts_and_writes_the_manifest(storage):
+    exporter = RunExporter(storage, 'run-1')
+    exporter.add('posts', 'A', {"likes": 1, "post_date_utc": DAY}, DAY, 'alice')
+    exporter.add('posts', 'B', {"likes": 2}, DAY, 'alice')
+    exporter.add('comments', 'c1', {"text": "olá"}, DAY, None)
+
+    manifest_path = exporter.close()
+
+    assert manifest_path == storage.uri('exports/manifests/run-1.json')
+    manifest = read_manifest(storage, 'exports/manifests/run-1.json')
+    assert manifest['row_counts'] == {"posts": 2, "comments": 1}
+    files = {(entry['record_type'], entry['owner']): entry for entry in manifest['files']}
+    assert files[('posts', 'alice')]['path'].startswith(storage.uri(f"exports/posts/dt=2026-01-10/owner=alice/run-1-{exporter.session_id}-"))
+    assert read_rows(storage, files[('posts', 'alice')]['path']) == [
+        {"id": "A", "likes": 1, "post_date_utc": DAY.isoformat()},
+        {"id": "B", "likes": 2},
+    ]
+    assert read_rows(storage, files[('comments', '_unknown')]['path']) == [{"id": "c1", "text": "olá"}]
+    assert exporter.rows_exported == 3
+
+def test_rows_after_close_are_ignored(storage):
+    exporter = RunExporter(storage, 'run-1')
+    assert exporter.close() is None
+    exporter.add('posts', 'A', {}, DAY, 'alice')
+    assert exporter.close() is None
+    assert storage.download_bytes('exports/manifests/run-1.json') is None
+
+def test_part_is_rotated_at_the_size_limit(storage):
+    exporter = RunExporter(storage, 'run-1', part_size_bytes=1)
+    for index in range(3):
+        exporter.add('posts', f"p{index}", {"caption": "x" * 100}, DAY, 'alice')
+    # Cada linha excede o limite: uma parte por linha, enviada sem esperar o close.
+    assert exporter.rows_exported == 3
+    exporter.close()
+
+    files = read_manifest(storage, 'exports/manifests/run-1.json')['files']
+    assert [entry['rows'] for entry in files] == [1, 1, 1]
+    assert len({entry['path'] for entry in files}) == 3
+    assert [read_rows(storage, entry['path'])[0]['id'] for entry in files] == ["p0", "p1", "p2"]
+
+def test_least_recently_used_partition_is_uploaded_beyond_max_open_parts(storage):
+    exporter = RunExporter(storage, 'run-1', max_open_parts=2)
+    exporter.add('posts', 'A', {}, DAY, 'alice')
+    exporter.add('posts', 'B', {}, DAY, 'bob')
+    exporter.add('posts', 'C', {}, DAY, 'alice')
+    exporter.add('posts', 'D', {}, DAY, 'carol')
+    # 'bob' era a partição usada há mais tempo.
+    assert exporter.rows_exported == 1
+    exporter.close()
+
+    files = read_manifest(storage, 'exports/manifests/run-1.json')['files']
+    assert [(entry['owner'], entry['rows']) for entry in files] == [("bob", 1), ("alice", 2), ("carol", 1)]
+
+def test_resumed_run_appends_to_the_existing_manifest(storage):
+    first = RunExporter(storage, 'run-1')
+    first.add('posts', 'A', {}, DAY, 'alice')
+    first.close()
+    resumed = RunExporter(storage, 'run-1')
+    resumed.add('posts', 'B', {}, DAY, 'alice')
+    resumed.close()
+
+    manifest = read_manifest(storage, 'exports/manifests/run-1.json')
+    assert manifest['row_counts'] == {"posts": 2}
+    assert len({entry['path'] for entry in manifest['files']}) == 2
+
+def test_failed_upload_is_left_out_of_the_manifest(storage, monkeypatch):
+    exporter = RunExporter(storage, 'run-1', manifest_id='task-1')
+    exporter.add('posts', 'A', {}, DAY, 'alice')
+    upload_bytes = storage.upload_bytes
+    monkeypatch.setattr(storage, "upload_bytes", lambda data, name, content_type: None if name.endswith('.ndjson.gz') else upload_bytes(data, name, content_type))
+    assert exporter.close() is None
+    assert exporter.rows_exported == 0
+    assert storage.download_bytes('exports/manifests/run-1/task-1.json') is None
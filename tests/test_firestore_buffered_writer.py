@@ -0,0 +1,129 @@
+# /search_instagram/tests/test_firestore_buffered_writer.py
+from google.cloud import firestore
+import pytest
+
+import firestore_service
+from benchmarks.fakes import InMemoryFirestoreClient
+from firestore_service import FirestoreBufferedWriter, FirestoreService
+
+class RecordingFirestoreClient(InMemoryFirestoreClient):
+    """
+    Cliente em memória que registra as operações de cada commit e pode
+    falhar os primeiros 'failing_commits' commits em lote.
+    """
+    def __init__(self, failing_commits: int = 0):
+        super().__init__()
+        self.failing_commits = failing_commits
+        self.committed: list = []
+
+    def _commit(self, operations):
+        if len(operations) > 1 and self.failing_commits > 0:
+            self.failing_commits -= 1
+            raise RuntimeError("Falha simulada do lote.")
+        super()._commit(operations)
+        self.committed.append([(op_type, reference.path) for op_type, reference, _, _ in operations])
+
+def doc(db, collection_path, doc_id):
+    return db.collection(collection_path).document(doc_id).get().to_dict()
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(firestore_service.time, "sleep", lambda seconds: None)
+
+def test_flushes_when_batch_size_is_reached():
+    db = RecordingFirestoreClient()
+    writer = FirestoreBufferedWriter(db, max_batch_size=3, flush_interval_seconds=0)
+    for index in range(7):
+        writer.set('posts', f"p{index}", {"index": index})
+    assert [len(ops) for ops in db.committed] == [3, 3]
+    writer.close()
+    assert [len(ops) for ops in db.committed] == [3, 3, 1]
+    assert writer.committed_ops == 7
+    assert db.document_count('posts') == 7
+
+def test_batch_size_is_capped_at_firestore_limit():
+    writer = FirestoreBufferedWriter(RecordingFirestoreClient(), max_batch_size=1000, flush_interval_seconds=0)
+    assert writer.max_batch_size == FirestoreBufferedWriter.MAX_BATCH_SIZE
+
+def test_close_flushes_pending_operations_and_stops_periodic_flush():
+    db = RecordingFirestoreClient()
+    with FirestoreBufferedWriter(db, flush_interval_seconds=60) as writer:
+        writer.set('posts', 'p1', {"caption": "a"})
+        assert db.committed == []
+    assert db.committed == [[('set', 'posts/p1')]]
+    assert writer._flush_thread is None
+
+def test_update_after_pending_set_is_folded_into_the_set():
+    db = RecordingFirestoreClient()
+    with FirestoreBufferedWriter(db, flush_interval_seconds=0) as writer:
+        writer.set('posts', 'p1', {"caption": "a", "media": {"width": 1}})
+        writer.set('posts', 'p2', {"caption": "b"})
+        writer.update('posts', 'p1', {"gcs_media_path": "gs://m/p1", "media.height": 2})
+        writer.update('posts', 'p1', {"collected_from_hashtags": firestore.ArrayUnion(["x"])})
+    assert db.committed == [[('set', 'posts/p1'), ('set', 'posts/p2')]]
+    assert doc(db, 'posts', 'p1') == {
+        "caption": "a",
+        "media": {"width": 1, "height": 2},
+        "gcs_media_path": "gs://m/p1",
+        "collected_from_hashtags": ["x"]
+    }
+    assert writer.fallback_ops == 0
+
+def test_update_after_flushed_set_is_committed_as_update():
+    db = RecordingFirestoreClient()
+    with FirestoreBufferedWriter(db, flush_interval_seconds=0) as writer:
+        writer.set('posts', 'p1', {"caption": "a"})
+        writer.flush()
+        writer.update('posts', 'p1', {"likes_count": 3})
+    assert db.committed == [[('set', 'posts/p1')], [('update', 'posts/p1')]]
+    assert doc(db, 'posts', 'p1') == {"caption": "a", "likes_count": 3}
+
+def test_update_is_not_folded_across_an_earlier_update():
+    db = RecordingFirestoreClient()
+    db.collection('posts').document('p1').set({"likes_count": 1})
+    with FirestoreBufferedWriter(db, flush_interval_seconds=0) as writer:
+        writer.set('posts', 'p1', {"caption": "a"})
+        writer.update('posts', 'p1', {"meta": {"a": 1}})
+        writer.update('posts', 'p1', {"likes_count": 2})
+    assert db.committed[-1] == [('set', 'posts/p1'), ('update', 'posts/p1'), ('update', 'posts/p1')]
+    assert doc(db, 'posts', 'p1') == {"caption": "a", "likes_count": 2, "meta": {"a": 1}}
+
+def test_failed_batch_is_retried_then_resent_per_operation():
+    db = RecordingFirestoreClient(failing_commits=3)
+    with FirestoreBufferedWriter(db, flush_interval_seconds=0, max_retries=3) as writer:
+        writer.set('posts', 'p1', {"caption": "a"})
+        writer.set('posts', 'p2', {"caption": "b"})
+    assert db.committed == [[('set', 'posts/p1')], [('set', 'posts/p2')]]
+    assert (writer.committed_ops, writer.failed_ops, writer.fallback_ops) == (2, 0, 2)
+
+def test_failed_batch_succeeds_on_retry():
+    db = RecordingFirestoreClient(failing_commits=1)
+    with FirestoreBufferedWriter(db, flush_interval_seconds=0, max_retries=3) as writer:
+        writer.set('posts', 'p1', {"caption": "a"})
+        writer.set('posts', 'p2', {"caption": "b"})
+    assert db.committed == [[('set', 'posts/p1'), ('set', 'posts/p2')]]
+    assert (writer.committed_ops, writer.fallback_ops) == (2, 0)
+
+def test_update_of_missing_document_only_fails_that_operation():
+    db = RecordingFirestoreClient()
+    with FirestoreBufferedWriter(db, flush_interval_seconds=0) as writer:
+        writer.set('posts', 'p1', {"caption": "a"})
+        writer.update('posts', 'missing', {"likes_count": 1})
+        writer.set('posts', 'p2', {"caption": "b"})
+    assert (writer.committed_ops, writer.failed_ops, writer.fallback_ops) == (2, 1, 3)
+    assert db.document_count('posts') == 2
+    assert doc(db, 'posts', 'missing') is None
+
+def test_checkpoint_is_committed_after_the_post_data():
+    db = RecordingFirestoreClient()
+    service = FirestoreService(db=db)
+    with service.buffered_writes() as writer:
+        writer.max_batch_size = 2
+        service.save_instagram_data('instagram_posts', {"caption": "a"}, 'p1')
+        service.save_instagram_data('instagram_posts', {"caption": "b"}, 'p2')
+        service.save_instagram_data('instagram_posts', {"caption": "c"}, 'p3')
+        service.save_scan_checkpoint_progress('run-1', 'profile:alice', {"posts_seen": 3})
+    paths = [path for ops in db.committed for _, path in ops]
+    assert paths == ['instagram_posts/p1', 'instagram_posts/p2', 'instagram_posts/p3', 'scan_checkpoints/run-1']
+    assert service.active_writer is None
+    assert doc(db, 'scan_checkpoints', 'run-1')['in_progress'] == {"profile:alice": {"posts_seen": 3}}
@@ -0,0 +1,73 @@
+# /search_instagram/tests/test_job_runner.py
+import asyncio
+import threading
+
+from fastapi import HTTPException
+import pytest
+
+import main
+from benchmarks.fakes import InMemoryFirestoreClient
+from firestore_service import FirestoreService
+from job_runner import JobRunner, JobAlreadyRunningError
+
+@pytest.fixture
+def firestore_service():
+    return FirestoreService(db=InMemoryFirestoreClient())
+
+def make_runner(firestore_service) -> JobRunner:
+    runner = JobRunner(max_workers=2, lock_lease_seconds=600)
+    runner._firestore_service = firestore_service
+    return runner
+
+def blocking_job(started: threading.Event):
+    def fn(job):
+        started.set()
+        job.cancel_event.wait(5)
+    return fn
+
+def test_lock_held_by_the_same_run_is_not_acquired_again(firestore_service):
+    assert firestore_service.acquire_job_lock('daily_scan', 'run-1', 600) == (True, 'run-1')
+    assert firestore_service.acquire_job_lock('daily_scan', 'run-1', 600) == (False, 'run-1')
+    assert firestore_service.acquire_job_lock('daily_scan', 'run-2', 600) == (False, 'run-1')
+
+def test_expired_or_released_lock_can_be_acquired(firestore_service):
+    assert firestore_service.acquire_job_lock('daily_scan', 'run-1', -1) == (True, 'run-1')
+    assert firestore_service.acquire_job_lock('daily_scan', 'run-2', 600) == (True, 'run-2')
+    assert firestore_service.release_job_lock('daily_scan', 'run-2')
+    assert firestore_service.acquire_job_lock('daily_scan', 'run-2', 600) == (True, 'run-2')
+
+def test_resubmitting_a_running_run_id_is_refused(firestore_service):
+    runner = make_runner(firestore_service)
+    started = threading.Event()
+    job = runner.submit('daily_scan', blocking_job(started), run_id='run-1')
+    assert started.wait(5)
+    try:
+        with pytest.raises(JobAlreadyRunningError):
+            runner.submit('daily_scan', blocking_job(threading.Event()), run_id='run-1')
+        # Outra instância, com o mesmo lock no Firestore.
+        with pytest.raises(JobAlreadyRunningError) as error:
+            make_runner(firestore_service).submit('daily_scan', blocking_job(threading.Event()), run_id='run-1')
+        assert error.value.holder_run_id == 'run-1'
+        assert runner.get('run-1') is job
+    finally:
+        runner.shutdown()
+    assert job.status == 'cancelled'
+
+def test_resume_while_running_answers_409(firestore_service, monkeypatch):
+    runner = make_runner(firestore_service)
+    monkeypatch.setattr(main, "job_runner", runner)
+    firestore_service.update_scan_checkpoint_status('run-1', 'running')
+    started = threading.Event()
+    runner.submit('daily_scan', blocking_job(started), run_id='run-1')
+    assert started.wait(5)
+    try:
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(main.resume_scan('run-1'))
+        assert error.value.status_code == 409
+        # A mesma execução em outra instância: recusada pelo lock.
+        monkeypatch.setattr(main, "job_runner", make_runner(firestore_service))
+        with pytest.raises(HTTPException) as error:
+            asyncio.run(main.resume_scan('run-1'))
+        assert error.value.status_code == 409
+    finally:
+        runner.shutdown()
@@ -0,0 +1,132 @@
+# /search_instagram/tests/test_media_postprocess.py
+from contextlib import contextmanager
+from io import BytesIO
+import struct
+import threading
+
+import pytest
+
+from local_storage_service import LocalStorageService
+from media_postprocess import MediaPostProcessor, parse_mp4_moov, thumbnail_path
+
+def box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+def moov_payload(duration_seconds: int, width: int, height: int) -> bytes:
+    # mvhd versão 0: versão/flags, criação, modificação, timescale e duração.
+    mvhd = box(b'mvhd', struct.pack(">IIIII", 0, 0, 0, 1000, duration_seconds * 1000) + bytes(80))
+    tkhd = box(b'tkhd', bytes(76) + struct.pack(">II", width << 16, height << 16))
+    return mvhd + box(b'trak', tkhd)
+
+def mp4(duration_seconds: int, width: int, height: int, moov_first: bool = False) -> bytes:
+    moov = box(b'moov', moov_payload(duration_seconds, width, height))
+    boxes = [box(b'ftyp', b'isom' + bytes(4)), box(b'mdat', bytes(4096))]
+    boxes.insert(1 if moov_first else 2, moov)
+    return b"".join(boxes)
+
+def jpeg(width: int, height: int) -> bytes:
+    from PIL import Image
+
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), (200, 30, 30)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+class CoverBackend:
+    def __init__(self, covers):
+        self.covers = covers
+
+    @contextmanager
+    def open_media(self, url: str):
+        data = self.covers[url]
+        yield BytesIO(data), len(data)
+
+@pytest.fixture
+def storage(tmp_path):
+    return LocalStorageService(str(tmp_path))
+
+@pytest.fixture
+def make_processor(storage):
+    processors = []
+
+    def make(covers=None, **kwargs):
+        processor = MediaPostProcessor(storage, CoverBackend(covers or {}), workers=1, **kwargs)
+        processors.append(processor)
+        return processor
+    yield make
+    for processor in processors:
+        processor.close()
+
+@pytest.mark.parametrize("moov_first", [True, False])
+def test_video_duration_and_dimensions_come_from_the_moov_box(storage, make_processor, moov_first):
+    data = mp4(12, 1080, 1920, moov_first)
+    storage.upload_bytes(data, "media/p/ABC.mp4", "video/mp4")
+
+    fields = make_processor().process("media/p/ABC.mp4", len(data), True, None)
+
+    assert fields == {"media_duration_seconds": 12.0, "media_width": 1080, "media_height": 1920, "media_postprocess_status": "skipped"}
+
+def test_parse_mp4_moov_ignores_truncated_boxes():
+    moov = moov_payload(3, 640, 640)
+    assert parse_mp4_moov(moov) == {"duration_seconds": 3.0, "width": 640, "height": 640}
+    assert parse_mp4_moov(moov[:30]) == {}
+
+def test_image_is_analyzed_in_the_process_pool(storage, make_processor):
+    pytest.importorskip("PIL")
+    data = jpeg(640, 480)
+    storage.upload_bytes(data, "media/p/ABC.jpg", "image/jpeg")
+    results = []
+    done = threading.Event()
+
+    processor = make_processor(thumbnail_size=64)
+    processor.submit("media/p/ABC.jpg", len(data), False, None, lambda fields: (results.append(fields), done.set()))
+    assert done.wait(60)
+
+    fields = results[0]
+    assert fields["media_width"] == 640 and fields["media_height"] == 480
+    assert len(fields["media_dhash"]) == 16
+    assert fields["media_thumbnail_path"] == storage.uri(thumbnail_path("media/p/ABC.jpg"))
+    assert fields["media_postprocess_status"] == "done"
+    from PIL import Image
+    with Image.open(BytesIO(storage.download_bytes("media/p/ABC.thumb.jpg"))) as thumbnail:
+        assert max(thumbnail.size) == 64
+
+def test_video_thumbnail_comes_from_the_cover(storage, make_processor):
+    pytest.importorskip("PIL")
+    data = mp4(5, 720, 1280)
+    storage.upload_bytes(data, "media/p/ABC.mp4", "video/mp4")
+    processor = make_processor(covers={"https://cdn/cover.jpg": jpeg(360, 640)})
+
+    fields = processor.process("media/p/ABC.mp4", len(data), True, "https://cdn/cover.jpg")
+
+    # As dimensões do vídeo prevalecem sobre as da capa.
+    assert (fields["media_width"], fields["media_height"]) == (720, 1280)
+    assert fields["media_thumbnail_path"] == storage.uri("media/p/ABC.thumb.jpg")
+    assert fields["media_postprocess_status"] == "done"
+
+def test_oversized_image_is_skipped(storage, make_processor):
+    fields = make_processor(max_source_bytes=10).process("media/p/ABC.jpg", 11, False, None)
+    assert fields == {"media_postprocess_status": "skipped"}
+
+def test_corrupt_image_reports_a_failure_and_frees_the_slot(storage, make_processor):
+    pytest.importorskip("PIL")
+    storage.upload_bytes(b"not an image", "media/p/BAD.jpg", "image/jpeg")
+    data = jpeg(32, 32)
+    storage.upload_bytes(data, "media/p/OK.jpg", "image/jpeg")
+    results = {}
+    done = threading.Semaphore(0)
+
+    def on_complete(name):
+        def record(fields):
+            results[name] = fields
+            done.release()
+        return record
+
+    # Fila de uma mídia: a segunda só entra se a falha liberar a vaga.
+    processor = make_processor(max_queue_size=0)
+    processor.submit("media/p/BAD.jpg", 12, False, None, on_complete("bad"))
+    processor.submit("media/p/OK.jpg", len(data), False, None, on_complete("ok"))
+    assert done.acquire(timeout=60) and done.acquire(timeout=60)
+
+    assert results["bad"] is None
+    assert results["ok"]["media_postprocess_status"] == "done"
+    assert storage.download_bytes("media/p/BAD.thumb.jpg") is None
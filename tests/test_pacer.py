@@ -0,0 +1,106 @@
+# /search_instagram/tests/test_pacer.py
+from types import SimpleNamespace
+
+import pytest
+
+import pacer
+from pacer import AdaptivePacer
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(pacer.time, "monotonic", clock.monotonic)
+    return clock
+
+def make_pacer(clock, **kwargs) -> AdaptivePacer:
+    config = dict(rate_per_minute=30.0, min_rate_per_minute=2.0, max_rate_per_minute=31.0, burst=2.0,
+                  backoff_base_seconds=10.0, backoff_max_seconds=35.0, jitter=0.0, sleep_fn=clock.sleep)
+    config.update(kwargs)
+    return AdaptivePacer(**config)
+
+def test_token_bucket_waits_only_after_the_burst(clock):
+    paced = make_pacer(clock)
+    assert paced.acquire() == 0.0
+    assert paced.acquire() == 0.0
+    # 30/min: um token a cada 2 s.
+    assert paced.acquire() == pytest.approx(2.0)
+    assert paced.acquire() == pytest.approx(2.0)
+    assert clock.sleeps == [pytest.approx(2.0), pytest.approx(2.0)]
+    assert paced.stats()["wait_seconds"] == pytest.approx(4.0)
+
+def test_idle_time_refills_the_bucket_up_to_the_burst(clock):
+    paced = make_pacer(clock)
+    for _ in range(3):
+        paced.acquire()
+    clock.now += 600
+    assert paced.acquire() == 0.0
+    assert paced.acquire() == 0.0
+    assert paced.acquire() == pytest.approx(2.0)
+
+def test_rate_increases_additively_up_to_the_maximum(clock):
+    paced = make_pacer(clock, increase_per_success=0.4)
+    paced.on_success()
+    assert paced.rate_per_minute == pytest.approx(30.4)
+    for _ in range(5):
+        paced.on_success()
+    assert paced.rate_per_minute == 31.0
+
+def test_throttles_halve_the_rate_down_to_the_minimum(clock):
+    paced = make_pacer(clock)
+    rates = []
+    for _ in range(5):
+        paced.on_throttle()
+        rates.append(paced.rate_per_minute)
+    assert rates == [15.0, 7.5, 3.75, 2.0, 2.0]
+
+def test_backoff_doubles_per_consecutive_throttle_until_a_success(clock):
+    paced = make_pacer(clock)
+    assert [paced.on_throttle() for _ in range(4)] == [10.0, 20.0, 35.0, 35.0]
+    assert paced.consecutive_throttles == 4
+    paced.on_success()
+    assert paced.consecutive_throttles == 0
+    assert paced.on_throttle() == 10.0
+    assert clock.sleeps == [10.0, 20.0, 35.0, 35.0, 10.0]
+    stats = paced.stats()
+    assert stats["throttles"] == 5
+    assert stats["backoff_seconds"] == 110.0
+
+def test_throttle_empties_the_bucket(clock):
+    paced = make_pacer(clock, backoff_base_seconds=2.0)
+    paced.on_throttle()
+    # Taxa de 15/min após o 429: o backoff de 2 s repõe meio token, e o
+    # restante do próximo leva mais 2 s.
+    assert paced.acquire() == pytest.approx(2.0)
+    assert paced.acquire() == pytest.approx(4.0)
+
+def test_responses_update_the_rate(clock):
+    paced = make_pacer(clock, server_error_backoff_seconds=5.0)
+    paced.observe_response(SimpleNamespace(status_code=200))
+    assert paced.rate_per_minute == pytest.approx(30.1)
+    paced.observe_response(SimpleNamespace(status_code=404))
+    assert paced.rate_per_minute == pytest.approx(30.1)
+    paced.observe_response(SimpleNamespace(status_code=503))
+    assert paced.rate_per_minute == pytest.approx(15.05)
+    assert clock.sleeps == [5.0]
+    # 429 é tratado em PacedRateController.handle_429, não no hook.
+    paced.observe_response(SimpleNamespace(status_code=429))
+    assert paced.stats()["throttles"] == 0
+
+def test_account_overrides_take_precedence_over_the_environment(monkeypatch):
+    monkeypatch.setenv("PACER_RATE_PER_MINUTE", "12")
+    monkeypatch.setenv("PACER_BURST", "3")
+    paced = AdaptivePacer.from_config({"rate_per_minute": "8", "unknown": 1})
+    assert paced.rate_per_minute == 8.0
+    assert paced.burst == 3.0
@@ -0,0 +1,82 @@
+# /search_instagram/tests/test_post_index.py
+import pytest
+
+from benchmarks.fakes import InMemoryFirestoreClient
+from firestore_service import FirestoreService
+from local_storage_service import LocalStorageService
+from post_index import BloomFilter, PostIndex
+
+@pytest.fixture
+def firestore_service():
+    return FirestoreService(db=InMemoryFirestoreClient())
+
+@pytest.fixture
+def storage(tmp_path):
+    return LocalStorageService(str(tmp_path))
+
+def make_index(firestore_service, storage) -> PostIndex:
+    index = PostIndex(firestore_service, storage, capacity=1000)
+    index.load()
+    return index
+
+def stored_bloom(storage) -> BloomFilter:
+    return BloomFilter.from_bytes(storage.download_bytes("instagram/indexes/posts.bloom"))
+
+def test_claim_is_granted_once_per_run_until_released(firestore_service, storage):
+    index = make_index(firestore_service, storage)
+    assert index.claim("ABC")
+    assert not index.claim("ABC")
+    assert index.duplicates == 1
+    index.release("ABC")
+    assert index.claim("ABC")
+    assert index.claimed_shortcodes() == ["ABC"]
+    # Sem o índice persistente, nenhum post precisa de confirmação no Firestore.
+    assert index.confirmations == 0
+
+def test_post_in_the_persistent_index_is_confirmed_in_firestore(firestore_service, storage):
+    previous = make_index(firestore_service, storage)
+    for shortcode in ("SAVED", "LOST"):
+        previous.claim(shortcode)
+    previous.save()
+    # Apenas 'SAVED' chegou ao Firestore; 'LOST' se comporta como um falso positivo do filtro.
+    firestore_service.db.collection('instagram_posts').document("SAVED").set({"shortcode": "SAVED"})
+
+    index = make_index(firestore_service, storage)
+    assert "LOST" in index.bloom
+    assert not index.claim("SAVED")
+    assert index.claim("LOST")
+    assert index.claim("NEW")
+    assert index.confirmations == 2
+    assert index.duplicates == 1
+
+def test_save_merges_with_a_concurrent_save_after_a_conflict(firestore_service, storage):
+    first = make_index(firestore_service, storage)
+    second = make_index(firestore_service, storage)
+    first.claim("FIRST")
+    second.claim("SECOND")
+
+    download = storage.download_bytes_versioned
+    def download_then_concurrent_save(name):
+        result = download(name)
+        if storage.download_bytes_versioned is download_then_concurrent_save:
+            # A outra execução grava o índice entre a leitura e o upload condicional.
+            storage.download_bytes_versioned = download
+            second.save()
+        return result
+    storage.download_bytes_versioned = download_then_concurrent_save
+
+    first.save()
+
+    assert first.save_conflicts == 1
+    assert second.save_conflicts == 0
+    bloom = stored_bloom(storage)
+    assert "FIRST" in bloom and "SECOND" in bloom
+
+def test_save_gives_up_after_max_attempts(firestore_service, storage, monkeypatch):
+    index = PostIndex(firestore_service, storage, capacity=1000, max_save_attempts=3)
+    index.load()
+    index.claim("ABC")
+    monkeypatch.setattr(storage, "upload_bytes_if_version", lambda *args: False)
+    index.save()
+    assert index.save_conflicts == 3
+    assert storage.download_bytes("instagram/indexes/posts.bloom") is None
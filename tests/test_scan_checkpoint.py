@@ -0,0 +1,179 @@
+# /search_instagram/tests/test_scan_checkpoint.py
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import json
+
+import instaloader
+
+from benchmarks.fakes import InMemoryFirestoreClient
+from firestore_service import FirestoreService
+from scan_checkpoint import ScanCheckpoint
+
+TARGET = 'profile:alice'
+
+def make_pages(page_count: int, page_size: int) -> list:
+    pages = []
+    for page in range(page_count):
+        pages.append({
+            "edges": [{"node": {"id": page * page_size + index}} for index in range(page_size)],
+            "page_info": {"has_next_page": page < page_count - 1, "end_cursor": f"cursor-{page}"}
+        })
+    return pages
+
+class FakeNodeIterator(instaloader.NodeIterator):
+    """
+    NodeIterator com as páginas em memória. Usa __next__, freeze() e thaw()
+    do Instaloader; apenas a consulta de páginas (_query) é substituída.
+    """
+    def __init__(self, pages: list):
+        self._pages = pages
+        self._context = SimpleNamespace(username="bench")
+        self._query_hash = "hash"
+        self._query_variables = {"id": 1}
+        self._query_referer = None
+        self._doc_id = None
+        self._node_wrapper = lambda node: node
+        self._is_first = None
+        self._first_node = None
+        self._best_before = datetime.now() + timedelta(days=1)
+        self._data = pages[0]
+        self._page_index = 0
+        self._total_index = 0
+        self.queried_cursors = []
+
+    def _query(self, after=None):
+        self.queried_cursors.append(after)
+        return self._pages[int(after.rsplit('-', 1)[1]) + 1]
+
+class UntrackedNodeIterator(instaloader.NodeIterator):
+    """
+    Iterador de uma versão do Instaloader sem '_data' e '_page_index'.
+    """
+    def __init__(self, nodes: list):
+        self._nodes = nodes
+        self._position = 0
+
+    def __next__(self):
+        self._position += 1
+        return self._nodes[self._position - 1]
+
+    def freeze(self):
+        return instaloader.FrozenNodeIterator("hash", {}, None, "bench", self._position, 1.0, {"edges": self._nodes[self._position - 1:]}, None, None)
+
+def make_checkpoint(save_every_posts: int = 3):
+    service = FirestoreService(db=InMemoryFirestoreClient())
+    return service, ScanCheckpoint(service, 'run-1', save_every_posts=save_every_posts)
+
+def saved_progress(service) -> dict:
+    return (service.get_scan_checkpoint('run-1') or {}).get('in_progress', {}).get(TARGET)
+
+def scan(checkpoint, iterator, posts: int):
+    for _ in range(posts):
+        node = next(iterator)
+        checkpoint.save_progress(TARGET, iterator, {"last_post_id": node["id"]})
+    return node
+
+def test_position_is_saved_at_page_start_and_every_n_posts():
+    service, checkpoint = make_checkpoint(save_every_posts=3)
+    iterator = FakeNodeIterator(make_pages(3, 5))
+    scan(checkpoint, iterator, 1)
+    progress = saved_progress(service)
+    assert (progress['page_cursor'], progress['page_start_index'], progress['page_offset']) == (None, 0, 1)
+    assert json.loads(progress['frozen_iterator'])['remaining_data'] is None
+
+    scan(checkpoint, iterator, 2)
+    assert saved_progress(service)['page_offset'] == 1
+    scan(checkpoint, iterator, 1)
+    assert saved_progress(service)['page_offset'] == 4
+
+    # Primeiro post da segunda página: gravado com o cursor que a busca.
+    scan(checkpoint, iterator, 2)
+    progress = saved_progress(service)
+    assert (progress['page_cursor'], progress['page_start_index'], progress['page_offset']) == ("cursor-0", 5, 1)
+    assert progress['watermark'] == {"last_post_id": 5}
+
+def test_flush_progress_saves_the_unsaved_position():
+    service, checkpoint = make_checkpoint(save_every_posts=10)
+    iterator = FakeNodeIterator(make_pages(2, 5))
+    scan(checkpoint, iterator, 3)
+    assert saved_progress(service)['page_offset'] == 1
+    checkpoint.flush_progress(TARGET)
+    assert saved_progress(service)['page_offset'] == 3
+
+def test_resume_refetches_the_page_and_skips_the_posts_already_seen():
+    service, checkpoint = make_checkpoint(save_every_posts=1)
+    scan(checkpoint, FakeNodeIterator(make_pages(3, 5)), 7)
+
+    resumed = ScanCheckpoint(service, 'run-1')
+    assert resumed.load()
+    iterator = FakeNodeIterator(make_pages(3, 5))
+    skip_posts = resumed.resume_iterator(TARGET, iterator)
+    assert skip_posts == 2
+    assert iterator.total_index == 5
+    nodes = [next(iterator)["id"] for _ in range(skip_posts + 1)]
+    assert iterator.queried_cursors == ["cursor-0"]
+    assert nodes == [5, 6, 7]
+
+def test_resume_on_the_first_page_only_skips():
+    service, checkpoint = make_checkpoint(save_every_posts=1)
+    scan(checkpoint, FakeNodeIterator(make_pages(2, 5)), 2)
+
+    resumed = ScanCheckpoint(service, 'run-1')
+    resumed.load()
+    iterator = FakeNodeIterator(make_pages(2, 5))
+    assert resumed.resume_iterator(TARGET, iterator) == 2
+    assert iterator.total_index == 0
+    assert iterator.queried_cursors == []
+
+def test_resume_with_incompatible_position_restarts_the_target():
+    service, checkpoint = make_checkpoint(save_every_posts=1)
+    scan(checkpoint, FakeNodeIterator(make_pages(3, 5)), 7)
+
+    resumed = ScanCheckpoint(service, 'run-1')
+    resumed.load()
+    iterator = FakeNodeIterator(make_pages(3, 5))
+    iterator._query_variables = {"id": 2}
+    assert resumed.resume_iterator(TARGET, iterator) == 0
+    assert iterator.total_index == 0
+
+def test_untracked_iterator_falls_back_to_full_freeze():
+    service, checkpoint = make_checkpoint(save_every_posts=2)
+    iterator = UntrackedNodeIterator([{"id": index} for index in range(5)])
+    assert not hasattr(iterator, '_data')
+    scan(checkpoint, iterator, 1)
+    assert saved_progress(service) is None
+    scan(checkpoint, iterator, 1)
+    frozen = json.loads(saved_progress(service)['frozen_iterator'])
+    assert frozen['remaining_data'] == {"edges": [{"id": 1}, {"id": 2}, {"id": 3}, {"id": 4}]}
+    assert 'page_cursor' not in saved_progress(service)
+
+    scan(checkpoint, iterator, 1)
+    checkpoint.flush_progress(TARGET)
+    assert json.loads(saved_progress(service)['frozen_iterator'])['total_index'] == 3
+
+def test_full_freeze_checkpoint_is_thawed_without_skipping():
+    service, checkpoint = make_checkpoint()
+    iterator = FakeNodeIterator(make_pages(2, 5))
+    for _ in range(3):
+        next(iterator)
+    service.save_scan_checkpoint_progress('run-1', TARGET, {"frozen_iterator": json.dumps(iterator.freeze()._asdict())})
+
+    checkpoint.load()
+    resumed = FakeNodeIterator(make_pages(2, 5))
+    assert checkpoint.resume_iterator(TARGET, resumed) == 0
+    # O freeze() inclui o post corrente, que é processado novamente.
+    assert next(resumed)["id"] == 2
+
+def test_mark_completed_drops_the_position():
+    service, checkpoint = make_checkpoint(save_every_posts=1)
+    scan(checkpoint, FakeNodeIterator(make_pages(1, 5)), 2)
+    checkpoint.mark_completed(TARGET)
+    assert checkpoint.is_completed(TARGET)
+    assert checkpoint.get_watermark(TARGET) is None
+
+    stored = service.get_scan_checkpoint('run-1')
+    assert stored['completed_targets'] == [TARGET]
+    assert TARGET not in stored['in_progress']
+    reloaded = ScanCheckpoint(service, 'run-1')
+    reloaded.load()
+    assert reloaded.is_completed(TARGET)
@@ -0,0 +1,77 @@
+# /search_instagram/tests/test_scan_fanout.py
+import threading
+
+import pytest
+
+from benchmarks.fakes import InMemoryFirestoreClient
+from firestore_service import FirestoreService
+from scan_checkpoint import ScanCheckpoint
+from task_queue import LocalTaskQueue, task_name
+
+@pytest.fixture
+def firestore_service():
+    return FirestoreService(db=InMemoryFirestoreClient())
+
+def start_run(firestore_service, targets_total: int):
+    firestore_service.log_system_event('run-1', 'search_instagram', 'daily_scan', 'started', "Varredura iniciada.")
+    firestore_service.start_fanout_run('run-1', targets_total)
+
+def test_target_delivered_twice_is_aggregated_once(firestore_service):
+    start_run(firestore_service, 2)
+    assert firestore_service.record_scan_task_result('run-1', 'profile:alice', 'completed', {"posts_new": 3}, ["A", "B"]) == 'running'
+    # Reentrega do mesmo alvo (ex: resposta perdida pelo Cloud Tasks).
+    assert firestore_service.record_scan_task_result('run-1', 'profile:alice', 'completed', {"posts_new": 3}, ["A", "B"]) is None
+
+    log_entry = firestore_service.get_system_log('run-1')
+    assert log_entry['status'] == 'running'
+    assert log_entry['fanout']['targets_completed'] == 1
+    assert log_entry['metrics']['posts_new'] == 3
+    assert sorted(firestore_service.get_fanout_post_shortcodes('run-1')) == ["A", "B"]
+
+def test_last_target_finalizes_the_run(firestore_service):
+    start_run(firestore_service, 2)
+    firestore_service.record_scan_task_result('run-1', 'profile:alice', 'completed', {"posts_new": 3})
+    assert firestore_service.record_scan_task_result('run-1', 'hashtag:bolo', 'completed', {"posts_new": 2, "note": "x"}) == 'completed'
+    assert firestore_service.record_scan_task_result('run-1', 'hashtag:bolo', 'failed') is None
+
+    log_entry = firestore_service.get_system_log('run-1')
+    assert log_entry['status'] == 'completed'
+    assert log_entry['end_time'] is not None
+    assert log_entry['fanout']['targets_completed'] == 2
+    assert log_entry['fanout']['targets_failed'] == 0
+    assert log_entry['metrics'] == {"posts_new": 5}
+
+@pytest.mark.parametrize("statuses, final_status", [
+    (['completed', 'failed'], 'interrupted'),
+    (['failed', 'cancelled'], 'cancelled'),
+])
+def test_final_status_reflects_failed_and_cancelled_targets(firestore_service, statuses, final_status):
+    start_run(firestore_service, len(statuses))
+    results = [firestore_service.record_scan_task_result('run-1', f"profile:{index}", status) for index, status in enumerate(statuses)]
+    assert results == ['running', final_status]
+    assert firestore_service.get_system_log('run-1')['status'] == final_status
+
+def test_local_queue_repeats_until_the_handler_succeeds_and_ignores_reenqueues(firestore_service):
+    start_run(firestore_service, 1)
+    attempts = []
+    done = threading.Event()
+
+    def handler(payload, attempt):
+        attempts.append(attempt)
+        if attempt < 2:
+            return False
+        target_key = ScanCheckpoint.target_key(payload['target_type'], payload['target_id'])
+        firestore_service.record_scan_task_result(payload['run_id'], target_key, 'completed')
+        done.set()
+        return True
+
+    queue = LocalTaskQueue(handler, workers=1, backoff_seconds=0)
+    name = task_name('run-1', ScanCheckpoint.target_key('profile', 'alice'))
+    payload = {"run_id": 'run-1', "target_type": 'profile', "target_id": 'alice'}
+    queue.enqueue(name, payload)
+    queue.enqueue(name, payload)
+    assert done.wait(5)
+    queue.shutdown()
+
+    assert attempts == [1, 2]
+    assert firestore_service.get_system_log('run-1')['status'] == 'completed'
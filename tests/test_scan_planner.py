@@ -0,0 +1,84 @@
+# /search_instagram/tests/test_scan_planner.py
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from models.records import MonitoredTarget
+from scan_planner import ScanPlanner
+
+NOW = datetime(2026, 1, 10, 12, tzinfo=timezone.utc)
+
+def profile(name: str, hours_ago=None, **fields) -> MonitoredTarget:
+    last_scan = NOW - timedelta(hours=hours_ago) if hours_ago is not None else None
+    return MonitoredTarget(kind="profile", name=name, last_scan_run_started_at=last_scan, **fields)
+
+def hashtag(name: str, hours_ago=None, **fields) -> MonitoredTarget:
+    last_scan = NOW - timedelta(hours=hours_ago) if hours_ago is not None else None
+    return MonitoredTarget(kind="hashtag", name=name, last_scan_run_started_at=last_scan, **fields)
+
+def names(targets):
+    return [target.name for target in targets]
+
+@pytest.mark.parametrize("fields, interval", [
+    ({}, 24.0),
+    ({"avg_posts_per_day": 1.0}, 48.0),
+    ({"avg_posts_per_day": 100.0}, 4.0),
+    ({"avg_posts_per_day": 0.0}, 168.0),
+    ({"avg_posts_per_day": 1.0, "priority": 2.0}, 24.0),
+    ({"priority": 0.0}, 168.0),
+])
+def test_desired_interval_follows_post_rate_and_priority(fields, interval):
+    assert ScanPlanner().desired_interval_hours(profile("alice", **fields)) == interval
+
+def test_targets_are_ordered_by_staleness_relative_to_interval():
+    planner = ScanPlanner()
+    profiles = [
+        profile("daily_late", hours_ago=30),                            # 30/24
+        profile("never_scanned"),                                       # inf
+        profile("active_late", hours_ago=12, avg_posts_per_day=8.0),    # 12/6
+        profile("fresh", hours_ago=2),                                  # não vencido
+    ]
+    hashtags = [hashtag("weekly_late", hours_ago=200, avg_posts_per_day=0.0)]  # 200/168
+
+    selected_profiles, selected_hashtags = planner.plan(profiles, hashtags, now=NOW)
+
+    assert names(selected_profiles) == ["never_scanned", "active_late", "daily_late"]
+    assert names(selected_hashtags) == ["weekly_late"]
+
+def test_nearly_due_target_is_included_within_slack():
+    planner = ScanPlanner(slack_hours=1.0)
+    selected, _ = planner.plan([profile("almost", hours_ago=23.5), profile("early", hours_ago=22.5)], [], now=NOW)
+    assert names(selected) == ["almost"]
+
+def test_last_scanned_at_is_used_without_run_start():
+    target = MonitoredTarget(kind="profile", name="legacy", last_scanned_at=NOW - timedelta(hours=2))
+    assert ScanPlanner().plan([target], [], now=NOW) == ([], [])
+
+def test_request_budget_skips_targets_that_do_not_fit():
+    planner = ScanPlanner(request_budget=100)
+    profiles = [
+        profile("first", avg_requests_per_scan=50.0),
+        profile("too_big", hours_ago=100, avg_requests_per_scan=80.0),
+        profile("small", hours_ago=30, avg_requests_per_scan=40.0),
+    ]
+    selected, _ = planner.plan(profiles, [hashtag("default_cost")], now=NOW)
+    # Os alvos que não cabem são adiados; os menores seguintes ainda entram.
+    assert names(selected) == ["first", "small"]
+
+def test_time_budget_scales_with_concurrency():
+    planner = ScanPlanner(time_budget_minutes=3, requests_per_minute=20.0)
+    profiles = [profile(f"p{index}", avg_requests_per_scan=30.0) for index in range(5)]
+    assert len(planner.plan(profiles, [], concurrency=1, now=NOW)[0]) == 2
+    assert len(planner.plan(profiles, [], concurrency=2, now=NOW)[0]) == 4
+
+def test_updated_stats_blend_new_observations():
+    target = profile("alice", last_scanned_at=NOW - timedelta(days=2), avg_posts_per_day=1.0, avg_requests_per_scan=20.0)
+    stats = ScanPlanner.updated_stats(target, new_posts=6, requests=30, run_started_at=NOW - timedelta(hours=1), now=NOW)
+    assert stats["last_new_posts"] == 6
+    assert stats["last_scan_run_started_at"] == NOW - timedelta(hours=1)
+    assert stats["avg_requests_per_scan"] == pytest.approx(0.3 * 30 + 0.7 * 20)
+    assert stats["avg_posts_per_day"] == pytest.approx(0.3 * 3 + 0.7 * 1)
+
+def test_updated_stats_of_a_first_scan():
+    stats = ScanPlanner.updated_stats(profile("alice"), new_posts=12, requests=25, now=NOW)
+    assert stats == {"last_new_posts": 12, "avg_requests_per_scan": 25.0}
@@ -0,0 +1,159 @@
+# /search_instagram/tests/test_storage_service.py
+from io import BytesIO
+import hashlib
+
+import pytest
+
+from local_storage_service import LocalStorageService
+from s3_storage_service import S3StorageService
+from storage_service import create_storage_service
+
+class FakeS3Error(Exception):
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+class FakeS3Client:
+    """
+    Subconjunto da API do cliente S3 do boto3 usado pelo S3StorageService,
+    com os objetos em memória. Dispensa o boto3, que é opcional.
+    """
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.aborted = []
+
+    def _object(self, Key: str):
+        if Key not in self.objects:
+            raise FakeS3Error('NoSuchKey')
+        return self.objects[Key]
+
+    def put_object(self, Bucket, Key, Body, IfMatch=None, IfNoneMatch=None, ContentType=None, Metadata=None):
+        current = self.objects.get(Key)
+        if IfNoneMatch == '*' and current is not None or IfMatch is not None and (current is None or current['ETag'] != IfMatch):
+            raise FakeS3Error('PreconditionFailed')
+        self.objects[Key] = {"Body": Body, "ETag": hashlib.md5(Body).hexdigest(), "Metadata": Metadata or {}}
+
+    def head_object(self, Bucket, Key):
+        stored = self._object(Key)
+        return {"ContentLength": len(stored['Body']), "Metadata": stored['Metadata']}
+
+    def get_object(self, Bucket, Key, Range=None):
+        stored = self._object(Key)
+        data = stored['Body']
+        if Range:
+            start, end = Range[len('bytes='):].split('-')
+            data = data[int(start):int(end) + 1 if end else None]
+        return {"Body": BytesIO(data), "ETag": stored['ETag']}
+
+    def get_paginator(self, operation):
+        client = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix, Delimiter):
+                keys = [key for key in client.objects if key.startswith(Prefix) and Delimiter not in key[len(Prefix):]]
+                yield {"Contents": [{"Key": key} for key in keys]}
+        return Paginator()
+
+    def create_multipart_upload(self, Bucket, Key, ContentType=None, Metadata=None):
+        upload_id = f"upload-{len(self.uploads)}"
+        self.uploads[upload_id] = {"parts": {}, "Metadata": Metadata or {}}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId]['parts'][PartNumber] = Body
+        return {"ETag": f"etag-{PartNumber}"}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        upload = self.uploads.pop(UploadId)
+        body = b"".join(upload['parts'][part['PartNumber']] for part in MultipartUpload['Parts'])
+        self.objects[Key] = {"Body": body, "ETag": hashlib.md5(body).hexdigest(), "Metadata": upload['Metadata']}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId)
+        self.aborted.append(Key)
+
+@pytest.fixture(params=["local", "s3"])
+def storage(request, tmp_path, monkeypatch):
+    # Partes de 1 MiB a partir de 2 MiB, para exercitar o envio em partes paralelas.
+    monkeypatch.setenv("STORAGE_PARALLEL_UPLOAD_THRESHOLD_MB", "2")
+    monkeypatch.setenv("STORAGE_PART_SIZE_MB", "1")
+    if request.param == "local":
+        return LocalStorageService(str(tmp_path))
+    service = S3StorageService(s3_client=FakeS3Client(), bucket_name="bucket")
+    service.part_size = 1024 * 1024
+    return service
+
+def test_upload_and_download_round_trip(storage):
+    assert storage.upload_bytes(b"conteudo", "exports/a.json", "application/json") == storage.uri("exports/a.json")
+    assert storage.download_bytes("exports/a.json") == b"conteudo"
+    assert storage.download_bytes("exports/missing.json") is None
+    assert storage.read_media_range("exports/a.json", 2, 5) == b"nte"
+    assert storage.read_media_range("exports/missing.json", 0, 1) is None
+
+def test_stream_upload_reports_size_hash_and_metadata(storage):
+    if isinstance(storage, S3StorageService):
+        pytest.importorskip("boto3")
+    data = b"x" * 1000
+    result = storage.upload_media_from_stream(BytesIO(data), "media/p/a.jpg", compute_hash=True, metadata={"source_url": "u"})
+    assert result == {"gcs_path": storage.uri("media/p/a.jpg"), "size_bytes": 1000, "sha256": hashlib.sha256(data).hexdigest()}
+    assert storage.get_media_info("media/p/a.jpg") == {"gcs_path": storage.uri("media/p/a.jpg"), "size_bytes": 1000, "metadata": {"source_url": "u"}}
+    assert storage.get_media_info("media/p/missing.jpg") is None
+
+def test_large_stream_is_uploaded_in_parallel_parts(storage):
+    data = bytes(range(256)) * (10 * 1024)
+    result = storage.upload_media_from_stream(BytesIO(data), "media/p/video.mp4", size=len(data), metadata={"k": "v"})
+    assert result['size_bytes'] == len(data)
+    assert storage.download_bytes("media/p/video.mp4") == data
+    assert storage.get_media_info("media/p/video.mp4")['metadata'] == {"k": "v"}
+
+def test_failed_part_upload_leaves_no_object(storage, monkeypatch):
+    def fail(*args):
+        raise IOError("falha na parte")
+    monkeypatch.setattr(storage, "_upload_part", fail)
+    data = b"y" * (3 * 1024 * 1024)
+    assert storage.upload_media_from_stream(BytesIO(data), "media/p/video.mp4", size=len(data)) is None
+    assert storage.download_bytes("media/p/video.mp4") is None
+    if isinstance(storage, S3StorageService):
+        assert storage.s3_client.aborted == ["media/p/video.mp4"]
+
+@pytest.mark.parametrize("count", [3, 10])
+def test_exists_many_with_single_checks_and_listing(storage, count):
+    names = [f"media/p/{index}.jpg" for index in range(count)]
+    for name in names[::2]:
+        storage.upload_bytes(b"1", name, "image/jpeg")
+    storage.upload_bytes(b"1", "media/p/nested/0.jpg", "image/jpeg")
+    assert storage.exists_many(names + ["media/q/0.jpg"]) == set(names[::2])
+
+def test_conditional_upload_detects_concurrent_writes(storage):
+    assert storage.download_bytes_versioned("indexes/posts.bloom") == (None, None)
+    assert storage.upload_bytes_if_version(b"v1", "indexes/posts.bloom", "application/octet-stream", None)
+    # Já existe: a gravação que esperava o objeto ausente é recusada.
+    assert not storage.upload_bytes_if_version(b"v1b", "indexes/posts.bloom", "application/octet-stream", None)
+    data, version = storage.download_bytes_versioned("indexes/posts.bloom")
+    assert data == b"v1"
+    assert storage.upload_bytes_if_version(b"v2", "indexes/posts.bloom", "application/octet-stream", version)
+    assert not storage.upload_bytes_if_version(b"v3", "indexes/posts.bloom", "application/octet-stream", version)
+    assert storage.download_bytes("indexes/posts.bloom") == b"v2"
+
+def test_download_media_to_a_file(storage, tmp_path):
+    storage.upload_bytes(b"midia", "media/p/a.jpg", "image/jpeg")
+    destination = tmp_path / "out.jpg"
+    assert storage.download_media("media/p/a.jpg", str(destination))
+    assert destination.read_bytes() == b"midia"
+    assert not storage.download_media("media/p/missing.jpg", str(tmp_path / "missing.jpg"))
+
+def test_local_storage_rejects_names_outside_the_root(tmp_path):
+    storage = LocalStorageService(str(tmp_path / "root"))
+    assert storage.upload_bytes(b"x", "../outside.txt", "text/plain") is None
+    assert not (tmp_path / "outside.txt").exists()
+
+def test_create_storage_service_uses_the_configured_backend(tmp_path, monkeypatch):
+    monkeypatch.setenv("STORAGE_BACKEND", "local")
+    monkeypatch.setenv("LOCAL_STORAGE_DIR", str(tmp_path))
+    storage = create_storage_service()
+    assert isinstance(storage, LocalStorageService)
+    assert storage.uri("a/b.json") == f"file://{tmp_path}/a/b.json"
+    monkeypatch.setenv("STORAGE_BACKEND", "ftp")
+    with pytest.raises(ValueError):
+        create_storage_service()
@@ -0,0 +1,164 @@
+# /search_instagram/tracing.py
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from logging_config import logging
+from typing import Any, Dict, List, Optional
+import functools
+import os
+import threading
+import time
+
+# Rastreamento opcional dos pontos quentes da coleta (requisições ao
+# Instagram, transferências de mídia, escritas no Firestore e pausas do
+# pacer), configurado por TRACING:
+#
+#   off    (padrão) span() não faz nada; o custo é o de um nullcontext.
+#   otel   spans do OpenTelemetry, exportados pelo provider configurado no
+#          ambiente (ex: opentelemetry-instrument com OTEL_* ou Cloud Trace).
+#   memory spans guardados em memória (InMemorySpanExporter), consultados em
+#          /debug/spans e usados nos benchmarks.
+_NOOP = nullcontext()
+_state: Dict[str, Any] = {"mode": "off", "tracer": None, "exporter": None}
+_current_span: ContextVar[Optional["FinishedSpan"]] = ContextVar("current_span", default=None)
+
+class FinishedSpan:
+    """
+    Span concluído, no formato guardado pelo InMemorySpanExporter.
+    """
+    __slots__ = ("name", "attributes", "parent", "thread", "start_ns", "duration_ns", "error")
+
+    def __init__(self, name: str, attributes: Dict[str, Any], parent: Optional[str], thread: str, start_ns: int):
+        self.name = name
+        self.attributes = attributes
+        self.parent = parent
+        self.thread = thread
+        self.start_ns = start_ns
+        self.duration_ns = 0
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "parent": self.parent,
+            "thread": self.thread,
+            "duration_ms": round(self.duration_ns / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+class InMemorySpanExporter:
+    """
+    Guarda os últimos 'max_spans' spans concluídos e agrega os tempos por
+    nome de span. Seguro para uso a partir de várias threads.
+    """
+    def __init__(self, max_spans: int = 10000):
+        self._spans: "deque[FinishedSpan]" = deque(maxlen=max_spans)
+        self._totals: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def export(self, span: FinishedSpan):
+        with self._lock:
+            self._spans.append(span)
+            totals = self._totals.setdefault(span.name, [0, 0.0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += span.duration_ns
+            totals[2] = max(totals[2], span.duration_ns)
+            totals[3] += 1 if span.error else 0
+
+    def spans(self, name: Optional[str] = None) -> List[FinishedSpan]:
+        with self._lock:
+            return [span for span in self._spans if name is None or span.name == name]
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Contagem, tempo total, médio e máximo (ms) e erros por nome de span,
+        desde a criação do exportador ou o último clear().
+        """
+        with self._lock:
+            return {
+                name: {
+                    "count": count,
+                    "total_ms": round(total_ns / 1e6, 3),
+                    "avg_ms": round(total_ns / count / 1e6, 3),
+                    "max_ms": round(max_ns / 1e6, 3),
+                    "errors": errors
+                }
+                for name, (count, total_ns, max_ns, errors) in sorted(self._totals.items(), key=lambda item: -item[1][1])
+            }
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+            self._totals.clear()
+
+def configure(mode: Optional[str] = None, exporter: Optional[InMemorySpanExporter] = None) -> Optional[InMemorySpanExporter]:
+    """
+    Ativa o rastreamento no modo informado (por padrão, TRACING).
+
+    Returns:
+        O exportador em memória, no modo 'memory'.
+    """
+    mode = (mode or os.getenv("TRACING", "off")).lower()
+    _state.update(mode="off", tracer=None, exporter=None)
+    if mode == "otel":
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            logging.error("TRACING=otel requer o pacote 'opentelemetry-api'. Rastreamento desativado.")
+            return None
+        _state.update(mode="otel", tracer=trace.get_tracer("search_instagram"))
+    elif mode == "memory":
+        exporter = exporter or InMemorySpanExporter(max_spans=int(os.getenv("TRACING_MAX_SPANS", "10000")))
+        _state.update(mode="memory", exporter=exporter)
+    elif mode != "off":
+        logging.error(f"TRACING inválido: '{mode}'. Use 'off', 'otel' ou 'memory'.")
+    return _state["exporter"]
+
+def get_exporter() -> Optional[InMemorySpanExporter]:
+    return _state["exporter"]
+
+def is_enabled() -> bool:
+    return _state["mode"] != "off"
+
+@contextmanager
+def _memory_span(exporter: InMemorySpanExporter, name: str, attributes: Dict[str, Any]):
+    parent = _current_span.get()
+    span = FinishedSpan(name, attributes, parent.name if parent else None, threading.current_thread().name, time.perf_counter_ns())
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.error = type(e).__name__
+        raise
+    finally:
+        span.duration_ns = time.perf_counter_ns() - span.start_ns
+        _current_span.reset(token)
+        exporter.export(span)
+
+def span(name: str, **attributes):
+    """
+    Context manager que registra um span em torno do bloco, no modo
+    configurado. Atributos com valor None são omitidos.
+    """
+    mode = _state["mode"]
+    if mode == "off":
+        return _NOOP
+    attributes = {key: value for key, value in attributes.items() if value is not None}
+    if mode == "otel":
+        return _state["tracer"].start_as_current_span(name, attributes=attributes)
+    return _memory_span(_state["exporter"], name, attributes)
+
+def traced(name: str, **attributes):
+    """
+    Decorador equivalente a envolver a função em span(name).
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, **attributes):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+configure()